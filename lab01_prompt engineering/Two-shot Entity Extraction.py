@@ -1,57 +1,48 @@
-import os
-from openai import AzureOpenAI
+from pathlib import Path
 from dotenv import load_dotenv
+from example_store import ExampleStore, build_example_messages
+import sys
+
+# 共用模組位於專案根目錄
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.aoai_client import chat_with_aoai_gpt
 
 # 載入 .env 檔案中的環境變數
 load_dotenv()
 
+PII_SYSTEM_PROMPT = "從給定的段落中提取個人身份資訊（PII）實體。"
+# 動態範例使用的範例庫
+PII_EXAMPLES_PATH = Path(__file__).resolve().parent / "pii_examples.jsonl"
+
 # Two-shot 實體提取
 # 二次提示實體提取
 def get_two_shot_entity_extraction(user_message):
+    return chat_with_aoai_gpt(build_two_shot_entity_messages(user_message))
+
+# 組合 Two-shot 實體提取的訊息列表（batch_runner.py 也會使用）
+def build_two_shot_entity_messages(user_message):
     messages = [
-        {"role": "system", "content": "從給定的段落中提取個人身份資訊（PII）實體。"},
+        {"role": "system", "content": PII_SYSTEM_PROMPT},
         {"role": "user", "content": "我從紐約的銀行通過手機提領了 $100。電話號碼 (345) 123-7867。問候，Raj"},
         {"role": "assistant", "content": "1. 金額: $100\\n2. 地點: 紐約\\n3. 電話號碼: (345) 123-7867\\n4. 姓名: Raj"},
         {"role": "user", "content": "感謝您聯繫我。我的信用卡在海外度假時被取消。我的信用卡號是 39482374859，帳戶名稱是 Phil Smith，地址是 34 Cityvale, Melbourne, 3000。我偏好的聯繫方式是電子郵件：phil.smith@email.com。"},
         {"role": "assistant", "content": "1. 信用卡號: 39482374859\\n2. 姓名: Phil Smith\\n3. 地點: 34 Cityvale, Melbourne, 3000\\n4. 電子郵件地址: phil.smith@email.com"},
         {"role": "user", "content": user_message}
     ]
-    return chat_with_aoai_gpt(messages)
-
-def chat_with_aoai_gpt(messages):
-    error_time = 0
-    temperature=0.7
-    while error_time <= 2:
-        error_time += 1
-        try:
-            aoai_key = os.getenv("AOAI_KEY")
-            aoai_url = os.getenv("AOAI_URL")
-            aoai_model_version = os.getenv("AOAI_MODEL_VERSION")
-
-            client = AzureOpenAI(
-                api_key=aoai_key,
-                azure_endpoint=aoai_url,
-            )
-            response = client.chat.completions.create(
-                model=aoai_model_version,
-                # 設置聊天訊息，包含系統角色和使用者輸入
-                messages=messages,
-                temperature=temperature,
-            )
-
-            assistant_message = response.choices[0].message.content
-
-            return (
-                assistant_message,
-                response.usage.prompt_tokens,
-                response.usage.total_tokens - response.usage.prompt_tokens,
-            )
-        except Exception as e:      
-            print(f"錯誤：{str(e)}")
-            return "", 0, 0
+    return messages
+
+# 動態 Two-shot 實體提取：從範例庫挑出與輸入最相似的 2 個範例取代固定範例
+def get_dynamic_two_shot_entity_extraction(user_message, example_store, token_budget=400):
+    examples = example_store.select(user_message, k=2, token_budget=token_budget)
+    return chat_with_aoai_gpt(build_example_messages(PII_SYSTEM_PROMPT, examples, user_message))
 
 if __name__ == "__main__":
     # 測試二次提示實體提取
     test_input = "嗨，我是 Ravi Dube。我在 2023 年 3 月 30 日的信用卡對帳單上注意到一筆 $1,000 的費用。該交易是在紐約的一家餐廳進行的。請通過 (123)456-7890 或 ravi.dube@email.com 聯繫我。"
     response = get_two_shot_entity_extraction(test_input)
-    print(f"提取的實體:\\n{response[0]}\\n")
\ No newline at end of file
+    print(f"提取的實體:\\n{response[0]}\\n")
+
+    # 動態範例：範例 embedding 會快取到磁碟，之後執行不需重新計算
+    pii_store = ExampleStore.from_jsonl(PII_EXAMPLES_PATH)
+    response = get_dynamic_two_shot_entity_extraction(test_input, pii_store)
+    print(f"提取的實體（動態範例）:\n{response[0]}\n")
\ No newline at end of file
@@ -1,10 +1,135 @@
-import os
-from openai import AzureOpenAI
+import json
 from dotenv import load_dotenv
+import sys
+from pathlib import Path
+
+# 共用模組位於專案根目錄
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.aoai_client import chat_with_aoai_gpt
 
 # 載入 .env 檔案中的環境變數
 load_dotenv()
 
+# 主詞擷取的系統提示（單句）
+SUBJECT_PROMPT = """請找出使用者提供的句子中的主詞，只回傳主詞本身，不要加上任何說明。"""
+
+# 主詞擷取的系統提示（多句打包）：輸入與輸出都以編號對應，並回傳原句供程式檢查是否對齊
+PACKED_SUBJECT_PROMPT = """請找出每一個編號句子中的主詞。
+請用 JSON 格式回傳，每個句子一筆，編號與輸入相同，並原樣附上該句子：
+{
+  "results": [
+    {"id": 1, "sentence": "第 1 句原文", "subject": "主詞"},
+    {"id": 2, "sentence": "第 2 句原文", "subject": "主詞"}
+  ]
+}"""
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文字的 token 數（中文約 1 字 1 token）"""
+    return len(text)
+
+def pack_items(items: list[str], token_budget: int = 1500, max_items: int = 20) -> list[list[int]]:
+    """依 token 預算將多筆輸入分組，每組以一個請求送出
+    
+    Args:
+        items (list[str]): 輸入列表
+        token_budget (int): 每個請求中輸入內容的 token 上限
+        max_items (int): 每個請求最多包含的筆數（筆數越多，模型越容易漏掉或對錯編號）
+        
+    Returns:
+        list[list[int]]: 每組包含的輸入索引
+    """
+    batches, current, current_tokens = [], [], 0
+    for index, item in enumerate(items):
+        item_tokens = estimate_tokens(item) + 10  # 另加編號與 JSON 輸出的額外成本
+        if current and (current_tokens + item_tokens > token_budget or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += item_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def extract_subject(sentence: str) -> tuple[str, int, int]:
+    """單獨擷取一個句子的主詞（打包結果驗證失敗時使用）
+    
+    Args:
+        sentence (str): 句子
+        
+    Returns:
+        tuple[str, int, int]: (主詞, 提示詞token數, 回應token數)
+    """
+    messages = [
+        {"role": "system", "content": SUBJECT_PROMPT},
+        {"role": "user", "content": sentence},
+    ]
+    subject, prompt_tokens, completion_tokens = chat_with_aoai_gpt(messages)
+    return subject.strip(), prompt_tokens, completion_tokens
+
+def extract_subjects_packed(sentences: list[str], token_budget: int = 1500, max_items: int = 20) -> list[dict]:
+    """打包模式：把多個句子編號後放進同一個 JSON 請求，系統提示只需支付一次
+    
+    每筆回應都會檢查編號是否存在、是否重複、原句是否與輸入一致以及主詞是否為空；
+    缺漏或對不上的句子再個別送出請求重試。
+    
+    Args:
+        sentences (list[str]): 要擷取主詞的句子列表
+        token_budget (int): 每個請求中句子內容的 token 上限
+        max_items (int): 每個請求最多包含的句子數
+        
+    Returns:
+        list[dict]: 與輸入順序對應的結果 {"sentence", "subject"}，失敗時 subject 為空字串
+    """
+    subjects = [None] * len(sentences)
+    total_prompt_tokens, total_completion_tokens, request_count = 0, 0, 0
+
+    for batch in pack_items(sentences, token_budget, max_items):
+        numbered = "\n".join(f"{n}. {sentences[index]}" for n, index in enumerate(batch, start=1))
+        messages = [
+            {"role": "system", "content": PACKED_SUBJECT_PROMPT},
+            {"role": "user", "content": numbered},
+        ]
+        response, prompt_tokens, completion_tokens = chat_with_aoai_gpt(messages, user_json_format=True)
+        total_prompt_tokens += prompt_tokens
+        total_completion_tokens += completion_tokens
+        request_count += 1
+
+        try:
+            results = json.loads(response).get("results", []) if response else []
+        except json.JSONDecodeError as e:
+            print(f"JSON 解析錯誤：{str(e)}")
+            results = []
+
+        seen_ids = set()
+        for result in results:
+            try:
+                number = int(result["id"])
+                subject = str(result["subject"]).strip()
+                echoed = str(result.get("sentence", "")).strip()
+            except (KeyError, ValueError, TypeError):
+                continue
+            if not 1 <= number <= len(batch) or number in seen_ids or not subject:
+                continue
+            index = batch[number - 1]
+            # 模型回傳的原句與輸入不同，代表編號可能錯位，這筆不採用
+            if echoed and echoed != sentences[index].strip():
+                continue
+            seen_ids.add(number)
+            subjects[index] = subject
+
+    # 驗證失敗或缺漏的句子個別重試
+    retry_indexes = [index for index, subject in enumerate(subjects) if subject is None]
+    for index in retry_indexes:
+        subject, prompt_tokens, completion_tokens = extract_subject(sentences[index])
+        total_prompt_tokens += prompt_tokens
+        total_completion_tokens += completion_tokens
+        request_count += 1
+        subjects[index] = subject
+
+    print(f"打包擷取 {len(sentences)} 句，共 {request_count} 次請求（個別重試 {len(retry_indexes)} 句），"
+          f"提示token數: {total_prompt_tokens}, 回答使用token數: {total_completion_tokens}")
+    return [{"sentence": sentence, "subject": subject or ""} for sentence, subject in zip(sentences, subjects)]
+
 def get_response(user_message: str) -> tuple[str, int, int]:
     """取得AOAI的回答
     
@@ -14,57 +139,24 @@ def get_response(user_message: str) -> tuple[str, int, int]:
     Returns:
         tuple[str, int, int]: (情感分析結果, 提示詞token數, 回應token數)
     """
+    return chat_with_aoai_gpt(build_messages(user_message)) # 呼叫AOAI服務取得回應
+
+def build_messages(user_message: str) -> list[dict]:
+    """組合送給AOAI的訊息列表（batch_runner.py 也會使用）
+    
+    Args:
+        user_message (str): 使用者輸入
+        
+    Returns:
+        list[dict]: 包含系統提示與使用者輸入的訊息列表
+    """
     # 用於儲存聊天對話的list
     messages = []
     # 這次對話中，請LLM扮演一個樂於助人的助理
     messages.append({"role": "system", "content": "您是一個樂於助人的助理。"})
     # 使用者輸入
     messages.append({"role": "user", "content": user_message})
-    return chat_with_aoai_gpt(messages) # 呼叫AOAI服務取得回應
-
-def chat_with_aoai_gpt(messages: list[dict]) -> tuple[str, int, int]:
-    """呼叫AOAI服務取得回應
-        
-    Args:
-        messages (list[dict]): 包含對話歷史的訊息列表
-        
-    Returns:
-        tuple[str, int, int]: (AI回應, 提示詞token數, 回應token數)
-    """
-    error_time = 0 # 錯誤次數
-    temperature=0.7 # 溫度
-    while error_time <= 2: # 如果錯誤次數小於2次，則繼續嘗試
-        error_time += 1
-        try:
-            aoai_key = os.getenv("AOAI_KEY")                        # 取得AOAI金鑰
-            aoai_url = os.getenv("AOAI_URL")                        # 取得AOAI URL
-            aoai_model_version = os.getenv("AOAI_MODEL_VERSION")    # 取得AOAI模型版本
-
-            # 初始化 API 客戶端
-            client = AzureOpenAI(
-                api_key=aoai_key,           # 設置AOAI金鑰
-                azure_endpoint=aoai_url,    # 設置AOAI URL
-            )
-
-            # 發送請求給 API
-            response = client.chat.completions.create(
-                model=aoai_model_version,
-                messages=messages,          # 設置聊天訊息，包含系統角色和使用者輸入
-                temperature=temperature,    # 設置溫度
-            )
-            
-            # 透過AOAI SDK取得AOAI的回答
-            assistant_message = response.choices[0].message.content
-
-            # 回傳Tuple物件(AOAI的回答、提示token數、回答token數)
-            return (
-                assistant_message,
-                response.usage.prompt_tokens,
-                response.usage.total_tokens - response.usage.prompt_tokens,
-            )
-        except Exception as e: # 如果發生錯誤，則回傳空字串、0、0
-            print(f"錯誤：{str(e)}")
-            return "", 0, 0
+    return messages
 
 if __name__ == "__main__":
     # 呼叫AOAI服務取得回應
@@ -109,3 +201,7 @@ if __name__ == "__main__":
     "那部電影的特效讓觀眾印象深刻。"
 ]
 
+    # 打包模式：十個句子只需一次請求，系統提示只支付一次
+    for result in extract_subjects_packed(test_sentences):
+        print(f"{result['sentence']} → 主詞: {result['subject']}")
+
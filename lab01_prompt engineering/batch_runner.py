@@ -0,0 +1,283 @@
+"""
+大量資料批次標註工具 (Batch Runner)
+
+lab01 的各個腳本一次只處理一筆寫死的輸入，無法用來做大量標註。
+這個工具可以從 JSONL 或 CSV 讀取上千筆資料，套用指定的 prompt 樣板送給 AOAI：
+
+1. 以 asyncio 控制同時進行的請求數量，並以每分鐘請求數限制送出速度
+2. 遇到 429（超過速率限制）或暫時性錯誤時，依 Retry-After 或指數退避重試
+3. 每完成一筆就寫入輸出的 JSONL，中斷後重新執行會自動跳過已完成的資料
+4. 定期回報進度、吞吐量與 token 使用量
+
+使用方式：
+    python batch_runner.py --template few-shot --input tweets.csv --text-field text --output results.jsonl
+"""
+
+import os
+import csv
+import json
+import time
+import asyncio
+import argparse
+import importlib.util
+from pathlib import Path
+from typing import Callable, Iterator
+
+import openai
+from openai import AsyncAzureOpenAI
+from dotenv import load_dotenv
+
+# 載入 .env 檔案中的環境變數
+load_dotenv()
+
+LAB_DIR = Path(__file__).resolve().parent
+
+# 可使用的 prompt 樣板：名稱 → (腳本檔名, 組合訊息的函數名稱)
+TEMPLATES = {
+    "basic": ("basic.py", "build_messages"),
+    "zero-shot": ("Zero-shot Classification.py", "build_classification_messages"),
+    "few-shot": ("few_shot.py", "build_few_shot_messages"),
+    "one-shot-entity": ("One-shot Entity Extraction.py", "build_one_shot_entity_messages"),
+    "two-shot-entity": ("Two-shot Entity Extraction.py", "build_two_shot_entity_messages"),
+}
+
+
+def load_template(name: str) -> Callable[[str], list[dict]]:
+    """從 lab01 的腳本載入組合訊息的函數（腳本檔名含空白，因此以檔案路徑載入）
+
+    Args:
+        name (str): 樣板名稱，見 TEMPLATES
+
+    Returns:
+        Callable[[str], list[dict]]: 輸入文字、回傳訊息列表的函數
+    """
+    filename, function_name = TEMPLATES[name]
+    spec = importlib.util.spec_from_file_location(f"lab01_{name.replace('-', '_')}", LAB_DIR / filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, function_name)
+
+
+def read_inputs(path: Path, text_field: str, id_field: str | None = None) -> Iterator[tuple[str, str]]:
+    """逐筆讀取 JSONL 或 CSV 輸入檔
+
+    Args:
+        path (Path): 輸入檔路徑（.jsonl 或 .csv）
+        text_field (str): 要送去標註的文字欄位
+        id_field (str | None): 作為 id 的欄位，未指定時使用資料的順序編號
+
+    Returns:
+        Iterator[tuple[str, str]]: (id, 文字) 的序列
+    """
+    with open(path, "r", encoding="utf-8-sig", newline="") as file:
+        if path.suffix.lower() == ".csv":
+            rows = csv.DictReader(file)
+        else:
+            rows = (json.loads(line) for line in file if line.strip())
+        for index, row in enumerate(rows):
+            row_id = str(row[id_field]) if id_field else str(index)
+            yield row_id, str(row[text_field])
+
+
+def load_completed_ids(output_path: Path) -> set[str]:
+    """讀取輸出檔中已成功完成的 id，作為續跑的檢查點"""
+    completed = set()
+    if not output_path.exists():
+        return completed
+    with open(output_path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # 上次中斷時可能留下不完整的最後一行
+            if "output" in record:
+                completed.add(record["id"])
+    return completed
+
+
+class RateLimiter:
+    """限制每分鐘送出的請求數：每個請求之間至少間隔 60 / requests_per_minute 秒"""
+
+    def __init__(self, requests_per_minute: float):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute > 0 else 0.0
+        self._next_time = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.interval == 0:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class BatchStats:
+    """統計完成數量、token 使用量與吞吐量"""
+
+    def __init__(self, total: int, skipped: int):
+        self.total = total
+        self.skipped = skipped
+        self.succeeded = 0
+        self.failed = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.retries = 0
+        self.start_time = time.monotonic()
+
+    def report(self) -> str:
+        elapsed = time.monotonic() - self.start_time
+        done = self.succeeded + self.failed
+        throughput = done / elapsed if elapsed > 0 else 0.0
+        return (f"進度 {done + self.skipped}/{self.total}（本次成功 {self.succeeded}、失敗 {self.failed}、"
+                f"略過 {self.skipped}）| {throughput:.2f} 筆/秒 | "
+                f"token 輸入 {self.prompt_tokens:,}、輸出 {self.completion_tokens:,} | 重試 {self.retries} 次")
+
+
+async def run_batch(
+    template: str,
+    input_path: Path,
+    output_path: Path,
+    text_field: str = "text",
+    id_field: str | None = None,
+    concurrency: int = 8,
+    requests_per_minute: float = 300,
+    max_retries: int = 5,
+    temperature: float = 0.7,
+    report_every: int = 50,
+) -> BatchStats:
+    """以有限的並行數與速率批次處理輸入檔，結果逐筆寫入輸出的 JSONL
+
+    Args:
+        template (str): prompt 樣板名稱
+        input_path (Path): 輸入檔（.jsonl 或 .csv）
+        output_path (Path): 輸出的 JSONL 檔，已存在時會接續處理
+        text_field (str): 要送去標註的文字欄位
+        id_field (str | None): 作為 id 的欄位
+        concurrency (int): 同時進行的請求數量上限
+        requests_per_minute (float): 每分鐘請求數上限（0 表示不限制）
+        max_retries (int): 每筆資料的重試次數
+        temperature (float): 模型溫度
+        report_every (int): 每完成幾筆回報一次進度
+
+    Returns:
+        BatchStats: 統計結果
+    """
+    build_messages = load_template(template)
+    completed = load_completed_ids(output_path)
+    pending = [(row_id, text) for row_id, text in read_inputs(input_path, text_field, id_field)
+               if row_id not in completed]
+    stats = BatchStats(total=len(pending) + len(completed), skipped=len(completed))
+    print(f"共 {stats.total} 筆，已完成 {len(completed)} 筆，本次處理 {len(pending)} 筆")
+
+    model = os.getenv("AOAI_MODEL_VERSION")
+    # 所有請求共用同一個客戶端（共用連線池）；重試由本工具自行控制
+    client = AsyncAzureOpenAI(
+        api_key=os.getenv("AOAI_KEY"),
+        azure_endpoint=os.getenv("AOAI_URL"),
+        max_retries=0,
+    )
+    rate_limiter = RateLimiter(requests_per_minute)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def classify(text: str) -> tuple[str, int, int]:
+        """送出一筆請求，遇到速率限制或暫時性錯誤時退避重試"""
+        for attempt in range(max_retries + 1):
+            await rate_limiter.acquire()
+            try:
+                response = await client.chat.completions.create(
+                    model=model,
+                    messages=build_messages(text),
+                    temperature=temperature,
+                )
+                return (
+                    response.choices[0].message.content,
+                    response.usage.prompt_tokens,
+                    response.usage.completion_tokens,
+                )
+            except (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError,
+                    openai.InternalServerError) as e:
+                if attempt == max_retries:
+                    raise
+                stats.retries += 1
+                delay = 2 ** attempt
+                # 429 回應會告知需要等待的秒數
+                retry_after = getattr(getattr(e, "response", None), "headers", {}).get("retry-after")
+                if retry_after:
+                    try:
+                        delay = max(delay, float(retry_after))
+                    except ValueError:
+                        pass
+                await asyncio.sleep(delay)
+
+    with open(output_path, "a", encoding="utf-8") as output_file:
+
+        def write_record(record: dict) -> None:
+            # 每筆完成就寫入並 flush，中斷時最多只損失進行中的請求
+            output_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output_file.flush()
+
+        async def worker() -> None:
+            while True:
+                row_id, text = await queue.get()
+                try:
+                    output, prompt_tokens, completion_tokens = await classify(text)
+                    write_record({"id": row_id, "input": text, "output": output,
+                                  "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens})
+                    stats.succeeded += 1
+                    stats.prompt_tokens += prompt_tokens
+                    stats.completion_tokens += completion_tokens
+                except Exception as e:
+                    # 失敗的資料也記錄下來，下次執行時會重新處理
+                    write_record({"id": row_id, "input": text, "error": str(e)})
+                    stats.failed += 1
+                finally:
+                    queue.task_done()
+                    if (stats.succeeded + stats.failed) % report_every == 0:
+                        print(stats.report())
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        try:
+            for item in pending:
+                await queue.put(item)
+            await queue.join()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            await client.close()
+
+    print(f"完成！{stats.report()}")
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="以 lab01 的 prompt 樣板批次標註 JSONL / CSV 資料")
+    parser.add_argument("--template", required=True, choices=sorted(TEMPLATES), help="使用的 prompt 樣板")
+    parser.add_argument("--input", required=True, type=Path, help="輸入檔（.jsonl 或 .csv）")
+    parser.add_argument("--output", required=True, type=Path, help="輸出的 JSONL 檔（已存在時接續處理）")
+    parser.add_argument("--text-field", default="text", help="要標註的文字欄位（預設 text）")
+    parser.add_argument("--id-field", default=None, help="作為 id 的欄位（預設使用資料順序）")
+    parser.add_argument("--concurrency", type=int, default=8, help="同時進行的請求數量（預設 8）")
+    parser.add_argument("--rpm", type=float, default=300, help="每分鐘請求數上限，0 表示不限制（預設 300）")
+    parser.add_argument("--max-retries", type=int, default=5, help="每筆資料的重試次數（預設 5）")
+    parser.add_argument("--temperature", type=float, default=0.7, help="模型溫度（預設 0.7）")
+    args = parser.parse_args()
+
+    asyncio.run(run_batch(
+        template=args.template,
+        input_path=args.input,
+        output_path=args.output,
+        text_field=args.text_field,
+        id_field=args.id_field,
+        concurrency=args.concurrency,
+        requests_per_minute=args.rpm,
+        max_retries=args.max_retries,
+        temperature=args.temperature,
+    ))
+
+
+if __name__ == "__main__":
+    main()
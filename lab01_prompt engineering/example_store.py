@@ -0,0 +1,193 @@
+"""
+動態 Few-shot 範例選擇 (Example Store)
+
+few_shot.py 與實體提取腳本原本每次都送出同樣幾個手寫範例，不論輸入是什麼。
+這個模組改成從範例庫中，為每一筆輸入挑出最相似的 k 個範例：
+
+1. 範例庫以 JSONL 保存（每行 {"input": ..., "output": ...}）
+2. 範例的 embedding 預先計算並快取到磁碟，內容沒變就不再重新計算
+3. 以正規化矩陣做一次矩陣乘法找出最相似的範例（argpartition 取前 k 名）
+4. 在 token 預算內依相似度由高到低加入範例，提示詞更短、更貼近輸入
+
+需要的環境變數：EMBEDDING_API_KEY、EMBEDDING_URL、EMBEDDING_MODEL
+"""
+
+import os
+import json
+import hashlib
+from pathlib import Path
+
+import numpy as np
+from openai import AzureOpenAI
+from dotenv import load_dotenv
+
+# 載入 .env 檔案中的環境變數
+load_dotenv()
+
+# tiktoken 為選用套件，未安裝時改用字元數估算
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent.parent / ".cache" / "examples"
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文字的 token 數（未安裝 tiktoken 時以字元數估算，中文約 1 字 1 token）"""
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text)
+
+
+def embed_texts(texts: list[str]) -> np.ndarray:
+    """以一次批次請求取得多段文字的 embedding
+
+    Args:
+        texts (list[str]): 要進行 embedding 的文字列表
+
+    Returns:
+        np.ndarray: 形狀為 (文字數, 維度) 的 float32 矩陣
+    """
+    client = AzureOpenAI(
+        api_key=os.getenv("EMBEDDING_API_KEY"),
+        azure_endpoint=os.getenv("EMBEDDING_URL"),
+    )
+    response = client.embeddings.create(input=texts, model=os.getenv("EMBEDDING_MODEL"))
+    # API 回傳的順序以 index 欄位為準
+    ordered = sorted(response.data, key=lambda item: item.index)
+    return np.array([item.embedding for item in ordered], dtype=np.float32)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+class ExampleStore:
+    """保存 Few-shot 範例與其 embedding，為每筆輸入挑選最相似的範例"""
+
+    def __init__(self, examples: list[dict], name: str, cache_dir: str | Path = DEFAULT_CACHE_DIR):
+        """初始化範例庫
+
+        Args:
+            examples (list[dict]): 範例列表，每個範例包含 input 與 output
+            name (str): 範例庫名稱，作為快取檔名
+            cache_dir (str | Path): embedding 快取目錄，預設為專案根目錄的 .cache/examples
+        """
+        self.examples = examples
+        self.cache_path = Path(cache_dir) / f"{name}.npz"
+        self.example_tokens = np.array(
+            [estimate_tokens(example["input"]) + estimate_tokens(example["output"]) for example in examples]
+        )
+        self.vectors = self._load_vectors()
+
+    @classmethod
+    def from_jsonl(cls, path: str | Path, cache_dir: str | Path = DEFAULT_CACHE_DIR) -> "ExampleStore":
+        """從 JSONL 檔案載入範例庫，以檔名作為快取名稱"""
+        path = Path(path)
+        with open(path, "r", encoding="utf-8") as file:
+            examples = [json.loads(line) for line in file if line.strip()]
+        return cls(examples, name=path.stem, cache_dir=cache_dir)
+
+    def _load_vectors(self) -> np.ndarray | None:
+        """讀取快取的範例 embedding，只為新增或修改過的範例重新計算"""
+        model = os.getenv("EMBEDDING_MODEL", "")
+        hashes = [hashlib.sha1(f"{model}\n{example['input']}".encode("utf-8")).hexdigest()
+                  for example in self.examples]
+
+        cached = {}
+        if self.cache_path.exists():
+            data = np.load(self.cache_path)
+            cached = dict(zip(data["hashes"].tolist(), data["vectors"]))
+
+        missing = [i for i, content_hash in enumerate(hashes) if content_hash not in cached]
+        if missing:
+            try:
+                new_vectors = embed_texts([self.examples[i]["input"] for i in missing])
+            except Exception as e:
+                print(f"範例 embedding 失敗，改用固定範例 | err_msg={e}")
+                return None
+            cached.update(zip((hashes[i] for i in missing), new_vectors))
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            np.savez(self.cache_path, hashes=np.array(hashes),
+                     vectors=np.stack([cached[content_hash] for content_hash in hashes]))
+            print(f"已計算 {len(missing)} 個範例的 embedding 並寫入快取")
+
+        return _normalize(np.stack([cached[content_hash] for content_hash in hashes]).astype(np.float32))
+
+    def _pick(self, order: np.ndarray, k: int, token_budget: int | None) -> list[dict]:
+        """依相似度順序在 token 預算內挑選範例，回傳時最相似的放在最後（最接近使用者輸入）"""
+        chosen, used_tokens = [], 0
+        for i in order:
+            if len(chosen) == k:
+                break
+            if token_budget is not None and used_tokens + self.example_tokens[i] > token_budget:
+                continue
+            chosen.append(self.examples[i])
+            used_tokens += self.example_tokens[i]
+        return chosen[::-1]
+
+    def select_batch(self, queries: list[str], k: int = 3, token_budget: int | None = None) -> list[list[dict]]:
+        """為多筆輸入挑選範例：一次 embedding 請求、一次矩陣乘法
+
+        Args:
+            queries (list[str]): 使用者輸入列表
+            k (int): 每筆輸入最多挑選的範例數
+            token_budget (int | None): 每筆輸入的範例 token 上限
+
+        Returns:
+            list[list[dict]]: 每筆輸入對應的範例列表
+        """
+        k = min(k, len(self.examples))
+        if self.vectors is None or k == 0:
+            return [self.examples[:k] for _ in queries]
+        try:
+            query_vectors = _normalize(embed_texts(queries))
+        except Exception as e:
+            print(f"輸入 embedding 失敗，改用固定範例 | err_msg={e}")
+            return [self.examples[:k] for _ in queries]
+
+        similarities = query_vectors @ self.vectors.T
+        if token_budget is None and k < len(self.examples):
+            # 只需要前 k 名：argpartition 找出候選後，只排序這 k 個
+            top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        else:
+            # 有 token 預算時要依序檢查所有範例，讓超出預算的長範例可以被略過
+            top = np.broadcast_to(np.arange(len(self.examples)), similarities.shape)
+        order = np.argsort(-np.take_along_axis(similarities, top, axis=1), axis=1)
+        ranked = np.take_along_axis(top, order, axis=1)
+        return [self._pick(row, k, token_budget) for row in ranked]
+
+    def select(self, query: str, k: int = 3, token_budget: int | None = None) -> list[dict]:
+        """為單筆輸入挑選最相似的 k 個範例
+
+        Args:
+            query (str): 使用者輸入
+            k (int): 最多挑選的範例數
+            token_budget (int | None): 範例的 token 上限
+
+        Returns:
+            list[dict]: 範例列表（最相似的放在最後）
+        """
+        return self.select_batch([query], k, token_budget)[0]
+
+
+def build_example_messages(system_prompt: str, examples: list[dict], user_message: str) -> list[dict]:
+    """將挑選出的範例組合成 user / assistant 對話形式的訊息列表
+
+    Args:
+        system_prompt (str): 系統提示
+        examples (list[dict]): 範例列表
+        user_message (str): 使用者輸入
+
+    Returns:
+        list[dict]: 訊息列表
+    """
+    messages = [{"role": "system", "content": system_prompt}]
+    for example in examples:
+        messages.append({"role": "user", "content": example["input"]})
+        messages.append({"role": "assistant", "content": example["output"]})
+    messages.append({"role": "user", "content": user_message})
+    return messages
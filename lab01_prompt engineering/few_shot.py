@@ -1,10 +1,23 @@
-import os
-from openai import AzureOpenAI
+from pathlib import Path
 from dotenv import load_dotenv
+from example_store import ExampleStore, build_example_messages
+import sys
+
+# 共用模組位於專案根目錄
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.aoai_client import chat_with_aoai_gpt
 
 # 載入 .env 檔案中的環境變數
 load_dotenv()
 
+# 情感分析的系統提示
+SENTIMENT_SYSTEM_PROMPT = """twitter 是一個社交媒體平台，用戶可以發佈推文。 推文可以是積極的或消極的，我
+們希望能夠將推文分類成積極或消極。 以下是一些積極和消極推文的例子。 請確保
+正確分類最後一個推文是積極的還是消極的"""
+
+# 動態 Few-shot 使用的範例庫
+SENTIMENT_EXAMPLES_PATH = Path(__file__).resolve().parent / "sentiment_examples.jsonl"
+
 def get_few_shot_response(user_message: str) -> tuple[str, int, int]:
     """使用 Few-Shot Learning 方式進行情感分析
     
@@ -16,16 +29,23 @@ def get_few_shot_response(user_message: str) -> tuple[str, int, int]:
     Returns:
         tuple[str, int, int]: (情感分析結果, 提示詞token數, 回應token數)
     """
+    # 呼叫 API 進行分析
+    return chat_with_aoai_gpt(build_few_shot_messages(user_message))
+
+def build_few_shot_messages(user_message: str) -> list[dict]:
+    """組合 Few-Shot 情感分析的訊息列表（batch_runner.py 也會使用）
+    
+    Args:
+        user_message (str): 要進行情感分析的文字
+        
+    Returns:
+        list[dict]: 包含系統提示、範例與使用者輸入的訊息列表
+    """
     # 初始化對話紀錄列表
     messages = []
     
     # 設定系統提示詞，說明任務目標和背景
-    messages.append({
-        "role": "system", 
-        "content": """twitter 是一個社交媒體平台，用戶可以發佈推文。 推文可以是積極的或消極的，我
-們希望能夠將推文分類成積極或消極。 以下是一些積極和消極推文的例子。 請確保
-正確分類最後一個推文是積極的還是消極的"""
-    })
+    messages.append({"role": "system", "content": SENTIMENT_SYSTEM_PROMPT})
     
     # Few-Shot 示例 1：積極範例
     messages.append({"role": "user", "content": "今天真是開心的一天"})
@@ -41,57 +61,23 @@ def get_few_shot_response(user_message: str) -> tuple[str, int, int]:
     
     # 添加使用者要分析的文字
     messages.append({"role": "user", "content": user_message})
-    
-    # 呼叫 API 進行分析
-    return chat_with_aoai_gpt(messages)
+    return messages
 
-def chat_with_aoai_gpt(messages: list[dict]) -> tuple[str, int, int]:
-    """與 Azure OpenAI API 進行通訊
+def get_dynamic_few_shot_response(user_message: str, example_store: ExampleStore, k: int = 3,
+                                  token_budget: int = 200) -> tuple[str, int, int]:
+    """使用動態 Few-Shot 進行情感分析：從範例庫挑出與輸入最相似的範例
     
     Args:
-        messages (list[dict]): 包含對話歷史的訊息列表
+        user_message (str): 要進行情感分析的文字
+        example_store (ExampleStore): 範例庫
+        k (int): 最多使用的範例數
+        token_budget (int): 範例的 token 上限
         
     Returns:
-        tuple[str, int, int]: (AI回應, 提示詞token數, 回應token數)
+        tuple[str, int, int]: (情感分析結果, 提示詞token數, 回應token數)
     """
-    error_time = 0  # 錯誤計數器
-    temperature = 0.7  # 控制回應的隨機性，0為最確定，1為最隨機
-    
-    # 最多重試 2 次
-    while error_time <= 2:
-        error_time += 1
-        try:
-            aoai_key = os.getenv("AOAI_KEY")                        # 取得AOAI金鑰
-            aoai_url = os.getenv("AOAI_URL")                        # 取得AOAI URL
-            aoai_model_version = os.getenv("AOAI_MODEL_VERSION")    # 取得AOAI模型版本
-            
-            # 初始化 API 客戶端
-            client = AzureOpenAI(
-                api_key=aoai_key,           # 設置AOAI金鑰
-                azure_endpoint=aoai_url,    # 設置AOAI URL
-            )
-            
-            # 發送請求給 API
-            response = client.chat.completions.create(
-                model=aoai_model_version,
-                messages=messages,          # 設置聊天訊息，包含系統角色和使用者輸入
-                temperature=temperature,    # 設置溫度
-            )
-            
-            # 透過AOAI SDK取得AOAI的回答
-            assistant_message = response.choices[0].message.content
-            
-            # 回傳Tuple物件(AOAI的回答、提示token數、回答token數)
-            return (
-                assistant_message,
-                response.usage.prompt_tokens,
-                response.usage.total_tokens - response.usage.prompt_tokens,
-            )
-            
-        except Exception as e:
-            # 發生錯誤時輸出錯誤訊息
-            print(f"錯誤：{str(e)}")
-            return "", 0, 0
+    examples = example_store.select(user_message, k=k, token_budget=token_budget)
+    return chat_with_aoai_gpt(build_example_messages(SENTIMENT_SYSTEM_PROMPT, examples, user_message))
 
 if __name__ == "__main__":
     # 測試範例：分析一句正面的句子
@@ -99,6 +85,12 @@ if __name__ == "__main__":
     if assistant_response:
         print(f"推文語意判斷: {assistant_response[0]}\n")
 
+    # 動態 Few-shot：從範例庫中挑出與輸入最相似的範例（範例 embedding 會快取到磁碟）
+    sentiment_store = ExampleStore.from_jsonl(SENTIMENT_EXAMPLES_PATH)
+    assistant_response = get_dynamic_few_shot_response("捷運今天準時到站，心情很好", sentiment_store)
+    if assistant_response:
+        print(f"推文語意判斷（動態範例）: {assistant_response[0]}, 提示token數: {assistant_response[1]}\n")
+
     # 下為練習，請透過改寫prompt，從句子中擷取出主詞
     # - 設計一個分類新聞類型的系統（政治/體育/科技/娛樂）
     # - 提供適當的示例讓模型學習分類規則
@@ -1,7 +1,11 @@
-import os
 import json
-from openai import AzureOpenAI
 from dotenv import load_dotenv
+import sys
+from pathlib import Path
+
+# 共用模組位於專案根目錄
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.aoai_client import chat_with_aoai_gpt as shared_chat_with_aoai_gpt
 
 # 載入 .env 檔案中的環境變數
 load_dotenv()
@@ -85,41 +89,7 @@ def chat_with_aoai_gpt(messages: list[dict]) -> tuple[str, int, int]:
     
     response_format = { "type": "json_object" }
 
-    error_time = 0 # 錯誤次數
-    temperature=0.7 # 溫度
-    while error_time <= 2: # 如果錯誤次數小於2次，則繼續嘗試
-        error_time += 1
-        try:
-            aoai_key = os.getenv("AOAI_KEY")                        # 取得AOAI金鑰
-            aoai_url = os.getenv("AOAI_URL")                        # 取得AOAI URL
-            aoai_model_version = os.getenv("AOAI_MODEL_VERSION")    # 取得AOAI模型版本
-
-            # 初始化 API 客戶端
-            client = AzureOpenAI(
-                api_key=aoai_key,           # 設置AOAI金鑰
-                azure_endpoint=aoai_url,    # 設置AOAI URL
-            )
-
-            # 發送請求給 API
-            response = client.chat.completions.create(
-                model=aoai_model_version,
-                messages=messages,                  # 設置聊天訊息，包含系統角色和使用者輸入
-                temperature=temperature,            # 設置溫度
-                response_format=response_format,    # 設置回傳格式
-            )
-
-            # 透過AOAI SDK取得AOAI的回答
-            assistant_message = response.choices[0].message.content
-
-            # 回傳Tuple物件(AOAI的回答、提示token數、回答token數)
-            return (
-                assistant_message,
-                response.usage.prompt_tokens,
-                response.usage.total_tokens - response.usage.prompt_tokens,
-            )
-        except Exception as e: # 如果發生錯誤，則回傳空字串、0、0
-            print(f"錯誤：{str(e)}")
-            return "", 0, 0
+    return shared_chat_with_aoai_gpt(messages, response_format=response_format)
 
 if __name__ == "__main__":
     assistant_response ,prompt_tokens, completion_tokens = get_response("請隨機產生三個 user 資料")
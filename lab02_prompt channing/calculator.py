@@ -1,105 +1,373 @@
-"""
-Math Expression Calculator System
--------------------------------
-整合 Azure OpenAI 與 numexpr 的數學計算系統。
-將中文數學題轉換為標準運算表達式並計算結果。
-"""
-
-# 導入必要的套件
-import os
-import numexpr  # 用於高效能數學運算
-from openai import AzureOpenAI
-from dotenv import load_dotenv
-
-# 初始化環境設定
-load_dotenv()  # 從 .env 檔案載入環境變數
-
-def chat_with_aoai_gpt(messages: list[dict], user_json_format: bool = False) -> tuple[str, int, int]:
-    """與 Azure OpenAI 服務互動的核心函數
-    
-    Args:
-        messages: 對話歷史訊息列表，包含系統提示和用戶輸入
-        user_json_format: 是否要求 AI 以 JSON 格式回應
-    
-    Returns:
-        tuple: (AI回應內容, 輸入token數, 輸出token數)
-    """
-    error_time = 0  # 重試計數器
-    temperature = 0.7  # AI 回應的創造性程度 (0-1)
-    
-    while error_time <= 2:  # 最多重試 2 次
-        error_time += 1
-        try:
-            # 從環境變數獲取 Azure OpenAI 服務配置
-            aoai_key = os.getenv("AOAI_KEY")
-            aoai_url = os.getenv("AOAI_URL")
-            aoai_model_version = os.getenv("AOAI_MODEL_VERSION")
-
-            # 初始化 Azure OpenAI 客戶端
-            client = AzureOpenAI(
-                api_key=aoai_key,
-                azure_endpoint=aoai_url,
-            )
-
-            # 建立 API 請求並獲取回應
-            aoai_response = client.chat.completions.create(
-                model=aoai_model_version,
-                messages=messages,
-                temperature=temperature,
-                response_format={"type": "json_object"} if user_json_format else None
-            )
-
-            # 提取 AI 回應內容
-            assistant_message = aoai_response.choices[0].message.content
-
-            # 返回 AI 回應及 token 使用統計
-            return (
-                assistant_message,
-                aoai_response.usage.prompt_tokens,
-                aoai_response.usage.total_tokens - aoai_response.usage.prompt_tokens,
-            )
-        except Exception as e:
-            print(f"錯誤：{str(e)}")
-            return "", 0, 0  # 發生錯誤時返回空值
-
-if __name__ == "__main__":
-    # 定義數學問題
-    question = "我想要計算以下的國中數學: 請計算 64 乘以 2 再扣掉 8，以上結果再除100後，再指數 1.234"
-
-    # 設計 prompt 引導 AI 將中文數學題轉換為 Python 表達式
-    prompt = f"""
-Translate this math problem into a Python numexpr-compatible expression.
-Follow these rules:
-1. Pay attention to the order of operations as described in the question
-2. Use parentheses to ensure correct calculation order
-3. For sequential calculations, wrap each step in parentheses
-4. Return ONLY the expression with no additional text
-
-Examples:
-Question: Calculate 10 plus 5, then multiply by 2
-Expression: ((10 + 5) * 2)
-
-Question: Calculate 100 times 2, then subtract 50, finally divide by 10
-Expression: (((100 * 2) - 50) / 10)
-
-Question: Calculate 25 divided by 5, then raise to power of 2
-Expression: ((25 / 5)**2)
-
-Question: {question}
-Expression:
-"""
-
-    # 建立訊息列表並呼叫 AI 進行轉換
-    messages = [{"role": "user", "content": prompt }]
-    expression, prompt_tokens, completion_tokens = chat_with_aoai_gpt(messages)
-
-    # 輸出生成的表達式
-    print(f"表達式: {expression}")
-
-    # 使用 numexpr 計算表達式結果
-    answer = numexpr.evaluate(expression)
-
-    # 輸出計算結果
-    print(f"計算結果: {answer}")
-
+"""
+Math Expression Calculator System
+-------------------------------
+整合 Azure OpenAI 與 numexpr 的數學計算系統。
+將中文數學題轉換為標準運算表達式並計算結果。
+
+- 常見的簡單題型（乘以、扣掉、除、指數…）由本地規則直接解析，不需呼叫 AI
+- 批次模式：多個題目以一次 JSON 請求轉換，並依運算式結構分組向量化計算
+- 所有運算式在計算前都會經過安全檢查，只允許數字、四則運算、次方與常用數學函數
+"""
+
+# 導入必要的套件
+import re
+import ast
+import json
+import numpy as np
+import numexpr  # 用於高效能數學運算
+from dotenv import load_dotenv
+import sys
+from pathlib import Path
+
+# 共用模組位於專案根目錄
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.aoai_client import chat_with_aoai_gpt
+
+# 初始化環境設定
+load_dotenv()  # 從 .env 檔案載入環境變數
+
+# 運算式安全檢查設定
+MAX_EXPRESSION_LENGTH = 300  # 運算式長度上限
+ALLOWED_FUNCTIONS = {"sqrt", "exp", "log", "log10", "sin", "cos", "tan", "arcsin", "arccos", "arctan", "abs"}
+ALLOWED_BINARY_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Pow, ast.Mod)
+ALLOWED_UNARY_OPERATORS = (ast.UAdd, ast.USub)
+
+# 本地解析規則：中文運算用語 → 運算子（較長的用語放前面，避免「除以」被拆成「除」）
+OPERATOR_PHRASES = [
+    ("乘以", "*"), ("乘上", "*"), ("乘", "*"), ("×", "*"), ("*", "*"),
+    ("除以", "/"), ("除", "/"), ("÷", "/"), ("/", "/"),
+    ("加上", "+"), ("加", "+"), ("+", "+"),
+    ("減去", "-"), ("減掉", "-"), ("扣掉", "-"), ("扣除", "-"), ("減", "-"), ("扣", "-"), ("-", "-"),
+    ("的指數", "**"), ("指數", "**"), ("次方", "**"), ("^", "**"),
+]
+POSTFIX_PHRASES = [("平方", "2"), ("立方", "3")]  # 直接作用在目前結果上的用語
+NEGATION_WORDS = ["負", "−", "－"]  # 表示負數的用語，本地規則不處理帶正負號的數字
+SEQUENCE_WORDS = ["以上結果", "然後", "接著", "之後", "最後", "再", "後"]  # 表示「對前面的結果繼續運算」
+FILLER_WORDS = ["請計算", "計算", "請", "結果", "以上", "得到的", "將", "把", "等於多少", "是多少", "多少", "的", "等於"]
+NUMBER_PATTERN = re.compile(r"\d+(?:,\d{3})*(?:\.\d+)?")
+# 運算式中的數字常數（不含函數名稱中的數字，例如 log10）
+CONSTANT_PATTERN = re.compile(r"(?<![\w.])(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?")
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_]\w*")
+PUNCTUATION = set(" \t\n，,。！!？?：:、")
+PRECEDENCE = {"+": 1, "-": 1, "*": 2, "/": 2, "**": 3}
+
+def validate_expression(expression: str, variables: set[str] = frozenset()) -> ast.Expression:
+    """檢查運算式是否安全，只允許數字、四則運算、次方、取餘數與常用數學函數
+    
+    Args:
+        expression: 要檢查的運算式
+        variables: 額外允許的變數名稱（向量化計算的樣板變數）
+    
+    Returns:
+        ast.Expression: 解析後的語法樹
+    
+    Raises:
+        ValueError: 運算式格式錯誤或包含不允許的內容
+    """
+    if not expression or len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ValueError(f"運算式為空或超過 {MAX_EXPRESSION_LENGTH} 個字元")
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"運算式格式錯誤：{expression}") from e
+
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Expression, ast.Load) + ALLOWED_BINARY_OPERATORS + ALLOWED_UNARY_OPERATORS):
+            continue
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            continue
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ALLOWED_BINARY_OPERATORS):
+            continue
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ALLOWED_UNARY_OPERATORS):
+            continue
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in ALLOWED_FUNCTIONS \
+                and len(node.args) == 1 and not node.keywords:
+            continue
+        if isinstance(node, ast.Name) and (node.id in ALLOWED_FUNCTIONS or node.id in variables):
+            continue  # 函數名稱本身（已在 Call 檢查過）或樣板變數
+        raise ValueError(f"運算式包含不允許的內容：{ast.dump(node)[:50]}")
+    return tree
+
+def clean_expression(text: str) -> str:
+    """清除 AI 回應中多餘的包裝（程式碼區塊、Expression: 前綴等）"""
+    text = text.strip().strip("`").strip()
+    if text.lower().startswith("python"):
+        text = text[len("python"):]
+    if text.lower().startswith("expression:"):
+        text = text[len("expression:"):]
+    return text.strip()
+
+def parse_arithmetic(question: str) -> str | None:
+    """以本地規則解析常見的中文四則運算題，無法確定時回傳 None 交給 AI 處理
+    
+    支援「64 乘以 2 再扣掉 8，以上結果再除100後，再指數 1.234」這類依序運算的寫法，
+    每一步都以括號包住前面的結果。題目中出現無法辨識的文字，或沒有「再」、「然後」等詞
+    卻混用不同優先順序的運算子（例如「2 加 3 乘以 4」）時，視為沒有把握而不解析。
+    
+    Args:
+        question: 中文數學題
+    
+    Returns:
+        str | None: numexpr 相容的運算式，或 None
+    """
+    first_number = NUMBER_PATTERN.search(question)
+    if first_number is None:
+        return None
+    # 第一個數字之前是題目的開場白，若其中出現運算用語或負號（例如「負 5」、「-5」）就不確定題意
+    preamble = question[:first_number.start()]
+    if any(phrase in preamble for phrase, _ in OPERATOR_PHRASES + POSTFIX_PHRASES) \
+            or any(word in preamble for word in NEGATION_WORDS):
+        return None
+
+    # 斷詞：數字、運算子、後置運算、依序詞與可忽略的贅詞，其餘文字一律視為無法解析
+    tokens = []
+    text = question[first_number.start():]
+    position = 0
+    while position < len(text):
+        if text[position] in PUNCTUATION:
+            position += 1
+            continue
+        number = NUMBER_PATTERN.match(text, position)
+        if number:
+            tokens.append(("number", number.group().replace(",", "")))
+            position = number.end()
+            continue
+        for kind, phrases in (("operator", OPERATOR_PHRASES), ("postfix", POSTFIX_PHRASES),
+                              ("sequence", [(word, None) for word in SEQUENCE_WORDS]),
+                              ("filler", [(word, None) for word in FILLER_WORDS])):
+            matched = next(((phrase, value) for phrase, value in phrases if text.startswith(phrase, position)), None)
+            if matched:
+                if kind != "filler":
+                    tokens.append((kind, matched[1]))
+                position += len(matched[0])
+                break
+        else:
+            return None
+
+    # 依序套用每一步運算
+    expression, operators = tokens[0][1], []
+    sequenced_all = True
+    pending_sequence = False
+    index = 1
+    while index < len(tokens):
+        kind, value = tokens[index]
+        if kind == "sequence":
+            pending_sequence = True
+            index += 1
+            continue
+        if kind == "operator" and index + 1 < len(tokens) and tokens[index + 1][0] == "number":
+            step = (value, tokens[index + 1][1])
+            index += 2
+        elif kind == "number" and index + 1 < len(tokens) and tokens[index + 1] == ("operator", "**"):
+            step = ("**", value)  # 「2 的 3 次方」
+            index += 2
+        elif kind == "postfix":
+            step = ("**", value)
+            index += 1
+        else:
+            return None
+        if operators and not pending_sequence:
+            sequenced_all = False
+        operators.append(step[0])
+        expression = f"({expression} {step[0]} {step[1]})"
+        pending_sequence = False
+
+    if not operators:
+        return None
+    # 沒有依序詞又混用不同優先順序時，「依序計算」與「先乘除後加減」的結果不同，交給 AI 判斷
+    if not sequenced_all and len({PRECEDENCE[operator] for operator in operators}) > 1:
+        return None
+    return expression
+
+def translate_question(question: str) -> tuple[str, str]:
+    """將中文數學題轉換為運算式，能以本地規則解析就不呼叫 AI
+    
+    Args:
+        question: 中文數學題
+    
+    Returns:
+        tuple: (運算式, 來源 "local" / "llm")
+    """
+    expression = parse_arithmetic(question)
+    if expression is not None:
+        return expression, "local"
+
+    messages = [{"role": "user", "content": TRANSLATION_PROMPT.format(question=question)}]
+    expression, _, _ = chat_with_aoai_gpt(messages)
+    return clean_expression(expression), "llm"
+
+def translate_questions_batch(questions: list[str]) -> list[str | None]:
+    """批次將多個中文數學題轉換為運算式
+    
+    能以本地規則解析的題目直接轉換，其餘題目編號後以一次 JSON 請求交給 AI 轉換。
+    
+    Args:
+        questions: 中文數學題列表
+    
+    Returns:
+        list[str | None]: 與題目順序對應的運算式，轉換失敗的題目為 None
+    """
+    expressions = [parse_arithmetic(question) for question in questions]
+    remaining = [i for i, expression in enumerate(expressions) if expression is None]
+    print(f"本地解析 {len(questions) - len(remaining)} 題，交給 AI 轉換 {len(remaining)} 題")
+    if not remaining:
+        return expressions
+
+    numbered = "\n".join(f"{n}. {questions[i]}" for n, i in enumerate(remaining, start=1))
+    messages = [{"role": "user", "content": BATCH_TRANSLATION_PROMPT + "\n\nQuestions:\n" + numbered}]
+    response, _, _ = chat_with_aoai_gpt(messages, user_json_format=True)
+    try:
+        entries = json.loads(response).get("expressions", []) if response else []
+    except json.JSONDecodeError:
+        print("批次轉換的回應不是合法的 JSON")
+        return expressions
+
+    for entry in entries:
+        try:
+            expressions[remaining[int(entry["id"]) - 1]] = clean_expression(str(entry["expression"]))
+        except (KeyError, ValueError, TypeError, IndexError):
+            continue
+    return expressions
+
+def make_template(expression: str) -> tuple[str, list[float]]:
+    """把運算式中的數字依序換成變數 c0, c1, ...，產生結構相同的運算式可共用的樣板
+    
+    Returns:
+        tuple: (樣板, 依序取出的數字)
+    """
+    constants = []
+
+    def replace(match: re.Match) -> str:
+        constants.append(float(match.group()))
+        return f"c{len(constants) - 1}"
+
+    template = CONSTANT_PATTERN.sub(replace, expression.replace(" ", ""))
+    return template, constants
+
+def evaluate_batch(expressions: list[str | None]) -> list[float | None]:
+    """向量化計算多個運算式
+    
+    先把運算式中的數字換成變數得到「樣板」（例如 ((c0*c1)-c2)），每個樣板只做一次安全檢查；
+    相同樣板的運算式把各自的數字組成陣列，只呼叫一次 numexpr.evaluate 就全部算完。
+    
+    Args:
+        expressions: 運算式列表，None 代表轉換失敗
+    
+    Returns:
+        list[float | None]: 與輸入順序對應的計算結果，不安全、無法計算或結果不是有限數值（例如除以零）的運算式為 None
+    """
+    results: list[float | None] = [None] * len(expressions)
+    groups: dict[str, list[tuple[int, list[float]]]] = {}
+
+    for i, expression in enumerate(expressions):
+        if expression is None:
+            continue
+        # 運算式本身只能出現允許的函數名稱，避免與樣板變數混淆
+        unknown_names = set(IDENTIFIER_PATTERN.findall(CONSTANT_PATTERN.sub("", expression))) - ALLOWED_FUNCTIONS
+        if unknown_names:
+            print(f"略過第 {i + 1} 題：運算式包含不允許的名稱 {sorted(unknown_names)}")
+            continue
+        template, constants = make_template(expression)
+        groups.setdefault(template, []).append((i, constants))
+
+    for template, members in groups.items():
+        try:
+            validate_expression(template, variables={f"c{k}" for k in range(len(members[0][1]))})
+        except ValueError as e:
+            print(f"略過 {len(members)} 題：{str(e)}")
+            continue
+
+        variables = np.array([constants for _, constants in members], dtype=np.float64)
+        local_dict = {f"c{k}": variables[:, k] for k in range(variables.shape[1])}
+        try:
+            values = numexpr.evaluate(template, local_dict=local_dict, global_dict={})
+        except Exception as e:
+            print(f"計算失敗：{template} | {str(e)}")
+            continue
+        values = np.broadcast_to(values, (len(members),))
+        for (i, _), value in zip(members, values):
+            # 除以零等情況會得到 inf / nan，視為無法計算
+            if not np.isfinite(value):
+                print(f"略過第 {i + 1} 題：計算結果不是有限的數值（例如除以零）")
+                continue
+            results[i] = float(value)
+    return results
+
+def evaluate_expression(expression: str) -> float:
+    """安全檢查後計算單一運算式
+    
+    Raises:
+        ValueError: 運算式不安全或無法計算
+    """
+    validate_expression(expression)
+    result = evaluate_batch([expression])[0]
+    if result is None:
+        raise ValueError(f"無法計算運算式：{expression}")
+    return result
+
+# 設計 prompt 引導 AI 將中文數學題轉換為 Python 表達式
+TRANSLATION_PROMPT = """
+Translate this math problem into a Python numexpr-compatible expression.
+Follow these rules:
+1. Pay attention to the order of operations as described in the question
+2. Use parentheses to ensure correct calculation order
+3. For sequential calculations, wrap each step in parentheses
+4. Return ONLY the expression with no additional text
+
+Examples:
+Question: Calculate 10 plus 5, then multiply by 2
+Expression: ((10 + 5) * 2)
+
+Question: Calculate 100 times 2, then subtract 50, finally divide by 10
+Expression: (((100 * 2) - 50) / 10)
+
+Question: Calculate 25 divided by 5, then raise to power of 2
+Expression: ((25 / 5)**2)
+
+Question: {question}
+Expression:
+"""
+
+# 批次轉換用的 prompt，要求以 JSON 回傳每一題的運算式
+BATCH_TRANSLATION_PROMPT = """
+Translate each numbered math problem into a Python numexpr-compatible expression.
+Follow these rules:
+1. Pay attention to the order of operations as described in the question
+2. Use parentheses to ensure correct calculation order
+3. For sequential calculations, wrap each step in parentheses
+4. Use only numbers, + - * / ** %, parentheses and sqrt/exp/log/log10/sin/cos/tan/abs
+
+Return JSON in this format:
+{"expressions": [{"id": 1, "expression": "((10 + 5) * 2)"}, {"id": 2, "expression": "((25 / 5)**2)"}]}
+"""
+
+if __name__ == "__main__":
+    # 定義數學問題
+    question = "我想要計算以下的國中數學: 請計算 64 乘以 2 再扣掉 8，以上結果再除100後，再指數 1.234"
+
+    # 將中文數學題轉換為 Python 表達式（簡單題型由本地規則解析，其餘交給 AI）
+    expression, source = translate_question(question)
+
+    # 輸出生成的表達式
+    print(f"表達式: {expression}（來源: {source}）")
+
+    # 安全檢查後使用 numexpr 計算表達式結果
+    answer = evaluate_expression(expression)
+
+    # 輸出計算結果
+    print(f"計算結果: {answer}")
+
+    # 批次模式：一次轉換多個題目，並依運算式結構分組向量化計算
+    batch_questions = [
+        "請計算 12 乘以 3 再加上 5",
+        "請計算 100 除以 4 再扣掉 7",
+        "請計算 9 乘以 9 再加上 1",
+        "請計算 2 的 10 次方",
+        "一個長方形長 12 公分、寬 5 公分，面積的一半是多少？",
+    ]
+    batch_expressions = translate_questions_batch(batch_questions)
+    for batch_question, batch_expression, batch_answer in zip(
+            batch_questions, batch_expressions, evaluate_batch(batch_expressions)):
+        print(f"{batch_question} → {batch_expression} = {batch_answer}")
+
     # TODO: 練習 - 讓 AI 說明計算過程
\ No newline at end of file
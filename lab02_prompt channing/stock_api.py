@@ -8,61 +8,148 @@ Stock Information Analysis System
 # 導入必要的套件
 import os
 import json
+import time
 import requests
-from openai import AzureOpenAI
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from pathlib import Path
 from dotenv import load_dotenv
 from datetime import datetime
+from stock_statistics import parse_stock_day, concat_columns, compute_stock_statistics, format_statistics_table
+import sys
+
+# 共用模組位於專案根目錄
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.aoai_client import chat_with_aoai_gpt
 
 # 初始化環境設定
 load_dotenv()  # 從 .env 檔案載入環境變數
 
-def chat_with_aoai_gpt(prompt_messages: list[dict], user_json_format: bool = False) -> tuple[str, int, int]:
-    """與 Azure OpenAI 服務互動的核心函數
+# 證交所 API 設定
+STOCK_DAY_URL = "https://www.twse.com.tw/exchangeReport/STOCK_DAY"
+TWSE_TIMEOUT = (5, 15)          # (連線, 讀取) 逾時秒數
+CURRENT_MONTH_TTL = 10 * 60     # 當月資料仍會變動，快取的有效秒數
+# 每月成交資料快取目錄，預設為專案根目錄的 .cache/twse
+LOOKBACK_MONTHS = 1             # 額外抓取的前幾個月資料，用於均線與爆量判斷的暖身
+FETCH_CONCURRENCY = 4           # 同時向證交所查詢的數量上限
+TWSE_CACHE_DIR = Path(os.getenv("TWSE_CACHE_DIR") or Path(__file__).resolve().parent.parent / ".cache" / "twse")
+
+def create_twse_session() -> requests.Session:
+    """建立共用連線池的 Session，重複查詢時沿用既有的 TCP/TLS 連線
+    
+    Returns:
+        requests.Session: 已設定連線池與重試機制的 Session
+    """
+    session = requests.Session()
+    retry = Retry(total=2, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                  allowed_methods=["GET"])
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+    session.mount("https://", adapter)
+    session.headers.update({"Accept": "application/json"})
+    return session
+
+twse_session = create_twse_session()
+
+def fetch_stock_day(stock_code: str, date: str) -> dict:
+    """取得股票某個月份的每日成交資訊（證交所 STOCK_DAY 以月為單位回傳）
+    
+    已結束的月份資料不會再變動，快取後永久使用；當月資料在 CURRENT_MONTH_TTL 秒內沿用快取。
+    只有查詢成功（stat 為 OK）的回應才會寫入快取。
+    
+    Args:
+        stock_code: 股票代號（例：2330）
+        date: 查詢日期，YYYYMMDD 格式
+    
+    Returns:
+        dict: 證交所 API 的回應內容
+    """
+    month = date[:6]
+    cache_path = TWSE_CACHE_DIR / "STOCK_DAY" / stock_code / f"{month}.json"
+    month_closed = month < datetime.now().strftime("%Y%m")
+
+    cached = None
+    if cache_path.exists():
+        with open(cache_path, "r", encoding="utf-8") as file:
+            cached = json.load(file)
+        # 在月份結束前抓取的資料可能缺少月底的交易日，月份結束後要重新抓取一次
+        if cached["closed"] or (not month_closed and time.time() - cached["fetched_at"] < CURRENT_MONTH_TTL):
+            return cached["data"]
+
+    try:
+        response = twse_session.get(
+            STOCK_DAY_URL,
+            params={"response": "json", "date": f"{month}01", "stockNo": stock_code},
+            timeout=TWSE_TIMEOUT,
+        )
+        response.raise_for_status()
+        stock_data = response.json()
+    except (requests.RequestException, ValueError) as e:
+        print(f"證交所 API 查詢失敗：{stock_code} {month} | {str(e)}")
+        if cached is not None:
+            print("改用已過期的快取資料")
+            return cached["data"]
+        return {"stat": f"查詢失敗：{str(e)}"}
+
+    if stock_data.get("stat") == "OK":
+        # 先寫入暫存檔再取代，避免留下不完整的快取檔案
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"fetched_at": time.time(), "closed": month_closed, "data": stock_data}, file,
+                      ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    return stock_data
+
+def previous_months(date: str, count: int) -> list[str]:
+    """回傳查詢日期所在月份及之前 count 個月份（YYYYMM，由舊到新）"""
+    year, month = int(date[:4]), int(date[4:6])
+    months = []
+    for offset in range(count, -1, -1):
+        total = year * 12 + (month - 1) - offset
+        months.append(f"{total // 12:04d}{total % 12 + 1:02d}")
+    return months
+
+def fetch_stock_history(stock_codes: list[str], months: list[str]) -> dict[str, dict[str, np.ndarray]]:
+    """同時抓取多檔股票、多個月份的每日成交資料，並合併成各股票的 NumPy 欄位
     
     Args:
-        prompt_messages: 對話歷史訊息列表，包含系統提示和用戶輸入
-        user_json_format: 是否要求 AI 以 JSON 格式回應
+        stock_codes: 股票代號列表
+        months: 月份列表（YYYYMM）
     
     Returns:
-        tuple: (AI回應內容, 輸入token數, 輸出token數)
+        dict: 股票代號 → parse_stock_day 格式的欄位資料（依日期排序）
     """
-    retry_count = 0  # 重試計數器
-    temperature = 0.7  # AI 回應的創造性程度 (0-1)
+    tasks = [(stock_code, month) for stock_code in stock_codes for month in months]
+    with ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY) as executor:
+        responses = list(executor.map(lambda task: fetch_stock_day(task[0], f"{task[1]}01"), tasks))
+
+    parts = {stock_code: [] for stock_code in stock_codes}
+    for (stock_code, _), stock_data in zip(tasks, responses):
+        parts[stock_code].append(parse_stock_day(stock_data))
+    return {stock_code: concat_columns(columns) for stock_code, columns in parts.items()}
+
+def build_statistics_report(stock_codes: list[str], date: str) -> str:
+    """計算查詢月份的股票統計，並整理成給模型閱讀的精簡報表
     
-    while retry_count <= 2:  # 最多重試 2 次
-        retry_count += 1
-        try:
-            # 從環境變數獲取 Azure OpenAI 服務配置
-            aoai_key = os.getenv("AOAI_KEY")
-            aoai_url = os.getenv("AOAI_URL")
-            aoai_model_version = os.getenv("AOAI_MODEL_VERSION")
-
-            # 初始化 Azure OpenAI 客戶端
-            client = AzureOpenAI(
-                api_key=aoai_key,
-                azure_endpoint=aoai_url,
-            )
-
-            # 建立 API 請求並獲取回應
-            aoai_response = client.chat.completions.create(
-                model=aoai_model_version,
-                messages=prompt_messages,
-                temperature=temperature,
-                response_format={"type": "json_object"} if user_json_format else None
-            )
-
-            # 提取 AI 回應內容
-            assistant_message = aoai_response.choices[0].message.content
-
-            # 返回 AI 回應及 token 使用統計
-            return (
-                assistant_message,
-                aoai_response.usage.prompt_tokens,
-                aoai_response.usage.completion_tokens,
-            )
-        except Exception as e:
-            print(f"錯誤：{str(e)}")
-            return "", 0, 0  # 發生錯誤時返回空值
+    Args:
+        stock_codes: 股票代號列表
+        date: 查詢日期（YYYYMMDD）
+    
+    Returns:
+        str: 所有股票的統計摘要與每日資料表
+    """
+    months = previous_months(date, LOOKBACK_MONTHS)
+    history = fetch_stock_history(stock_codes, months)
+
+    focus_date = np.datetime64(f"{date[:4]}-{date[4:6]}-{date[6:8]}")
+    month_start = np.datetime64(f"{date[:4]}-{date[4:6]}-01")
+    reports = []
+    for stock_code in stock_codes:
+        statistics = compute_stock_statistics(history[stock_code], start_date=month_start)
+        reports.append(format_statistics_table(stock_code, statistics, focus_date))
+    return "\n\n".join(reports)
 
 if __name__ == "__main__":
     # 模擬用戶查詢
@@ -74,7 +161,7 @@ if __name__ == "__main__":
     stock_extraction_messages.append({"role": "system", "content": f"""你是一個專業的股票資訊提取專家。請依照以下規則處理用戶的查詢：
 
 1. 提取規則：
-   - 從用戶問題中提取日期和台灣股票資訊
+   - 從用戶問題中提取日期和台灣股票資訊（可能包含多檔股票）
    - 將公司名稱轉換為正確的股票代號（例如：台積電 = 2330）
    - 將日期轉換為 YYYYMMDD 格式
 
@@ -101,7 +188,7 @@ if __name__ == "__main__":
 5. 回傳格式：
 {{
   "date": "20250227",
-  "stock_code": "2330"
+  "stock_codes": ["2330"]
 }}
 
 請只回傳 JSON 格式的結果，不要包含任何其他說明文字。"""})
@@ -116,14 +203,11 @@ if __name__ == "__main__":
     # 解析 AI 回應，獲取查詢參數
     extracted_data = json.loads(extraction_response)
     query_date = extracted_data["date"]  # 擷取查詢日期
-    query_stock_code = extracted_data["stock_code"]  # 擷取股票代碼
+    query_stock_codes = extracted_data.get("stock_codes") or [extracted_data["stock_code"]]  # 擷取股票代碼
 
-    # 步驟 2: 從證交所 API 獲取股票資料
-    stock_api_url = 'https://www.twse.com.tw/exchangeReport/STOCK_DAY'
-    stock_api_response = requests.get(
-        f'{stock_api_url}?response=json&date={query_date}&stockNo={query_stock_code}'
-    )
-    stock_trading_data = json.loads(stock_api_response.text)  # 解析 API 回應
+    # 步驟 2: 從證交所 API 同時獲取各股票、各月份的資料（已查詢過的月份直接使用本地快取），
+    # 並在本地計算報酬率、均線、波動度等統計，只把精簡的統計表交給模型
+    stock_statistics_report = build_statistics_report(query_stock_codes, query_date)
     
     # 步驟 3: 股票數據分析
     # 建立分析提示訊息列表
@@ -131,9 +215,10 @@ if __name__ == "__main__":
     stock_analysis_messages.append({"role": "system", "content": f"""你是一位專業的股票分析師，需要根據提供的股票交易資料回答用戶問題。
 
 1. 資料解讀規則：
-   - 仔細分析 context 中的股票交易資料
+   - 仔細分析提供的股票統計資料，所有數字皆已由程式精確計算，請直接引用，不要重新計算
    - 如果查詢日期沒有資料，請說明原因（例如：非交易日、未來日期）
-   - 數據包含：日期、成交股數、成交金額、開盤價、最高價、最低價、收盤價、漲跌價差、成交筆數
+   - 統計摘要包含：區間報酬、最高 / 最低價、波動度、最大回撤、平均成交量、爆量日
+   - 每日資料表包含：開盤、最高、最低、收盤、漲跌、漲跌幅、5 日與 20 日均線、成交量（張）、量比（相對前 20 日均量），查詢日以「◀ 查詢日」標示
 
 2. 回答格式要求：
    - 使用清晰的中文回答
@@ -164,7 +249,8 @@ if __name__ == "__main__":
         "role": "user", 
         "content": f"""
 用戶問題: {user_query}
-交易資料: {stock_trading_data}
+股票統計資料:
+{stock_statistics_report}
 """
     })
 
@@ -0,0 +1,242 @@
+"""
+股票交易資料統計 (Stock Statistics)
+
+原本 stock_api.py 直接把證交所回傳的原始 JSON 放進分析提示，模型必須逐列閱讀
+「45,123,456」這類帶逗號的字串，再自己心算漲跌幅與均線，既耗 token 又容易算錯。
+
+這個模組改成：
+1. 將 STOCK_DAY 的每日資料解析成 NumPy 欄位（民國日期、千分位數字一次轉換）
+2. 在本地以向量運算算出常用統計：報酬率、移動平均、波動度、最大回撤、爆量日
+3. 只把精簡的統計表交給模型，數字由程式精確計算，模型只負責解讀
+"""
+
+import numpy as np
+
+# STOCK_DAY 每日資料的欄位順序
+STOCK_DAY_COLUMNS = ("date", "volume", "turnover", "open", "high", "low", "close", "change", "transactions")
+TRADING_DAYS_PER_YEAR = 252
+
+
+def _parse_number(text: str) -> float:
+    """將證交所的數字字串轉成浮點數（去除千分位、正負號前的 X 標記；無交易的 -- 轉成 NaN）"""
+    cleaned = str(text).replace(",", "").replace("X", "").strip()
+    try:
+        return float(cleaned)
+    except ValueError:
+        return np.nan
+
+
+def _parse_roc_date(text: str) -> np.datetime64:
+    """將民國日期（例：114/02/27）轉成 numpy 日期"""
+    year, month, day = (int(part) for part in text.strip().split("/"))
+    return np.datetime64(f"{year + 1911:04d}-{month:02d}-{day:02d}")
+
+
+def parse_stock_day(stock_data: dict) -> dict[str, np.ndarray]:
+    """將 STOCK_DAY 的回應解析成 NumPy 欄位
+
+    Args:
+        stock_data (dict): 證交所 STOCK_DAY API 的回應內容
+
+    Returns:
+        dict[str, np.ndarray]: 欄位名稱 → 陣列，日期為 datetime64[D]，其餘為 float64；
+        查詢失敗或沒有資料時各欄位皆為空陣列
+    """
+    rows = (stock_data.get("data") or []) if stock_data.get("stat") == "OK" else []
+    if not rows:
+        columns = {name: np.array([], dtype=np.float64) for name in STOCK_DAY_COLUMNS[1:]}
+        columns["date"] = np.array([], dtype="datetime64[D]")
+        return columns
+
+    columns = {"date": np.array([_parse_roc_date(row[0]) for row in rows], dtype="datetime64[D]")}
+    values = np.array([[_parse_number(value) for value in row[1:len(STOCK_DAY_COLUMNS)]] for row in rows],
+                      dtype=np.float64)
+    for i, name in enumerate(STOCK_DAY_COLUMNS[1:]):
+        columns[name] = values[:, i]
+    return columns
+
+
+def concat_columns(parts: list[dict[str, np.ndarray]]) -> dict[str, np.ndarray]:
+    """合併多個月份的欄位資料，依日期排序並去除重複日期"""
+    merged = {name: np.concatenate([part[name] for part in parts]) for name in STOCK_DAY_COLUMNS}
+    _, unique_index = np.unique(merged["date"], return_index=True)  # np.unique 會依日期排序
+    return {name: column[unique_index] for name, column in merged.items()}
+
+
+def moving_average(values: np.ndarray, window: int) -> np.ndarray:
+    """計算移動平均，資料不足 window 天的位置為 NaN"""
+    result = np.full(values.shape, np.nan)
+    if len(values) >= window:
+        cumulative = np.cumsum(np.insert(values, 0, 0.0))
+        result[window - 1:] = (cumulative[window:] - cumulative[:-window]) / window
+    return result
+
+
+def compute_stock_statistics(
+    columns: dict[str, np.ndarray],
+    start_date: np.datetime64 | None = None,
+    ma_windows: tuple[int, ...] = (5, 20),
+    spike_window: int = 20,
+    spike_ratio: float = 2.0,
+) -> dict:
+    """以向量運算計算股票的常用統計
+
+    移動平均與爆量判斷會使用 start_date 之前的資料暖身，統計區間則從 start_date 開始。
+
+    Args:
+        columns (dict[str, np.ndarray]): parse_stock_day 產生的欄位資料
+        start_date (np.datetime64 | None): 統計區間的起始日期，未指定時使用全部資料
+        ma_windows (tuple[int, ...]): 移動平均的天數
+        spike_window (int): 計算平均成交量的天數（不含當日）
+        spike_ratio (float): 成交量超過平均的倍數即視為爆量
+
+    Returns:
+        dict: {"summary": 區間統計, "daily": 每日統計欄位}，沒有資料時為空 dict
+    """
+    close = columns["close"]
+    volume = columns["volume"]
+    if len(close) == 0:
+        return {}
+
+    # 無交易日（--）的收盤價為 NaN：報酬、均線與量比都只以有交易的日子計算，再放回原本的日期位置，
+    # 避免 NaN 經由累加傳到之後的每一天；無交易日本身的這些欄位為 NaN
+    traded = ~np.isnan(close)
+    traded_close = close[traded]
+    traded_volume = volume[traded]
+
+    def on_traded(values: np.ndarray) -> np.ndarray:
+        result = np.full(close.shape, np.nan)
+        result[traded] = values
+        return result
+
+    # 日報酬以前一個有交易日的收盤價為基準
+    traded_return = np.full(traded_close.shape, np.nan)
+    traded_return[1:] = traded_close[1:] / traded_close[:-1] - 1
+    daily_return = on_traded(traded_return)
+
+    moving_averages = {f"ma{window}": on_traded(moving_average(traded_close, window)) for window in ma_windows}
+
+    # 與前 spike_window 個交易日的平均成交量相比（不含當日）
+    average_volume = np.full(traded_volume.shape, np.nan)
+    average_volume[1:] = moving_average(traded_volume, spike_window)[:-1]
+    volume_ratio = on_traded(traded_volume / average_volume)
+
+    in_range = np.ones(close.shape, dtype=bool) if start_date is None else columns["date"] >= start_date
+    if not in_range.any():
+        return {}
+    first = int(np.argmax(in_range))
+
+    period_close = close[in_range]
+    period_returns = daily_return[in_range]
+    period_returns = period_returns[~np.isnan(period_returns)]
+    period_dates = columns["date"][in_range]
+
+    # 最後收盤與報酬基準都取最近一個有收盤價的交易日
+    period_traded = traded[in_range]
+    last_close = period_close[period_traded][-1] if period_traded.any() else np.nan
+
+    # 區間報酬以區間前最後一個有收盤價的交易日為基準（沒有暖身資料時用區間內第一個開盤價）
+    warmup_close = close[:first][traded[:first]]
+    period_open = columns["open"][in_range]
+    period_open = period_open[~np.isnan(period_open)]
+    base_price = warmup_close[-1] if len(warmup_close) else (period_open[0] if len(period_open) else np.nan)
+
+    # 最大回撤：區間內收盤價相對於先前最高點的最大跌幅（fmax 會略過無交易日的 NaN）
+    if period_traded.any():
+        running_peak = np.fmax.accumulate(period_close)
+        drawdowns = period_close / running_peak - 1
+        trough = int(np.nanargmin(drawdowns))
+        peak = int(np.nanargmax(period_close[:trough + 1]))
+        max_drawdown = float(drawdowns[trough])
+        drawdown_peak_date, drawdown_trough_date = str(period_dates[peak]), str(period_dates[trough])
+    else:
+        max_drawdown, drawdown_peak_date, drawdown_trough_date = np.nan, "-", "-"
+
+    period_high = columns["high"][in_range]
+    period_low = columns["low"][in_range]
+    period_volume = volume[in_range][period_traded]
+
+    summary = {
+        "start_date": str(period_dates[0]),
+        "end_date": str(period_dates[-1]),
+        "trading_days": int(period_traded.sum()),
+        "base_price": float(base_price),
+        "last_close": float(last_close),
+        "period_return": float(last_close / base_price - 1),
+        "highest": float(np.nanmax(period_high)) if (~np.isnan(period_high)).any() else np.nan,
+        "lowest": float(np.nanmin(period_low)) if (~np.isnan(period_low)).any() else np.nan,
+        "average_volume": float(np.nanmean(period_volume)) if len(period_volume) else np.nan,
+        "daily_volatility": float(np.std(period_returns, ddof=1)) if len(period_returns) > 1 else np.nan,
+        "max_drawdown": max_drawdown,
+        "drawdown_peak_date": drawdown_peak_date,
+        "drawdown_trough_date": drawdown_trough_date,
+        "spike_window": spike_window,
+        "spike_ratio": spike_ratio,
+        "volume_spike_dates": [str(date) for date in period_dates[volume_ratio[in_range] >= spike_ratio]],
+    }
+    summary["annualized_volatility"] = summary["daily_volatility"] * np.sqrt(TRADING_DAYS_PER_YEAR)
+
+    daily = {
+        "date": period_dates,
+        "open": columns["open"][in_range],
+        "high": columns["high"][in_range],
+        "low": columns["low"][in_range],
+        "close": period_close,
+        "change": columns["change"][in_range],
+        "return": daily_return[in_range],
+        "volume": volume[in_range],
+        "volume_ratio": volume_ratio[in_range],
+        **{name: values[in_range] for name, values in moving_averages.items()},
+    }
+    return {"summary": summary, "daily": daily}
+
+
+def format_statistics_table(stock_code: str, statistics: dict, focus_date: np.datetime64 | None = None) -> str:
+    """將統計結果整理成精簡的文字表格，供分析提示使用
+
+    Args:
+        stock_code (str): 股票代號
+        statistics (dict): compute_stock_statistics 的結果
+        focus_date (np.datetime64 | None): 使用者詢問的日期，會在表格中標示
+
+    Returns:
+        str: 統計摘要與每日資料表
+    """
+    if not statistics:
+        return f"股票 {stock_code}：查無交易資料"
+
+    summary = statistics["summary"]
+    daily = statistics["daily"]
+
+    def fmt(value: float, pattern: str = "{:.2f}") -> str:
+        return "-" if np.isnan(value) else pattern.format(value)
+
+    lines = [
+        f"股票 {stock_code}（{summary['start_date']} ~ {summary['end_date']}，{summary['trading_days']} 個交易日）",
+        f"- 區間報酬：{fmt(summary['period_return'], '{:+.2%}')}（基準 {fmt(summary['base_price'])} 元 → 最後收盤 {fmt(summary['last_close'])} 元）",
+        f"- 區間最高 / 最低：{fmt(summary['highest'])} / {fmt(summary['lowest'])} 元",
+        f"- 日報酬波動度：{fmt(summary['daily_volatility'], '{:.2%}')}（年化 {fmt(summary['annualized_volatility'], '{:.2%}')}）",
+        f"- 最大回撤：{fmt(summary['max_drawdown'], '{:.2%}')}（{summary['drawdown_peak_date']} 高點 → {summary['drawdown_trough_date']} 低點）",
+        f"- 平均成交量：{fmt(summary['average_volume'] / 1000, '{:,.0f}')} 張",
+        f"- 爆量日（成交量 ≥ 前 {summary['spike_window']} 日均量 {summary['spike_ratio']:g} 倍）："
+        f"{'、'.join(summary['volume_spike_dates']) or '無'}",
+    ]
+    if focus_date is not None and focus_date not in daily["date"]:
+        lines.append(f"- 查詢日期 {focus_date} 沒有交易資料（可能為非交易日或未來日期）")
+
+    ma_names = [name for name in daily if name.startswith("ma")]
+    header = ["日期", "開盤", "最高", "最低", "收盤", "漲跌", "漲跌幅", *[name.upper() for name in ma_names], "成交量(張)", "量比"]
+    lines.append("")
+    lines.append("| " + " | ".join(header) + " |")
+    lines.append("|" + "---|" * len(header))
+    for i, date in enumerate(daily["date"]):
+        marker = " ◀ 查詢日" if focus_date is not None and date == focus_date else ""
+        row = [
+            f"{date}{marker}",
+            fmt(daily["open"][i]), fmt(daily["high"][i]), fmt(daily["low"][i]), fmt(daily["close"][i]),
+            fmt(daily["change"][i], "{:+.2f}"), fmt(daily["return"][i], "{:+.2%}"),
+            *[fmt(daily[name][i]) for name in ma_names],
+            fmt(daily["volume"][i] / 1000, "{:,.0f}"), fmt(daily["volume_ratio"][i], "{:.1f}x"),
+        ]
+        lines.append("| " + " | ".join(row) + " |")
+    return "\n".join(lines)
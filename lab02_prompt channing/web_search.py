@@ -7,65 +7,280 @@ Web Search and Analysis System
 
 # 導入必要的套件
 import os
-import threading
+import re
+import sys
 import json
-from openai import AzureOpenAI
+import asyncio
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 from dotenv import load_dotenv
-from tavily import TavilyClient
 from datetime import datetime
-from queue import Queue
+from pathlib import Path
+
+# 共用模組位於專案根目錄
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.search_cache import CachedTavilyClient
+from shared.aoai_client import chat_with_aoai_gpt
 
 # 初始化設定
 load_dotenv()  # 載入環境變數
-tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))  # 初始化 Tavily 客戶端
+tavily_client = CachedTavilyClient(api_key=os.getenv("TAVILY_API_KEY"))  # 初始化 Tavily 客戶端（含共用快取）
+
+# 搜尋與摘要管線設定
+SEARCH_CONCURRENCY = 3      # 同時進行的搜尋數量上限
+SUMMARY_CONCURRENCY = 5     # 同時進行的摘要數量上限
+SEARCH_TIMEOUT = 15         # 單一搜尋的逾時秒數
+SUMMARY_TIMEOUT = 30        # 單一摘要的逾時秒數
+PIPELINE_TIMEOUT = 90       # 整個搜尋摘要階段的逾時秒數
+MIN_SUMMARIES = 8           # 收集到這麼多摘要就開始產生最終回答
+SUMMARY_PACK_TOKENS = 6000  # 每個批次摘要請求中文章內容的 token 上限
+SUMMARY_DOC_TOKENS = 1500   # 單篇文章送去摘要的 token 上限（超過就截斷）
+SUMMARY_PACK_LINGER = 0.5   # 打包時等待更多搜尋結果的秒數
+NEAR_DUPLICATE_THRESHOLD = 0.8  # 內容相似度（Jaccard）超過此值視為重複頁面
+
+CJK_PATTERN = re.compile(r"[\u3000-\u9fff\uac00-\ud7af\uff00-\uffef]")
 
-def chat_with_aoai_gpt(messages: list[dict], user_json_format: bool = False) -> tuple[str, int, int]:
-    """與 Azure OpenAI 服務互動的核心函數
+# 批次摘要的輸出格式，接在摘要提示之後
+PACK_SUMMARY_FORMAT = """
+
+以下會提供多篇以 [編號] 標示的文章，請分別為每一篇文章產生摘要，並以 JSON 格式回傳：
+{
+    "summaries": [
+        {"id": 1, "summary": "第 1 篇文章的摘要"},
+        {"id": 2, "summary": "第 2 篇文章的摘要"}
+    ]
+}
+- 每篇文章各自摘要，不要把不同文章的內容混在一起
+- 與使用者問題無關的文章，summary 請回傳空字串
+"""
+
+def normalize_url(url: str) -> str:
+    """正規化網址以便去除重複的搜尋結果（忽略大小寫、結尾斜線、錨點與追蹤參數）
+    
+    Args:
+        url: 原始網址
+    
+    Returns:
+        str: 正規化後的網址
+    """
+    parts = urlsplit(url.strip())
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query) if not k.lower().startswith("utm_")])
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/"), query, ""))
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文字的 token 數（中日韓字元約 1 字 1 token，其餘約 4 字元 1 token）
+    
+    Args:
+        text: 要估算的文字
+    
+    Returns:
+        int: 估算的 token 數
+    """
+    cjk_count = len(CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count) // 4 + 1
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """依 estimate_tokens 的估算方式，將文字截斷到大約 max_tokens 個 token 以內
+    
+    Args:
+        text: 原始文字
+        max_tokens: token 上限
+    
+    Returns:
+        str: 截斷後的文字（未超過上限時原樣回傳）
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cjk_count, other_count = 0, 0
+    for index, char in enumerate(text):
+        if CJK_PATTERN.match(char):
+            cjk_count += 1
+        else:
+            other_count += 1
+        if cjk_count + other_count // 4 + 1 > max_tokens:
+            return text[:index]
+    return text
+
+def text_shingles(text: str, size: int = 5) -> set[str]:
+    """將文字切成字元 n-gram 集合，用來比較兩篇內容的相似度（中英文皆適用）
+    
+    Args:
+        text: 原始文字
+        size: 每個片段的字元數
+    
+    Returns:
+        set[str]: n-gram 集合
+    """
+    compact = "".join(text.lower().split())
+    if len(compact) <= size:
+        return {compact}
+    return {compact[i:i + size] for i in range(len(compact) - size + 1)}
+
+def jaccard_similarity(a: set[str], b: set[str]) -> float:
+    """計算兩個集合的 Jaccard 相似度"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+async def search_and_summarize(search_queries: list[str], summary_prompt: str,
+                               min_summaries: int = MIN_SUMMARIES) -> list[dict]:
+    """非同步的搜尋與批次摘要管線
+    
+    每個搜尋一完成，它的結果就立即進入打包器：重複網址與內容幾乎相同的頁面會先在本地合併，
+    其餘結果在 token 預算內打包成一個請求，由模型以 JSON 一次回傳每個來源各自的摘要。
+    打包器在累積到預算上限，或 SUMMARY_PACK_LINGER 秒內沒有新結果時送出目前的包，
+    因此每個問題的摘要呼叫次數從「每篇一次」降為少數幾次。
+    收集到 min_summaries 份摘要、所有結果都處理完，或超過 PIPELINE_TIMEOUT 時就結束。
     
     Args:
-        messages: 對話歷史列表
-        user_json_format: 是否要求 JSON 格式回應
+        search_queries: 搜尋查詢列表
+        summary_prompt: 摘要用的系統提示
+        min_summaries: 收集到這麼多摘要就提前結束
     
     Returns:
-        tuple: (AI回應內容, 輸入token數, 輸出token數)
+        list[dict]: 每個來源的摘要 {"title", "url", "summary"}（依完成順序）
     """
-    error_time = 0 # 錯誤次數
-    temperature=0.7 # 溫度
-    while error_time <= 2: # 如果錯誤次數小於2次，則繼續嘗試
-        error_time += 1
+    result_queue: asyncio.Queue = asyncio.Queue()  # 搜尋結果 → 打包器，None 表示搜尋全部結束
+    search_semaphore = asyncio.Semaphore(SEARCH_CONCURRENCY)
+    summary_semaphore = asyncio.Semaphore(SUMMARY_CONCURRENCY)
+    seen_urls = set()
+    kept_shingles = []  # 已保留結果的 n-gram，用於近似重複判斷
+    summaries = []
+    summary_tasks = []
+    stats = {"near_duplicates": 0, "requests": 0}
+    enough = asyncio.Event()
+
+    # Tavily 與 AOAI 客戶端皆為同步 API，放到專用執行緒池中執行以免阻塞事件迴圈；
+    # 使用專用執行緒池是為了提前結束時不必等待仍在進行中的慢速請求
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=SEARCH_CONCURRENCY + SUMMARY_CONCURRENCY)
+
+    def run_blocking(func, *args):
+        return loop.run_in_executor(executor, partial(func, *args))
+
+    async def run_search(query: str) -> None:
+        """執行一個搜尋，並把去除重複後的結果逐筆放入佇列"""
+        async with search_semaphore:
+            try:
+                search_result = await asyncio.wait_for(
+                    run_blocking(tavily_client.search, query), timeout=SEARCH_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                print(f"搜尋逾時：{query}")
+                return
+            except Exception as e:
+                print(f"搜尋失敗：{query} | {str(e)}")
+                return
+
+        for search_item in search_result.get("results", []):
+            url_key = normalize_url(search_item.get("url", ""))
+            if url_key in seen_urls:
+                continue
+            seen_urls.add(url_key)
+
+            # 轉載或鏡像頁面的內容幾乎相同，只保留第一篇
+            shingles = text_shingles(search_item.get("title", "") + search_item.get("content", ""))
+            if any(jaccard_similarity(shingles, kept) >= NEAR_DUPLICATE_THRESHOLD for kept in kept_shingles):
+                stats["near_duplicates"] += 1
+                continue
+            kept_shingles.append(shingles)
+            await result_queue.put(search_item)
+
+    async def summarize_pack(pack: list[dict]) -> None:
+        """將一包搜尋結果送出一次摘要請求，並把 JSON 回應對應回各個來源"""
+        sources = "\n\n".join(
+            f"[{i}] {item.get('title', '')}\n{item.get('content', '')}" for i, item in enumerate(pack, start=1)
+        )
+        summary_messages = [
+            {"role": "system", "content": summary_prompt + PACK_SUMMARY_FORMAT},
+            {"role": "user", "content": sources}
+        ]
+        async with summary_semaphore:
+            stats["requests"] += 1
+            try:
+                response, _, _ = await asyncio.wait_for(
+                    run_blocking(chat_with_aoai_gpt, summary_messages, True), timeout=SUMMARY_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                print(f"摘要逾時：{len(pack)} 篇文章")
+                return
+
+        try:
+            entries = json.loads(response).get("summaries", []) if response else []
+        except json.JSONDecodeError:
+            print(f"摘要回應不是合法的 JSON，略過 {len(pack)} 篇文章")
+            return
+
+        for entry in entries:
+            try:
+                item = pack[int(entry["id"]) - 1]
+            except (KeyError, ValueError, TypeError, IndexError):
+                continue
+            summary = str(entry.get("summary", "")).strip()
+            if not summary:  # 與問題無關的文章會回傳空摘要
+                continue
+            summaries.append({"title": item.get("title", ""), "url": item.get("url", ""), "summary": summary})
+        if len(summaries) >= min_summaries:
+            enough.set()
+
+    async def packer() -> None:
+        """打包器：依 token 預算累積搜尋結果，預算用完或暫時沒有新結果時送出"""
+        pack, pack_tokens = [], 0
+
+        def flush() -> None:
+            nonlocal pack, pack_tokens
+            if pack:
+                summary_tasks.append(asyncio.create_task(summarize_pack(pack)))
+            pack, pack_tokens = [], 0
+
+        while True:
+            try:
+                search_item = await asyncio.wait_for(result_queue.get(), timeout=SUMMARY_PACK_LINGER)
+            except asyncio.TimeoutError:
+                flush()
+                continue
+            if search_item is None:
+                flush()
+                return
+
+            # 單篇過長時先截斷，避免一篇文章就佔滿整個預算
+            content = search_item.get("content", "")
+            if estimate_tokens(content) > SUMMARY_DOC_TOKENS:
+                search_item = {**search_item, "content": truncate_to_tokens(content, SUMMARY_DOC_TOKENS)}
+            item_tokens = estimate_tokens(search_item.get("title", "") + search_item.get("content", ""))
+
+            if pack and pack_tokens + item_tokens > SUMMARY_PACK_TOKENS:
+                flush()
+            pack.append(search_item)
+            pack_tokens += item_tokens
+
+    async def drain() -> None:
+        """等待所有搜尋完成，再等待所有包都摘要完畢"""
+        packer_task = asyncio.create_task(packer())
         try:
-            aoai_key = os.getenv("AOAI_KEY")                        # 取得AOAI金鑰
-            aoai_url = os.getenv("AOAI_URL")                        # 取得AOAI URL
-            aoai_model_version = os.getenv("AOAI_MODEL_VERSION")    # 取得AOAI模型版本
-
-            # 初始化 API 客戶端
-            client = AzureOpenAI(
-                api_key=aoai_key,           # 設置AOAI金鑰
-                azure_endpoint=aoai_url,    # 設置AOAI URL
-            )
-
-            # 發送請求給 API
-
-            # 如果response_format存在，則設置response_format
-            aoai_response = client.chat.completions.create(
-                model=aoai_model_version,
-                messages=messages,          # 設置聊天訊息，包含系統角色和使用者輸入
-                temperature=temperature,    # 設置溫度
-                response_format={"type": "json_object"} if user_json_format else None  # 設置回應格式
-            )
-
-            # 透過AOAI SDK取得AOAI的回答
-            assistant_message = aoai_response.choices[0].message.content
-
-            # 回傳Tuple物件(AOAI的回答、提示token數、回答token數)
-            return (
-                assistant_message,
-                aoai_response.usage.prompt_tokens,
-                aoai_response.usage.total_tokens - aoai_response.usage.prompt_tokens,
-            )
-        except Exception as e: # 如果發生錯誤，則回傳空字串、0、0
-            print(f"錯誤：{str(e)}")
-            return "", 0, 0
+            await asyncio.gather(*(run_search(query) for query in search_queries))
+            await result_queue.put(None)
+            await packer_task
+            await asyncio.gather(*summary_tasks)
+        finally:
+            packer_task.cancel()
+
+    drain_task = asyncio.create_task(drain())
+    enough_task = asyncio.create_task(enough.wait())
+
+    await asyncio.wait({drain_task, enough_task}, timeout=PIPELINE_TIMEOUT,
+                       return_when=asyncio.FIRST_COMPLETED)
+
+    # 取消尚未完成的搜尋與摘要
+    for task in [drain_task, enough_task, *summary_tasks]:
+        task.cancel()
+    await asyncio.gather(drain_task, enough_task, *summary_tasks, return_exceptions=True)
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    print(f"搜尋摘要階段完成，共取得 {len(summaries)} 份摘要（{len(seen_urls)} 個不重複網址，"
+          f"合併 {stats['near_duplicates']} 篇近似重複，摘要請求 {stats['requests']} 次）")
+    return list(summaries)
 
 if __name__ == "__main__":
     # 步驟 1: 關鍵字提取
@@ -117,32 +332,7 @@ Nvidia的股價表現如何？有沒有遇到什麼重大波動？另外，人
     # 解析關鍵字JSON
     search_queries = json.loads(keyword_response)
 
-    # 步驟 2: 多執行緒網頁搜尋
-    search_threads = []
-    web_search_queue = Queue()  # 用於存儲搜尋結果的隊列
-
-    def search_tavily(query):
-        """執行 Tavily 搜尋的輔助函數"""
-        search_result = tavily_client.search(query)
-        web_search_queue.put(search_result)
-
-    # 為每個搜尋查詢創建並啟動執行緒
-    for query in search_queries["search_queries"]:
-        search_thread = threading.Thread(target=search_tavily, args=(query,))
-        search_threads.append(search_thread)
-        search_thread.start()
-
-    # 等待所有搜尋完成
-    for search_thread in search_threads:
-        search_thread.join()
-
-    # 整合所有搜尋結果
-    all_search_results = []
-    while not web_search_queue.empty():
-        search_result = web_search_queue.get()
-        all_search_results.extend(search_result["results"])
-
-    # 步驟 3: 內容摘要處理
+    # 摘要用的系統提示
     summary_prompt = f"""你是一個專業的財經分析師，負責整理和摘要網路上的財經資訊。你需要針對以下使用者問題，從搜尋結果中提取相關資訊：
 
 使用者問題：
@@ -160,27 +350,8 @@ Nvidia的股價表現如何？有沒有遇到什麼重大波動？另外，人
 當前日期：{current_date}
 """
     
-    summary_threads = []
-    summary_queue = Queue()  # 用於存儲摘要結果的隊列
-
-    def get_summary(summary_messages, summary_queue):
-        """處理單個搜尋結果的摘要"""
-        summary_response = chat_with_aoai_gpt(summary_messages)
-        summary_queue.put(summary_response)
-
-    # 為每個搜尋結果創建摘要處理執行緒
-    for search_item in all_search_results:
-        summary_messages = [
-            {"role": "system", "content": summary_prompt},
-            {"role": "user", "content": search_item["title"] + "\n" + search_item["content"]}
-        ]
-        summary_thread = threading.Thread(target=get_summary, args=(summary_messages, summary_queue))
-        summary_threads.append(summary_thread)
-        summary_thread.start()
-
-    # 等待所有摘要處理完成
-    for summary_thread in summary_threads:
-        summary_thread.join()
+    # 步驟 2 + 3: 非同步搜尋，結果在本地去除重複後打包成少數幾個批次摘要請求
+    summaries = asyncio.run(search_and_summarize(search_queries["search_queries"], summary_prompt))
 
     # 步驟 4: 最終回答生成
     final_prompt = f"""你是一位專業的財經分析師，需要根據提供的參考資料回答投資者的問題。
@@ -205,9 +376,11 @@ Nvidia的股價表現如何？有沒有遇到什麼重大波動？另外，人
 """
     final_messages = [{"role": "system", "content": final_prompt}]
     
-    # 收集所有摘要並加入最終訊息
-    while not summary_queue.empty():
-        final_messages.append({"role": "user", "content": f"參考資料:\n{summary_queue.get()}"})
+    # 將所有來源的摘要編號後合併成一則參考資料
+    references = "\n\n".join(
+        f"[{i}] {item['title']}（{item['url']}）\n{item['summary']}" for i, item in enumerate(summaries, start=1)
+    )
+    final_messages.append({"role": "user", "content": f"參考資料:\n{references}"})
 
     # 加入原始問題
     final_messages.append({"role": "user", "content": f"原始問題:\n{user_query}"})
@@ -2,94 +2,76 @@
 文本 Embedding 與相似度視覺化程式
 
 這個程式實現以下功能：
-1. 從網路獲取書籍資料集
-2. 使用 Azure OpenAI 服務將文本轉換為 embedding 向量
-3. 使用多執行緒加速 embedding 處理
+1. 從網路獲取書籍資料集（條件式下載，資料未變動時沿用本地檔案）
+2. 使用 Azure OpenAI 服務將文本轉換為 embedding 向量，並以 memmap 檔案保存，只處理新增或修改的資料
+3. 以批次非同步請求加速 embedding 處理（每個請求打包多筆文本，並限制同時請求數）
 4. 計算文本之間的相似度
-5. 使用 t-SNE 進行降維視覺化
+5. 使用 t-SNE 進行降維視覺化（佈局快取，查詢點以 kNN 加權投影）
 6. 支援使用者查詢並顯示相似結果
 
 主要依賴套件：
 - openai: Azure OpenAI API 客戶端
 - pandas: 資料處理
 - numpy: 數值計算
-- sklearn: t-SNE 降維
+- sklearn: PCA 與 t-SNE 降維
 - matplotlib: 資料視覺化
-- threading: 多執行緒處理
+- asyncio: 非同步批次請求
 """
 
 # 導入必要的套件
-import requests
 import os
-import threading
+import sys
+import asyncio
 import pandas as pd
-from queue import Queue, Empty
-from io import StringIO
-from openai import AzureOpenAI
+from openai import AzureOpenAI, AsyncAzureOpenAI
 from dotenv import load_dotenv
-from sklearn.manifold import TSNE
 import numpy as np
 import matplotlib.pyplot as plt
+from embedding_store import EmbeddingStore, iter_csv_rows
+from tsne_layout import TSNELayout
 
 # 初始化設定
 load_dotenv()  # 載入環境變數
 
-def chat_with_aoai_gpt(messages: list[dict], user_json_format: bool = False) -> tuple[str, int, int]:
-    """與 Azure OpenAI 服務互動的核心函數
+def query_aoai_embedding(content: str) -> list[float]:
+    """從 Azure OpenAI 服務獲取文本的 embedding 向量
     
     Args:
-        messages: 對話歷史列表
-        user_json_format: 是否要求 JSON 格式回應
+        content (str): 要進行 embedding 的文本內容
     
     Returns:
-        tuple: (AI回應內容, 輸入token數, 輸出token數)
+        list[float]: 返回 embedding 向量，如果發生錯誤則返回空列表
     """
-    error_time = 0 # 錯誤次數
-    temperature=0.7 # 溫度
-    while error_time <= 2: # 如果錯誤次數小於2次，則繼續嘗試
-        error_time += 1
-        try:
-            aoai_key = os.getenv("AOAI_KEY")                        # 取得AOAI金鑰
-            aoai_url = os.getenv("AOAI_URL")                        # 取得AOAI URL
-            aoai_model_version = os.getenv("AOAI_MODEL_VERSION")    # 取得AOAI模型版本
+    try_cnt = 2
+    while try_cnt > 0:
+        try_cnt -= 1
+        api_key = os.getenv("EMBEDDING_API_KEY")
+        api_base = os.getenv("EMBEDDING_URL")
+        embedding_model = os.getenv("EMBEDDING_MODEL")
 
-            # 初始化 API 客戶端
+        try:
             client = AzureOpenAI(
-                api_key=aoai_key,           # 設置AOAI金鑰
-                azure_endpoint=aoai_url,    # 設置AOAI URL
+                api_key=api_key,
+                azure_endpoint=api_base,
             )
-
-            # 發送請求給 API
-
-            # 如果response_format存在，則設置response_format
-            aoai_response = client.chat.completions.create(
-                model=aoai_model_version,
-                messages=messages,          # 設置聊天訊息，包含系統角色和使用者輸入
-                temperature=temperature,    # 設置溫度
-                response_format={"type": "json_object"} if user_json_format else None  # 設置回應格式
+            embedding = client.embeddings.create(
+                input=content,
+                model=embedding_model,
             )
+            return embedding.data[0].embedding
+        except Exception as e:
+            print(f"get_embedding_resource error | err_msg={e}")
 
-            # 透過AOAI SDK取得AOAI的回答
-            assistant_message = aoai_response.choices[0].message.content
-
-            # 回傳Tuple物件(AOAI的回答、提示token數、回答token數)
-            return (
-                assistant_message,
-                aoai_response.usage.prompt_tokens,
-                aoai_response.usage.total_tokens - aoai_response.usage.prompt_tokens,
-            )
-        except Exception as e: # 如果發生錯誤，則回傳空字串、0、0
-            print(f"錯誤：{str(e)}")
-            return "", 0, 0
+    return []
 
-def query_aoai_embedding(content: str) -> list[float]:
-    """從 Azure OpenAI 服務獲取文本的 embedding 向量
+def query_aoai_embeddings(contents: list[str]) -> np.ndarray:
+    """一次請求取得多段文本的 embedding 向量
     
     Args:
-        content (str): 要進行 embedding 的文本內容
+        contents (list[str]): 要進行 embedding 的文本列表
     
     Returns:
-        list[float]: 返回 embedding 向量，如果發生錯誤則返回空列表
+        np.ndarray: 形狀為 (文本數, 維度) 的 float32 矩陣，如果發生錯誤則返回空矩陣
     """
     try_cnt = 2
     while try_cnt > 0:
@@ -103,38 +85,99 @@ def query_aoai_embedding(content: str) -> list[float]:
                 api_key=api_key,
                 azure_endpoint=api_base,
             )
-            embedding = client.embeddings.create(
-                input=content,
+            response = client.embeddings.create(
+                input=contents,
                 model=embedding_model,
             )
-            return embedding.data[0].embedding
+            # API 回傳的順序以 index 欄位為準
+            ordered = sorted(response.data, key=lambda item: item.index)
+            return np.array([item.embedding for item in ordered], dtype=np.float32)
         except Exception as e:
             print(f"get_embedding_resource error | err_msg={e}")
 
-    return []
+    return np.empty((0, 0), dtype=np.float32)
 
-def worker(queue: Queue, df: pd.DataFrame) -> None:
-    """工作執行緒函數，從佇列中取出任務並處理 embedding
+async def embed_texts_async(texts: list[str], batch_size: int = 100, max_concurrency: int = 4,
+                            max_retries: int = 2) -> np.ndarray:
+    """以批次非同步請求為大量文本產生 embedding
+    
+    每個請求一次打包 batch_size 筆文本，同時最多 max_concurrency 個請求進行中；
+    所有結果由單一寫入者依位置填入預先配置的 float32 矩陣，不會有多個執行緒同時寫入資料。
     
     Args:
-        queue (Queue): 包含待處理任務的佇列，每個任務是 (index, data) 的元組
-        df (pd.DataFrame): 要更新的資料框，包含 'embeddings' 欄位
+        texts (list[str]): 要進行 embedding 的文本列表
+        batch_size (int, optional): 每個請求包含的文本數量. 預設為 100
+        max_concurrency (int, optional): 同時進行的請求數量上限. 預設為 4
+        max_retries (int, optional): 每個批次失敗後的重試次數. 預設為 2
     
     Returns:
-        None
+        np.ndarray: 形狀為 (文本數, 維度) 的 float32 矩陣，有任何批次失敗時拋出例外
     """
-    while True:
-        try:
-            # 從 queue 中取得任務
-            index, data = queue.get(block=False)
-            # 處理 embedding
-            embedding = query_aoai_embedding(data)
-            # 更新 DataFrame
-            df.at[index, 'embeddings'] = embedding
-            # 標記任務完成
-            queue.task_done()
-        except Empty:
-            break
+    embedding_model = os.getenv("EMBEDDING_MODEL")
+    # 所有請求共用同一個客戶端（共用連線池）
+    client = AsyncAzureOpenAI(
+        api_key=os.getenv("EMBEDDING_API_KEY"),
+        azure_endpoint=os.getenv("EMBEDDING_URL"),
+    )
+    semaphore = asyncio.Semaphore(max_concurrency)
+    results_queue: asyncio.Queue = asyncio.Queue()
+    batches = [(start, texts[start:start + batch_size]) for start in range(0, len(texts), batch_size)]
+
+    async def request_batch(start: int, batch: list[str]) -> None:
+        """送出一個批次請求，結果放入佇列交給寫入者"""
+        async with semaphore:
+            for attempt in range(max_retries + 1):
+                try:
+                    response = await client.embeddings.create(input=batch, model=embedding_model)
+                    # API 回傳的順序以 index 欄位為準
+                    ordered = sorted(response.data, key=lambda item: item.index)
+                    await results_queue.put((start, [item.embedding for item in ordered]))
+                    return
+                except Exception as e:
+                    print(f"get_embedding_resource error | batch_start={start} attempt={attempt + 1} err_msg={e}")
+                    await asyncio.sleep(2 ** attempt)
+        await results_queue.put((start, None))
+
+    async def write_results() -> tuple[np.ndarray | None, int]:
+        """單一寫入者：依序取出批次結果並填入預先配置的矩陣"""
+        matrix = None
+        failed = 0
+        for _ in range(len(batches)):
+            start, vectors = await results_queue.get()
+            if vectors is None:
+                failed += 1
+                continue
+            if matrix is None:
+                matrix = np.empty((len(texts), len(vectors[0])), dtype=np.float32)
+            matrix[start:start + len(vectors)] = vectors
+            print(f"embedding 進度: 第 {start + 1}~{start + len(vectors)} 筆完成")
+        return matrix, failed
+
+    try:
+        writer = asyncio.create_task(write_results())
+        await asyncio.gather(*(request_batch(start, batch) for start, batch in batches))
+        matrix, failed = await writer
+    finally:
+        await client.close()
+
+    if failed:
+        raise RuntimeError(f"{failed} 個批次 embedding 失敗")
+    if matrix is None:
+        return np.empty((0, 0), dtype=np.float32)
+    return matrix
+
+def embed_texts(texts: list[str], batch_size: int = 100, max_concurrency: int = 4) -> np.ndarray:
+    """embed_texts_async 的同步版本，方便在一般程式（例如 EmbeddingStore.sync）中使用
+    
+    Args:
+        texts (list[str]): 要進行 embedding 的文本列表
+        batch_size (int, optional): 每個請求包含的文本數量. 預設為 100
+        max_concurrency (int, optional): 同時進行的請求數量上限. 預設為 4
+    
+    Returns:
+        np.ndarray: 形狀為 (文本數, 維度) 的 float32 矩陣
+    """
+    return asyncio.run(embed_texts_async(texts, batch_size, max_concurrency))
 
 def cosine_similarity(a: list[float], b: list[float]) -> float:
     """計算兩個向量之間的餘弦相似度
@@ -148,93 +191,191 @@ def cosine_similarity(a: list[float], b: list[float]) -> float:
     """
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
-def search_similar(df: pd.DataFrame, query: str, n: int = 3) -> pd.DataFrame:
+class EmbeddingIndex:
+    """以預先計算的 float32 矩陣進行向量搜尋
+
+    建立時將所有向量做 L2 正規化並保存各向量的原始長度（norm），
+    每次查詢只需要一次矩陣與向量的乘積，再用 argpartition 取出前 n 名，
+    不必逐列計算相似度，也不必排序整個資料集。
+    同一份矩陣即可支援三種計算方式：
+    - cosine: 餘弦相似度（越大越相似）
+    - dot: 內積（越大越相似）
+    - l2: 歐氏距離（越小越相似）
+    """
+
+    METRICS = ("cosine", "dot", "l2")
+
+    def __init__(self, matrix: np.ndarray):
+        """建立索引
+
+        Args:
+            matrix (np.ndarray): 形狀為 (資料筆數, 維度) 的 embedding 矩陣
+        """
+        matrix = np.asarray(matrix, dtype=np.float32)
+        self.norms = np.linalg.norm(matrix, axis=1).astype(np.float32)
+        # 避免除以零（例如 embedding 失敗的空向量）
+        safe_norms = np.where(self.norms > 0, self.norms, 1.0).astype(np.float32)
+        self.vectors = matrix / safe_norms[:, None]
+
+    @classmethod
+    def from_normalized(cls, vectors: np.ndarray, norms: np.ndarray) -> "EmbeddingIndex":
+        """直接使用已正規化的向量建立索引（例如 EmbeddingStore 載入的 memmap），不複製資料"""
+        index = cls.__new__(cls)
+        index.vectors = vectors
+        index.norms = np.asarray(norms, dtype=np.float32)
+        return index
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, column: str = "embeddings") -> "EmbeddingIndex":
+        """從 DataFrame 的 embeddings 欄位建立索引"""
+        return cls(np.array(df[column].to_list(), dtype=np.float32))
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    def _scores(self, queries: np.ndarray, metric: str) -> np.ndarray:
+        """計算查詢向量與所有資料的分數，回傳形狀為 (查詢數, 資料筆數)"""
+        if metric not in self.METRICS:
+            raise ValueError(f"不支援的計算方式: {metric}，可用選項: {self.METRICS}")
+
+        query_norms = np.linalg.norm(queries, axis=1)
+        safe_query_norms = np.where(query_norms > 0, query_norms, 1.0)
+        # 一次矩陣乘法得到所有正規化後的內積，也就是餘弦相似度
+        cosine = (queries / safe_query_norms[:, None]) @ self.vectors.T
+
+        if metric == "cosine":
+            return cosine
+        # 還原原始向量的內積：a·b = |a||b|cos
+        dot = cosine * self.norms[None, :] * query_norms[:, None]
+        if metric == "dot":
+            return dot
+        # |a-b|^2 = |a|^2 + |b|^2 - 2a·b
+        squared = self.norms[None, :] ** 2 + query_norms[:, None] ** 2 - 2 * dot
+        return np.sqrt(np.maximum(squared, 0))
+
+    def search_batch(self, queries: np.ndarray, n: int = 3, metric: str = "cosine") -> tuple[np.ndarray, np.ndarray]:
+        """批次查詢：一次找出多個查詢各自最相似的 n 筆資料
+
+        Args:
+            queries (np.ndarray): 形狀為 (查詢數, 維度) 的查詢向量
+            n (int, optional): 每個查詢要返回的結果數量. 預設為 3
+            metric (str, optional): 計算方式 cosine / dot / l2. 預設為 cosine
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: (索引位置, 分數)，形狀皆為 (查詢數, n)，依相似程度排序
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        scores = self._scores(queries, metric)
+        n = min(n, scores.shape[1])
+
+        # l2 距離越小越相似，其他則越大越相似；統一轉成「越小越好」來選取
+        keys = scores if metric == "l2" else -scores
+        # argpartition 只做部分排序，O(N) 取出前 n 名，再只對這 n 筆排序
+        top = np.argpartition(keys, n - 1, axis=1)[:, :n]
+        order = np.argsort(np.take_along_axis(keys, top, axis=1), axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        return top, np.take_along_axis(scores, top, axis=1)
+
+    def search(self, query: np.ndarray, n: int = 3, metric: str = "cosine") -> tuple[np.ndarray, np.ndarray]:
+        """單一查詢，回傳 (索引位置, 分數)，形狀皆為 (n,)"""
+        indices, scores = self.search_batch(query, n, metric)
+        return indices[0], scores[0]
+
+def search_similar(df: pd.DataFrame, query: str, n: int = 3, metric: str = "cosine",
+                   index: EmbeddingIndex | None = None, query_embedding: np.ndarray | None = None) -> pd.DataFrame:
     """搜尋與查詢文本最相似的 n 筆資料
     
     Args:
         df (pd.DataFrame): 包含 embeddings 的資料框
         query (str): 查詢文本
         n (int, optional): 要返回的結果數量. 預設為 3
+        metric (str, optional): 計算方式 cosine / dot / l2. 預設為 cosine
+        index (EmbeddingIndex | None, optional): 預先建立的索引，未提供時會從 df 建立
+        query_embedding (np.ndarray | None, optional): 已取得的查詢 embedding，提供時不再呼叫 API
     
     Returns:
-        pd.DataFrame: 包含最相似的 n 筆資料，並依相似度排序
+        pd.DataFrame: 包含最相似的 n 筆資料，並依相似度排序（分數存於 similarity 欄位）
     """
-    query_embedding = query_aoai_embedding(query)
-    df["similarity"] = df['embeddings'].apply(lambda x: cosine_similarity(x, query_embedding))
+    query_embeddings = None if query_embedding is None else np.atleast_2d(query_embedding)
+    return search_similar_batch(df, [query], n, metric, index, query_embeddings)[0]
 
-    results = (
-        df.sort_values("similarity", ascending=False)
-        .head(n)
-    )
+def search_similar_batch(df: pd.DataFrame, queries: list[str], n: int = 3, metric: str = "cosine",
+                         index: EmbeddingIndex | None = None,
+                         query_embeddings: np.ndarray | None = None) -> list[pd.DataFrame]:
+    """批次搜尋：多個查詢共用一次 embedding 請求與一次矩陣運算
+    
+    Args:
+        df (pd.DataFrame): 包含 embeddings 的資料框
+        queries (list[str]): 查詢文本列表
+        n (int, optional): 每個查詢要返回的結果數量. 預設為 3
+        metric (str, optional): 計算方式 cosine / dot / l2. 預設為 cosine
+        index (EmbeddingIndex | None, optional): 預先建立的索引，未提供時會從 df 建立
+        query_embeddings (np.ndarray | None, optional): 已取得的查詢 embedding（形狀為 (查詢數, 維度)），提供時不再呼叫 API
+    
+    Returns:
+        list[pd.DataFrame]: 每個查詢對應一個結果資料框
+    """
+    if index is None:
+        index = EmbeddingIndex.from_dataframe(df)
+
+    if query_embeddings is None:
+        query_embeddings = query_aoai_embeddings(queries)
+    if len(query_embeddings) == 0:
+        # 取得 embedding 失敗時每個查詢都回傳空結果
+        return [df.iloc[0:0].assign(similarity=[]) for _ in queries]
+    top_indices, top_scores = index.search_batch(query_embeddings, n, metric)
+
+    results = []
+    for indices, scores in zip(top_indices, top_scores):
+        result = df.iloc[indices].copy()
+        result["similarity"] = scores
+        results.append(result)
     return results
 
 if __name__ == "__main__":
     """主程式流程：
     1. 從網路獲取書籍資料集
-    2. 使用多執行緒處理每本書的 embedding
+    2. 以批次非同步請求處理新增或修改過的書籍 embedding，並保存到本地儲存區
     3. 使用 t-SNE 進行降維視覺化，並標示使用者查詢和相似結果
     4. 執行相似度搜尋示例
     """
-    # 取得書籍資料(Dataset)
+    # 取得書籍資料(Dataset)：以 ETag/Last-Modified 條件式下載，資料沒變就沿用本地檔案
     url = "https://ihower.tw/data/books-dataset-33.csv"
-    response = requests.get(url)
-    print(response.text)
+    store = EmbeddingStore("embedding_store")
+    dataset_path = store.fetch_dataset(url)
 
-    df = pd.read_csv(StringIO(response.text))
-    df['embeddings'] = None
-
-    # 建立任務佇列
-    task_queue = Queue()
-    
-    # 將所有任務加入佇列
-    for index, row in df.iterrows():
-        data = f"{row['title']} {row['description']}"
-        task_queue.put((index, data))
-    
-    # 建立工作執行緒
-    num_threads = 8  # 可以根據需求調整執行緒數量
-    threads = []
-    for _ in range(num_threads):
-        t = threading.Thread(target=worker, args=(task_queue, df))
-        t.start()
-        threads.append(t)
-    
-    # 等待所有任務完成
-    task_queue.join()
-    
-    # 等待所有執行緒結束
-    for t in threads:
-        t.join()
+    # 同步 embedding：分段讀取資料集，只有新增或內容改變的書籍才需要呼叫 API
+    stats = store.sync(iter_csv_rows(dataset_path), embed_texts, batch_size=1000)
+    print(f"embedding 同步完成: {stats}")
 
+    # 以 memmap 零拷貝載入向量矩陣並建立索引
+    vectors, norms = store.load()
+    index = EmbeddingIndex.from_normalized(vectors, norms)
+    matrix = vectors
+    df = pd.read_csv(dataset_path)
     print(df)
 
-    # 將 DataFrame 中的 embeddings 轉換為 numpy 陣列
-    matrix = np.array(df["embeddings"].to_list())
-
     # 定義使用者查詢文本並取得其 embedding
     query = "怎樣用 Python 做資料分析"
-    query_embedding = query_aoai_embedding(query)
-    
-    # 將查詢向量垂直堆疊（vstack）到原始矩陣中
-    # 這樣可以同時對所有向量（包含查詢）進行 t-SNE 降維
-    matrix_with_query = np.vstack([matrix, query_embedding])
+    query_embedding = np.asarray(query_aoai_embedding(query), dtype=np.float32)
+    if query_embedding.size == 0:
+        print("無法取得查詢的 embedding")
+        sys.exit(1)
     
-    # 使用 t-SNE 進行降維
-    # n_components=2: 降至2維以便視覺化
+    # 計算文件的 t-SNE 佈局（先以 PCA 降到 50 維），結果會快取在儲存區中
     # perplexity=15: 用於平衡局部和全局結構的參數
     # random_state=42: 確保結果可重現
-    # init='random': 初始化方式
     # learning_rate=200: 學習率參數
-    tsne = TSNE(n_components=2, perplexity=15, random_state=42, init='random', learning_rate=200)
-    vis_dims_with_query = tsne.fit_transform(matrix_with_query)
-    
-    # 分離降維後的結果為原始數據點和查詢點
-    vis_dims = vis_dims_with_query[:-1]  # 取出除了最後一個點之外的所有點（原始數據）
-    query_point = vis_dims_with_query[-1]  # 取出最後一個點（查詢點）
+    layout = TSNELayout("embedding_store", pca_components=50, perplexity=15, learning_rate=200, random_state=42)
+    vis_dims = layout.fit(matrix)
+
+    # 查詢點不重新計算 t-SNE，而是依照最近鄰文件的位置加權放進既有佈局
+    # 佈局是以正規化後的向量計算的，查詢向量也要先正規化到同一個空間
+    query_point = layout.transform(query_embedding / np.linalg.norm(query_embedding))[0]
     
-    # 使用相似度搜尋找出最相似的 n 個文件
+    # 使用相似度搜尋找出最相似的 n 個文件（沿用上面的查詢 embedding，不重複呼叫 API）
     n = 5
-    results = search_similar(df, query, n)
+    results = search_similar(df, query, n, index=index, query_embedding=query_embedding)
     similar_indices = results.index.tolist()  # 獲取相似文件的索引
     
     # 設置圖形大小
@@ -270,4 +411,13 @@ if __name__ == "__main__":
     print("\n最相似的文件：")
     print(results[['title', 'similarity']])
 
-    # TODO: 練習- 請嘗試改成用L2距離來計算相似度
\ No newline at end of file
+    # 改用 L2 距離（歐氏距離）計算，距離越小越相似
+    l2_results = search_similar(df, query, n, metric="l2", index=index, query_embedding=query_embedding)
+    print("\nL2 距離最近的文件：")
+    print(l2_results[['title', 'similarity']])
+
+    # 批次查詢：多個查詢共用一次 embedding 請求與一次矩陣運算
+    batch_queries = ["怎樣用 Python 做資料分析", "適合初學者的投資理財書", "機器學習入門"]
+    for batch_query, batch_result in zip(batch_queries, search_similar_batch(df, batch_queries, 3, index=index)):
+        print(f"\n查詢「{batch_query}」的結果：")
+        print(batch_result[['title', 'similarity']])
\ No newline at end of file
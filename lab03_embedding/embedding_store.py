@@ -0,0 +1,324 @@
+"""
+Embedding 持久化儲存 (Embedding Store)
+
+這個模組負責：
+1. 以 ETag / Last-Modified 條件式下載資料集，資料沒變就直接使用本地檔案
+2. 將 embedding 以 float32 二進位檔保存，並以 memmap 零拷貝方式載入
+3. 以每一列的 id 與內容雜湊記錄對應的文本，重新執行時只 embedding 新增或修改過的資料
+4. 以固定大小的批次串流處理，資料量再大也只佔用有限的記憶體
+
+儲存目錄結構（<N> 為版本號，每次同步寫入一組新檔案）：
+- dataset.csv          下載的資料集
+- source.json          資料集下載資訊（url、etag、last_modified）
+- vectors-<N>.f32      L2 正規化後的 embedding 矩陣（float32，列優先）
+- norms-<N>.f32        每個向量正規化前的長度（float32）
+- hashes-<N>.bin       每一列內容的 SHA-1 雜湊（20 bytes，與矩陣列順序相同）
+- hash_order-<N>.bin   依雜湊排序的列位置（int64），以二分搜尋找出可沿用的向量
+- ids-<N>.jsonl        每一列的 id（一行一個）
+- manifest.json        目前版本、矩陣形狀、模型名稱與上述檔名
+
+manifest.json 只有在新版本的檔案全部寫完後才以 os.replace 原子性地取代，
+它描述的檔案一定完整且彼此一致；同步中斷時仍指向舊版本，未完成的檔案會在下次同步後清除。
+"""
+
+import os
+import re
+import json
+import hashlib
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+import requests
+
+
+HASH_DTYPE = np.dtype("S20")  # SHA-1 digest
+GENERATION_FILE_PATTERN = re.compile(r"^(vectors|norms|hashes|hash_order|ids)-\d+\.(f32|bin|jsonl)$")
+
+
+def content_hash(text: str) -> str:
+    """計算文本內容的雜湊值，用來判斷資料是否有變動"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def iter_csv_rows(
+    csv_path: str | Path,
+    text_columns: tuple[str, ...] = ("title", "description"),
+    id_column: str | None = None,
+    chunksize: int = 10000,
+) -> Iterator[tuple[str, str]]:
+    """分段讀取 CSV，逐列產生 (id, 文本)，不必一次把整個檔案載入記憶體
+
+    Args:
+        csv_path (str | Path): CSV 檔案路徑
+        text_columns (tuple[str, ...]): 組成文本的欄位，以空白連接
+        id_column (str | None): 作為 id 的欄位，未指定時使用列號
+        chunksize (int): 每次讀取的列數
+
+    Returns:
+        Iterator[tuple[str, str]]: (id, 文本) 的序列
+    """
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        texts = chunk[list(text_columns)].astype(str).agg(" ".join, axis=1)
+        # 分段讀取時 chunk.index 會延續上一段的列號
+        ids = chunk[id_column] if id_column else chunk.index
+        yield from zip(ids.astype(str), texts)
+
+
+class EmbeddingStore:
+    """以 memmap 保存 embedding，並支援增量更新的儲存區"""
+
+    def __init__(self, store_dir: str | Path = "embedding_store", model: str | None = None):
+        """初始化儲存區
+
+        Args:
+            store_dir (str | Path): 儲存目錄
+            model (str | None): embedding 模型名稱，模型改變時所有資料都會重新 embedding
+        """
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.model = model or os.getenv("EMBEDDING_MODEL", "")
+
+        self.dataset_path = self.store_dir / "dataset.csv"
+        self.source_path = self.store_dir / "source.json"
+        self.manifest_path = self.store_dir / "manifest.json"
+
+    # === 資料集下載 ===
+
+    def fetch_dataset(self, url: str, timeout: int = 30) -> Path:
+        """條件式下載資料集，伺服器回應 304 時直接沿用本地檔案
+
+        Args:
+            url (str): 資料集網址
+            timeout (int): 請求逾時秒數
+
+        Returns:
+            Path: 本地資料集檔案路徑
+        """
+        source = self._read_json(self.source_path) or {}
+        headers = {}
+        if self.dataset_path.exists() and source.get("url") == url:
+            if source.get("etag"):
+                headers["If-None-Match"] = source["etag"]
+            if source.get("last_modified"):
+                headers["If-Modified-Since"] = source["last_modified"]
+
+        try:
+            with requests.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                if response.status_code == 304:
+                    print("資料集未變動，使用本地快取")
+                    return self.dataset_path
+                response.raise_for_status()
+
+                # 以串流方式寫入暫存檔，完成後再取代，避免留下不完整的檔案
+                tmp_path = self.dataset_path.with_suffix(".tmp")
+                with open(tmp_path, "wb") as file:
+                    for chunk in response.iter_content(chunk_size=1 << 16):
+                        file.write(chunk)
+                os.replace(tmp_path, self.dataset_path)
+
+                self._write_json(self.source_path, {
+                    "url": url,
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                })
+                print(f"資料集下載完成: {self.dataset_path}")
+        except requests.RequestException as e:
+            if not self.dataset_path.exists():
+                raise
+            print(f"下載資料集失敗，改用本地快取 | err_msg={e}")
+
+        return self.dataset_path
+
+    # === Embedding 同步 ===
+
+    def load_manifest(self) -> dict | None:
+        """讀取 manifest，不存在（或為舊版格式）時回傳 None"""
+        manifest = self._read_json(self.manifest_path)
+        return manifest if manifest and "files" in manifest else None
+
+    def load(self) -> tuple[np.ndarray, np.ndarray]:
+        """以 memmap 零拷貝方式載入 embedding 矩陣
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: (正規化後的向量矩陣, 各向量原始長度)，皆為唯讀 memmap
+        """
+        manifest = self.load_manifest()
+        if not manifest or manifest["count"] == 0:
+            raise FileNotFoundError(f"儲存區 {self.store_dir} 尚未有任何 embedding")
+
+        files = manifest["files"]
+        shape = (manifest["count"], manifest["dim"])
+        vectors = np.memmap(self.store_dir / files["vectors"], dtype=np.float32, mode="r", shape=shape)
+        norms = np.memmap(self.store_dir / files["norms"], dtype=np.float32, mode="r", shape=(shape[0],))
+        return vectors, norms
+
+    def iter_ids(self) -> Iterator[str]:
+        """逐一產生矩陣每一列對應的 id（串流讀取，不必一次載入）"""
+        manifest = self.load_manifest()
+        if not manifest:
+            return
+        with open(self.store_dir / manifest["files"]["ids"], "r", encoding="utf-8") as file:
+            for line in file:
+                yield json.loads(line)
+
+    def ids(self) -> list[str]:
+        """回傳矩陣每一列對應的 id"""
+        return list(self.iter_ids())
+
+    def sync(
+        self,
+        rows: Iterable[tuple[str, str]],
+        embed_fn: Callable[[list[str]], np.ndarray],
+        batch_size: int = 256,
+    ) -> dict:
+        """同步儲存區：內容沒變的列沿用既有向量，只 embedding 新增或修改過的列
+
+        資料以 batch_size 為單位串流處理，同一時間只有一個批次的向量在記憶體中。
+
+        Args:
+            rows (Iterable[tuple[str, str]]): (id, 文本) 的序列，順序即為矩陣的列順序
+            embed_fn (Callable[[list[str]], np.ndarray]): 將文本列表轉成 (筆數, 維度) 矩陣的函數
+            batch_size (int): 每批處理的列數
+
+        Returns:
+            dict: 統計資訊 {"total", "reused", "embedded"}
+        """
+        old_manifest = self.load_manifest()
+        old_vectors, old_norms, old_hashes, old_order = None, None, None, None
+        dim = None
+
+        # 模型相同才能沿用舊向量；雜湊索引以 memmap 二分搜尋，不必把舊資料載入記憶體
+        if old_manifest and old_manifest["count"] > 0 and old_manifest.get("model") == self.model:
+            old_vectors, old_norms = self.load()
+            old_files, count = old_manifest["files"], old_manifest["count"]
+            old_hashes = np.memmap(self.store_dir / old_files["hashes"], dtype=HASH_DTYPE, mode="r", shape=(count,))
+            old_order = np.memmap(self.store_dir / old_files["hash_order"], dtype=np.int64, mode="r", shape=(count,))
+            dim = old_manifest["dim"]
+
+        generation = (old_manifest or {}).get("generation", 0) + 1
+        files = {name: f"{name}-{generation}.{suffix}" for name, suffix in
+                 (("vectors", "f32"), ("norms", "f32"), ("hashes", "bin"), ("hash_order", "bin"), ("ids", "jsonl"))}
+        paths = {name: self.store_dir / file_name for name, file_name in files.items()}
+        stats = {"total": 0, "reused": 0, "embedded": 0}
+
+        try:
+            with open(paths["vectors"], "wb") as vectors_file, open(paths["norms"], "wb") as norms_file, \
+                    open(paths["hashes"], "wb") as hashes_file, open(paths["ids"], "w", encoding="utf-8") as ids_file:
+                for batch in self._batched(rows, batch_size):
+                    batch_texts = [text for _, text in batch]
+                    batch_hashes = np.array([bytes.fromhex(content_hash(text)) for text in batch_texts], dtype=HASH_DTYPE)
+
+                    reuse_positions = self._lookup_hashes(old_hashes, old_order, batch_hashes)
+                    missing = np.flatnonzero(reuse_positions < 0)
+                    reused = np.flatnonzero(reuse_positions >= 0)
+
+                    # 只對新增或修改過的文本呼叫 embedding API
+                    new_vectors = None
+                    if len(missing):
+                        new_vectors = np.asarray(embed_fn([batch_texts[i] for i in missing]), dtype=np.float32)
+                        if dim is None:
+                            dim = new_vectors.shape[1]
+                        elif new_vectors.shape[1] != dim:
+                            raise ValueError(f"embedding 維度不一致: {new_vectors.shape[1]} != {dim}")
+
+                    batch_vectors = np.empty((len(batch), dim), dtype=np.float32)
+                    batch_norms = np.empty(len(batch), dtype=np.float32)
+
+                    if len(reused):
+                        positions = reuse_positions[reused]
+                        batch_vectors[reused] = old_vectors[positions]
+                        batch_norms[reused] = old_norms[positions]
+
+                    if len(missing):
+                        norms = np.linalg.norm(new_vectors, axis=1)
+                        safe_norms = np.where(norms > 0, norms, 1.0)
+                        batch_vectors[missing] = new_vectors / safe_norms[:, None]
+                        batch_norms[missing] = norms
+
+                    vectors_file.write(batch_vectors.tobytes())
+                    norms_file.write(batch_norms.tobytes())
+                    hashes_file.write(batch_hashes.tobytes())
+                    ids_file.writelines(json.dumps(str(row_id), ensure_ascii=False) + "\n" for row_id, _ in batch)
+
+                    stats["total"] += len(batch)
+                    stats["reused"] += len(reused)
+                    stats["embedded"] += len(missing)
+                    print(f"已同步 {stats['total']} 筆（沿用 {stats['reused']}，新 embedding {stats['embedded']}）")
+
+            self._write_hash_order(paths["hashes"], paths["hash_order"], stats["total"])
+        except Exception:
+            # 同步失敗時 manifest 仍指向原本的檔案，只需清除這次寫到一半的檔案
+            for path in paths.values():
+                path.unlink(missing_ok=True)
+            raise
+
+        # manifest 最後以 os.replace 原子性地寫入，它描述的一定是完整的新版本檔案
+        self._write_json(self.manifest_path, {
+            "model": self.model,
+            "dim": dim or 0,
+            "count": stats["total"],
+            "generation": generation,
+            "files": files,
+        })
+
+        # 釋放舊的 memmap 後再刪除舊版本（Windows 上開啟中的檔案無法刪除）
+        del old_vectors, old_norms, old_hashes, old_order
+        self._remove_stale_files(set(files.values()))
+        return stats
+
+    # === 內部工具 ===
+
+    @staticmethod
+    def _batched(rows: Iterable[tuple[str, str]], batch_size: int) -> Iterator[list[tuple[str, str]]]:
+        """將序列切成固定大小的批次"""
+        iterator = iter(rows)
+        while batch := list(islice(iterator, batch_size)):
+            yield batch
+
+    @staticmethod
+    def _lookup_hashes(hashes: np.ndarray | None, order: np.ndarray | None, targets: np.ndarray) -> np.ndarray:
+        """以排序後的列位置二分搜尋每個雜湊第一次出現的列位置，找不到時為 -1"""
+        if hashes is None or len(hashes) == 0:
+            return np.full(len(targets), -1, dtype=np.int64)
+        slots = np.minimum(np.searchsorted(hashes, targets, sorter=order), len(hashes) - 1)
+        candidates = np.asarray(order[slots])
+        return np.where(hashes[candidates] == targets, candidates, -1)
+
+    @staticmethod
+    def _write_hash_order(hashes_path: Path, order_path: Path, count: int) -> None:
+        """寫出依雜湊排序的列位置，穩定排序讓重複的內容對應到最前面的列
+
+        排序時需要 8 bytes × 列數 的暫存，雜湊本身以 memmap 讀取。
+        """
+        if count == 0:
+            order_path.touch()
+            return
+        hashes = np.memmap(hashes_path, dtype=HASH_DTYPE, mode="r", shape=(count,))
+        np.argsort(hashes, kind="stable").astype(np.int64).tofile(order_path)
+        del hashes
+
+    def _remove_stale_files(self, keep: set[str]) -> None:
+        """刪除不屬於目前版本的向量、雜湊與 id 檔案（包含中斷的同步留下的檔案）"""
+        for path in self.store_dir.iterdir():
+            if GENERATION_FILE_PATTERN.match(path.name) and path.name not in keep:
+                try:
+                    path.unlink()
+                except OSError as e:
+                    print(f"無法刪除舊檔案 {path.name}，下次同步時再清除 | err_msg={e}")
+
+    @staticmethod
+    def _read_json(path: Path) -> dict | None:
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    @staticmethod
+    def _write_json(path: Path, data: dict) -> None:
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(data, file, ensure_ascii=False)
+        os.replace(tmp_path, path)
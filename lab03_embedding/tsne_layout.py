@@ -0,0 +1,128 @@
+"""
+t-SNE 文件佈局與查詢點投影 (t-SNE Layout)
+
+t-SNE 沒有「轉換新資料」的能力，原本每次要畫一個查詢點，都得把查詢向量
+疊到整個矩陣後面，對 1536 維資料重新計算整個 t-SNE，每個查詢都要花上數秒到數分鐘。
+
+這個模組改成：
+1. 先以 PCA 將文件向量降到較低維度（預設 50 維），再計算一次 t-SNE 佈局
+2. 將 PCA 參數與佈局結果快取到檔案，資料沒變時直接讀取
+3. 新的查詢點以 kNN 加權的方式放進既有佈局：在 PCA 空間找出最近的 k 個文件，
+   以距離的倒數為權重，取它們在佈局中座標的加權平均
+
+查詢點的投影只需要一次小矩陣運算，可以在毫秒內完成。
+"""
+
+import hashlib
+from pathlib import Path
+
+import numpy as np
+from sklearn.decomposition import PCA
+from sklearn.manifold import TSNE
+
+
+class TSNELayout:
+    """快取的 t-SNE 佈局，支援查詢點的快速投影"""
+
+    def __init__(
+        self,
+        cache_dir: str | Path = "embedding_store",
+        pca_components: int = 50,
+        perplexity: float = 15,
+        learning_rate: float = 200,
+        random_state: int = 42,
+    ):
+        """初始化佈局設定
+
+        Args:
+            cache_dir (str | Path): 快取檔案存放目錄
+            pca_components (int): PCA 預先降維的維度
+            perplexity (float): t-SNE 平衡局部與全局結構的參數
+            learning_rate (float): t-SNE 學習率
+            random_state (int): 隨機種子，確保結果可重現
+        """
+        self.cache_path = Path(cache_dir) / "tsne_layout.npz"
+        self.pca_components = pca_components
+        self.perplexity = perplexity
+        self.learning_rate = learning_rate
+        self.random_state = random_state
+
+        self.mean = None        # PCA 平均向量
+        self.components = None  # PCA 主成分
+        self.reduced = None     # 文件在 PCA 空間的座標
+        self.layout = None      # 文件在 t-SNE 二維佈局的座標
+
+    def _fingerprint(self, vectors: np.ndarray, chunk_rows: int = 4096) -> str:
+        """以向量內容與參數計算指紋，用來判斷快取是否仍然有效（分段計算，memmap 不需整個載入）"""
+        digest = hashlib.sha1()
+        digest.update(repr((vectors.shape, self.pca_components, self.perplexity,
+                            self.learning_rate, self.random_state)).encode())
+        for start in range(0, vectors.shape[0], chunk_rows):
+            digest.update(np.ascontiguousarray(vectors[start:start + chunk_rows], dtype=np.float32).tobytes())
+        return digest.hexdigest()
+
+    def fit(self, vectors: np.ndarray) -> np.ndarray:
+        """計算（或從快取讀取）文件的二維佈局
+
+        Args:
+            vectors (np.ndarray): 形狀為 (文件數, 維度) 的 embedding 矩陣
+
+        Returns:
+            np.ndarray: 形狀為 (文件數, 2) 的佈局座標
+        """
+        fingerprint = self._fingerprint(vectors)
+
+        if self.cache_path.exists():
+            cached = np.load(self.cache_path)
+            if str(cached["fingerprint"]) == fingerprint:
+                print("使用快取的 t-SNE 佈局")
+                self.mean = cached["mean"]
+                self.components = cached["components"]
+                self.reduced = cached["reduced"]
+                self.layout = cached["layout"]
+                return self.layout
+
+        print("正在計算 t-SNE 佈局（PCA 預先降維）...")
+        n_components = min(self.pca_components, vectors.shape[0], vectors.shape[1])
+        pca = PCA(n_components=n_components, random_state=self.random_state)
+        self.reduced = pca.fit_transform(np.asarray(vectors, dtype=np.float32)).astype(np.float32)
+        self.mean = pca.mean_.astype(np.float32)
+        self.components = pca.components_.astype(np.float32)
+
+        tsne = TSNE(n_components=2, perplexity=self.perplexity, random_state=self.random_state,
+                    init='random', learning_rate=self.learning_rate)
+        self.layout = tsne.fit_transform(self.reduced).astype(np.float32)
+
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez(self.cache_path, fingerprint=fingerprint, mean=self.mean, components=self.components,
+                 reduced=self.reduced, layout=self.layout)
+        return self.layout
+
+    def transform(self, queries: np.ndarray, k: int = 10) -> np.ndarray:
+        """將新的查詢向量投影到既有佈局（kNN 加權放置）
+
+        Args:
+            queries (np.ndarray): 形狀為 (查詢數, 維度) 或 (維度,) 的查詢向量
+            k (int): 參考的最近鄰文件數量
+
+        Returns:
+            np.ndarray: 形狀為 (查詢數, 2) 的佈局座標
+        """
+        if self.layout is None:
+            raise RuntimeError("請先呼叫 fit() 計算文件佈局")
+
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        reduced_queries = (queries - self.mean) @ self.components.T
+
+        # 在 PCA 空間計算查詢與所有文件的距離：|a-b|^2 = |a|^2 + |b|^2 - 2a·b
+        squared = ((reduced_queries ** 2).sum(axis=1)[:, None] + (self.reduced ** 2).sum(axis=1)[None, :]
+                   - 2 * reduced_queries @ self.reduced.T)
+        distances = np.sqrt(np.maximum(squared, 0))
+        k = min(k, distances.shape[1])
+        neighbors = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        neighbor_distances = np.take_along_axis(distances, neighbors, axis=1)
+
+        # 距離越近權重越大；與某個文件完全重合時就直接落在該文件上
+        weights = 1.0 / np.maximum(neighbor_distances, 1e-6)
+        weights /= weights.sum(axis=1, keepdims=True)
+        return np.einsum("qk,qkd->qd", weights, self.layout[neighbors])
@@ -1,9 +1,15 @@
 # 導入必要的套件
 import streamlit as st              # 用於建立網頁介面
 import os                          # 用於處理環境變數
-from openai import AzureOpenAI     # Azure OpenAI API 客戶端
 from dotenv import load_dotenv     # 用於載入環境變數
 import time                        # 用於模擬打字效果
+import sys                         # 用於加入共用模組路徑
+from pathlib import Path           # 用於處理檔案路徑
+from conversation_manager import RollingSummaryMemory, estimate_messages_tokens  # 滾動摘要記憶
+
+# 共用模組位於專案根目錄（chat_with_aoai_gpt 與回應快取）
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.aoai_client import chat_with_aoai_gpt
 
 # 載入環境變數
 load_dotenv()
@@ -18,50 +24,6 @@ if not all([aoai_key, aoai_url, aoai_model_version]):
     st.error("請確保 .env 檔案中已設定 AOAI_KEY, AOAI_URL, 和 AOAI_MODEL_VERSION")
     st.stop()
 
-def chat_with_aoai_gpt(messages: list[dict]) -> tuple[str, int, int]:
-    """與 Azure OpenAI 服務互動的核心函數
-    
-    Args:
-        messages: 包含對話歷史的列表，每個元素是包含 role 和 content 的字典
-    
-    Returns:
-        tuple: 包含三個元素：
-            - AI的回應內容 (str)
-            - 輸入消息的 token 數量 (int)
-            - 輸出回應的 token 數量 (int)
-    """
-    error_time = 0     # 記錄重試次數
-    temperature = 0.7  # 控制回應的創造性/隨機性，0為最保守，1為最創造性
-    
-    while error_time <= 2:  # 最多重試3次
-        error_time += 1
-        try:
-            # 初始化 Azure OpenAI 客戶端
-            client = AzureOpenAI(
-                api_key=aoai_key,
-                azure_endpoint=aoai_url,
-            )
-
-            # 發送請求到 Azure OpenAI 服務
-            aoai_response = client.chat.completions.create(
-                model=aoai_model_version,
-                messages=messages,
-                temperature=temperature,
-            )
-
-            # 提取 AI 的回應
-            assistant_message = aoai_response.choices[0].message.content
-
-            # 返回 AI 回應及相關的 token 使用統計
-            return (
-                assistant_message,
-                aoai_response.usage.prompt_tokens,
-                aoai_response.usage.total_tokens - aoai_response.usage.prompt_tokens,
-            )
-        except Exception as e:
-            print(f"錯誤：{str(e)}")
-            return "", 0, 0  # 發生錯誤時返回空值
-
 # 設置網頁標題和說明
 st.title("💬 我的第一個 LLM Chatbot")
 st.caption("🚀 使用 Streamlit 和 LLM API 建立")
@@ -72,6 +34,35 @@ if "messages" not in st.session_state:
     st.session_state.messages = [{"role": "system", "content": "你是一個友善且樂於助人的 AI 助理。"}]
     print("Session state 初始化完成")
 
+# 記憶模式設定（側邊欄）
+with st.sidebar:
+    st.header("🧠 記憶設定")
+    memory_mode = st.radio("記憶模式", ["完整歷史", "滾動摘要"], index=1,
+                           help="滾動摘要：保留最近幾輪原文，較舊的對話會在背景折疊成摘要")
+    keep_turns = st.slider("保留原文的對話輪數", min_value=1, max_value=10, value=4)
+    token_budget = st.number_input("提示詞 token 預算", min_value=500, max_value=32000, value=3000, step=500)
+
+# 初始化滾動摘要記憶（摘要同樣透過 chat_with_aoai_gpt 產生）
+if "memory" not in st.session_state:
+    st.session_state.memory = RollingSummaryMemory(chat_with_aoai_gpt)
+memory = st.session_state.memory
+memory.keep_turns = keep_turns
+memory.token_budget = int(token_budget)
+
+def build_prompt_messages(messages: list[dict]) -> list[dict]:
+    """依照記憶模式組合送給模型的訊息"""
+    if memory_mode == "滾動摘要":
+        return memory.build_prompt(messages)
+    return messages
+
+# 顯示目前提示詞大小
+with st.sidebar:
+    st.metric("目前提示詞大小", f"{estimate_messages_tokens(build_prompt_messages(st.session_state.messages)):,} tokens")
+    st.caption(f"完整歷史：{estimate_messages_tokens(st.session_state.messages):,} tokens")
+    if memory.summary:
+        with st.expander("目前的對話摘要"):
+            st.markdown(memory.summary)
+
 # 顯示歷史對話內容
 for message in st.session_state.messages:
     if message["role"] != "system":  # 不顯示系統提示
@@ -92,7 +83,9 @@ if prompt := st.chat_input("在這裡輸入你的訊息..."):
         message_placeholder.markdown("思考中...")  # 顯示載入提示
 
         # 獲取 AI 的回應
-        assistant_response, prompt_tokens, completion_tokens = chat_with_aoai_gpt(st.session_state.messages)
+        assistant_response, prompt_tokens, completion_tokens = chat_with_aoai_gpt(
+            build_prompt_messages(st.session_state.messages)
+        )
 
         # 模擬打字效果顯示回應
         full_response = ""
@@ -105,6 +98,11 @@ if prompt := st.chat_input("在這裡輸入你的訊息..."):
     # 將 AI 的回應添加到對話歷史
     st.session_state.messages.append({"role": "assistant", "content": assistant_response})
     print(f"Assistant: {assistant_response}")
+    print(f"提示詞 token 數: {prompt_tokens}, 回答 token 數: {completion_tokens}")
+
+    # 在背景把超出保留範圍的舊對話折疊進摘要，不阻塞下一輪對話
+    if memory_mode == "滾動摘要":
+        memory.schedule_update(st.session_state.messages)
 
     # 重新加載頁面以更新對話
     st.rerun()
\ No newline at end of file
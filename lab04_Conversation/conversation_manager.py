@@ -0,0 +1,195 @@
+"""
+對話狀態管理工具 - 滾動摘要記憶 (Rolling Summary Memory)
+
+對話越長，每一輪送給模型的歷史訊息就越多，回應會越來越慢、越來越貴。
+這個模組提供一種記憶模式：
+1. 最近 N 輪對話保留原文
+2. 更早的對話在背景執行緒中逐步折疊成一段摘要（每次只摘要新增的舊對話）
+3. 組合出的提示詞會控制在設定的 token 預算之內
+
+如此一來，長對話中每一輪的提示詞大小與延遲都能維持穩定。
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+# tiktoken 為選用套件，未安裝時改用字元數估算
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+# 摘要用的系統提示
+SUMMARY_PROMPT = """你是一個對話摘要助手。請將「既有摘要」與「新增對話」整合成一段更新後的摘要。
+要求：
+1. 保留使用者的身分、偏好、需求與已確認的事實
+2. 保留尚未解決的問題與雙方的約定
+3. 省略寒暄與重複內容
+4. 使用繁體中文，長度不超過 {max_words} 字
+請只回傳摘要內容，不要包含其他說明。"""
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文字的 token 數
+
+    Args:
+        text (str): 要估算的文字
+
+    Returns:
+        int: token 數（未安裝 tiktoken 時以字元數估算，中文約 1 字 1 token）
+    """
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    return len(text)
+
+
+def estimate_messages_tokens(messages: list[dict]) -> int:
+    """估算整份訊息列表的 token 數（每則訊息另加 4 個格式 token）
+
+    Args:
+        messages (list[dict]): 包含 role 和 content 的訊息列表
+
+    Returns:
+        int: 估算的 token 總數
+    """
+    return sum(estimate_tokens(message.get("content", "")) + 4 for message in messages)
+
+
+class RollingSummaryMemory:
+    """滾動摘要記憶：保留最近 N 輪原文，較舊的對話折疊成摘要"""
+
+    def __init__(
+        self,
+        summarize_fn: Callable[[list[dict]], tuple[str, int, int]],
+        keep_turns: int = 4,
+        token_budget: int = 3000,
+        summary_max_words: int = 300,
+    ):
+        """初始化記憶
+
+        Args:
+            summarize_fn: 呼叫 LLM 的函數，輸入訊息列表，回傳 (回應, 輸入token數, 輸出token數)
+            keep_turns (int): 保留原文的對話輪數（一問一答為一輪）
+            token_budget (int): 每次送出的提示詞 token 上限
+            summary_max_words (int): 摘要的字數上限
+        """
+        self.summarize_fn = summarize_fn
+        self.keep_turns = keep_turns
+        self.token_budget = token_budget
+        self.summary_max_words = summary_max_words
+
+        self.summary = ""              # 目前的滾動摘要
+        self.summarized_upto = 0       # 已折疊進摘要的對話訊息數（不含系統提示）
+        self.summary_tokens_used = 0   # 摘要本身花費的 token 數
+
+        self._lock = threading.Lock()
+        # 單一背景執行緒，確保摘要依序更新
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary")
+        self._pending = None
+
+    @staticmethod
+    def _split(messages: list[dict]) -> tuple[list[dict], list[dict]]:
+        """拆出系統提示與對話訊息"""
+        system_messages = [m for m in messages if m["role"] == "system"]
+        dialogue = [m for m in messages if m["role"] != "system"]
+        return system_messages, dialogue
+
+    def _verbatim_start(self, dialogue: list[dict]) -> int:
+        """計算保留原文區段的起點（最近 keep_turns 輪）"""
+        return max(0, len(dialogue) - self.keep_turns * 2)
+
+    def build_prompt(self, messages: list[dict]) -> list[dict]:
+        """組合實際送給模型的訊息列表
+
+        內容為：系統提示 + 滾動摘要 + 尚未摘要的對話原文；
+        若超出 token 預算，則從最舊的原文開始捨棄，但一定保留最後一則訊息。
+
+        Args:
+            messages (list[dict]): 完整的對話歷史
+
+        Returns:
+            list[dict]: 控制在預算內的訊息列表
+        """
+        system_messages, dialogue = self._split(messages)
+
+        with self._lock:
+            summary = self.summary
+            summarized_upto = self.summarized_upto
+
+        prompt = list(system_messages)
+        if summary:
+            prompt.append({"role": "system", "content": f"先前對話摘要：\n{summary}"})
+
+        # 摘要尚未涵蓋的部分都以原文送出（背景摘要追上前會暫時超過 keep_turns 輪）
+        recent = dialogue[summarized_upto:]
+        while len(recent) > 1 and estimate_messages_tokens(prompt + recent) > self.token_budget:
+            recent = recent[1:]
+
+        return prompt + recent
+
+    def schedule_update(self, messages: list[dict]) -> None:
+        """在背景將超出保留範圍的舊對話折疊進摘要
+
+        Args:
+            messages (list[dict]): 完整的對話歷史
+        """
+        _, dialogue = self._split(messages)
+        target = self._verbatim_start(dialogue)
+
+        with self._lock:
+            if target <= self.summarized_upto:
+                return
+            if self._pending is not None and not self._pending.done():
+                # 上一次摘要還在進行，下一輪再處理
+                return
+            start = self.summarized_upto
+
+        new_turns = [dict(m) for m in dialogue[start:target]]
+        self._pending = self._executor.submit(self._fold, new_turns, target)
+
+    def _fold(self, new_turns: list[dict], target: int) -> None:
+        """將新增的舊對話與既有摘要整合（於背景執行緒執行）"""
+        with self._lock:
+            previous_summary = self.summary
+
+        transcript = "\n".join(
+            f"{'使用者' if m['role'] == 'user' else '助理'}：{m['content']}" for m in new_turns
+        )
+        summary_messages = [
+            {"role": "system", "content": SUMMARY_PROMPT.format(max_words=self.summary_max_words)},
+            {"role": "user", "content": f"既有摘要：\n{previous_summary or '（無）'}\n\n新增對話：\n{transcript}"},
+        ]
+
+        new_summary, prompt_tokens, completion_tokens = self.summarize_fn(summary_messages)
+        if not new_summary:
+            # 摘要失敗時保留原文，下次再試
+            print("摘要更新失敗，保留原始對話")
+            return
+
+        with self._lock:
+            self.summary = new_summary.strip()
+            self.summarized_upto = target
+            self.summary_tokens_used += prompt_tokens + completion_tokens
+        print(f"摘要已更新，涵蓋 {target} 則訊息")
+
+    def prompt_tokens(self, messages: list[dict]) -> int:
+        """估算目前會送出的提示詞大小
+
+        Args:
+            messages (list[dict]): 完整的對話歷史
+
+        Returns:
+            int: 估算的 token 數
+        """
+        return estimate_messages_tokens(self.build_prompt(messages))
+
+    def reset(self) -> None:
+        """清除摘要（例如使用者清除對話時）"""
+        with self._lock:
+            self.summary = ""
+            self.summarized_upto = 0
+            self.summary_tokens_used = 0
@@ -6,22 +6,35 @@
 import os
 import json
 import asyncio
+import time
+import hmac
 from datetime import datetime
 from typing import Dict, List, Any, Optional, Tuple
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 import uvicorn
 
 # 導入現有的 RAG 系統
 from query_test import LaborLawAgent
 from utils.tracking_utils import execute_query_with_tracking
+from utils.timing_utils import TimingCollector
+from utils.query_log import QueryLog
+from utils.profiling import StackSampler
+from utils.metrics import (
+    REGISTRY, HTTP_REQUEST_SECONDS, WEBSOCKET_QUERY_SECONDS, WEBSOCKET_CONNECTIONS,
+    instrument_agent_metrics, record_error
+)
 
 # 全局變數
 labor_agent: Optional[LaborLawAgent] = None
+query_log: Optional[QueryLog] = None
+# 同一時間只允許一個 /debug/profile 取樣
+profile_lock = asyncio.Lock()
 
 def json_serializer(obj):
     """自定義 JSON 序列化器，處理 datetime 和其他不可序列化的物件"""
@@ -39,10 +52,26 @@ def json_serializer(obj):
 async def lifespan(app: FastAPI):
     """應用生命週期管理"""
     # 啟動時初始化
-    global labor_agent
+    global labor_agent, query_log
     print("🚀 正在初始化勞動基準法 RAG 系統...")
     try:
         labor_agent = LaborLawAgent()
+        # 跨請求合併 rerank 推理（查詢在執行緒池中並行執行；RERANK_MICRO_BATCH_MS 設為 off 關閉）
+        micro_batch_ms = os.getenv("RERANK_MICRO_BATCH_MS", "2")
+        if micro_batch_ms.lower() != "off" and hasattr(labor_agent.reranker, "enable_micro_batching"):
+            try:
+                max_wait_ms = float(micro_batch_ms)
+                max_batch_pairs = int(os.getenv("RERANK_MAX_BATCH_PAIRS", "64"))
+            except ValueError as e:
+                # 設定錯誤不應讓服務無法啟動，改為不合併 rerank
+                print(f"❌ Rerank 微批次已停用，環境變數格式錯誤: {e}")
+            else:
+                labor_agent.reranker.enable_micro_batching(max_wait_ms=max_wait_ms, max_batch_pairs=max_batch_pairs)
+        # 常駐的指標觀察者，所有查詢（含 WebSocket、無技術細節的查詢）都會記錄
+        instrument_agent_metrics(labor_agent)
+        query_log = QueryLog.from_env()
+        if query_log:
+            print(f"📝 查詢日誌: {query_log.path}（慢查詢門檻 {query_log.slow_threshold_ms:.0f}ms）")
         print("✅ RAG 系統初始化完成")
     except Exception as e:
         print(f"❌ RAG 系統初始化失敗: {e}")
@@ -52,6 +81,8 @@ async def lifespan(app: FastAPI):
     
     # 關閉時清理
     print("🔄 正在關閉 RAG 系統...")
+    if labor_agent and hasattr(labor_agent.reranker, "disable_micro_batching"):
+        labor_agent.reranker.disable_micro_batching()
     labor_agent = None
 
 # 創建 FastAPI 應用
@@ -73,6 +104,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """記錄每個 HTTP 端點的延遲（以路由樣板為標籤，避免路徑參數造成標籤爆量）"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method, path=path, status=str(status))
+
 # === Pydantic 模型定義 ===
 
 class ChatMessage(BaseModel):
@@ -111,6 +156,19 @@ class UsedChunk(BaseModel):
     source: str
     used_in_response: bool = True
 
+class TimingSpan(BaseModel):
+    """單一階段的計時區段"""
+    name: str = Field(..., description="階段名稱，例如 rewrite、llm_iteration_1、db_search")
+    start_ms: float = Field(..., description="相對於請求開始的起始時間（毫秒）")
+    duration_ms: float = Field(..., description="耗時（毫秒）")
+    thread: Optional[str] = None
+
+class RequestTimings(BaseModel):
+    """請求的各階段計時"""
+    total_ms: float
+    stages: Dict[str, float] = Field(default_factory=dict, description="各階段累計耗時（毫秒）")
+    spans: List[TimingSpan] = Field(default_factory=list)
+
 class TechnicalDetails(BaseModel):
     """技術細節模型"""
     search_metadata: Optional[Dict[str, Any]] = None
@@ -118,6 +176,7 @@ class TechnicalDetails(BaseModel):
     web_results: Optional[List[Dict[str, Any]]] = None
     used_chunks: Optional[List[UsedChunk]] = None
     token_usage: Optional[Dict[str, int]] = None
+    timings: Optional[RequestTimings] = None
 
 class QueryResponse(BaseModel):
     """查詢回應模型"""
@@ -151,11 +210,13 @@ class ConnectionManager:
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
         self.active_connections.append(websocket)
+        WEBSOCKET_CONNECTIONS.set(len(self.active_connections))
         print(f"🔗 WebSocket 連接建立，總連接數: {len(self.active_connections)}")
     
     def disconnect(self, websocket: WebSocket):
         if websocket in self.active_connections:
             self.active_connections.remove(websocket)
+        WEBSOCKET_CONNECTIONS.set(len(self.active_connections))
         print(f"🔌 WebSocket 連接斷開，總連接數: {len(self.active_connections)}")
     
     async def send_personal_message(self, message: dict, websocket: WebSocket):
@@ -168,11 +229,45 @@ manager = ConnectionManager()
 async def query_with_technical_details(agent, query: str, conversation_history: List[Dict[str, str]] = None) -> Tuple[str, TechnicalDetails]:
     """執行查詢並收集技術細節"""
     
-    # 使用共用的追蹤功能
-    response, technical_details_dict = execute_query_with_tracking(agent, query, conversation_history)
+    # 使用共用的追蹤功能；每次查詢都取樣，只有慢查詢才保存 profile
+    timings = TimingCollector()
+    profiler = query_log.start_profiler() if query_log else None
+    try:
+        # agent 是同步的，放到執行緒池執行，避免阻塞事件迴圈，並讓多個請求可以並行
+        response, technical_details_dict = await run_in_threadpool(
+            execute_query_with_tracking, agent, query, conversation_history, timings
+        )
+
+        # 轉換為 API 所需的格式
+        with timings.span("serialization"):
+            technical_details = build_technical_details(technical_details_dict)
+        technical_details.timings = RequestTimings(**timings.get_timings())
+    except Exception as e:
+        # 任何失敗都要寫入日誌，record 會關閉 profiler 的取樣紀錄，避免共用取樣器一直執行
+        if query_log:
+            failed_timings = timings.get_timings()
+            await run_in_threadpool(query_log.record, query, failed_timings["total_ms"], {"timings": failed_timings},
+                                    profiler=profiler, error=f"{type(e).__name__}: {e}")
+        raise
+    
+    if query_log:
+        technical_details_dict["timings"] = technical_details.timings.dict()
+        # SQLite 寫入是阻塞操作，不在事件迴圈上執行
+        await run_in_threadpool(query_log.record, query, technical_details.timings.total_ms,
+                                technical_details_dict, profiler=profiler)
     
-    # 轉換為 API 所需的格式
-    technical_details = TechnicalDetails(
+    return response, technical_details
+
+async def run_query(agent, query: str, conversation_history: List[Dict[str, str]], include_technical_details: bool) -> Tuple[str, Optional[TechnicalDetails]]:
+    """執行查詢；一律收集技術細節以寫入查詢日誌，只在需要時回傳"""
+    if not query_log and not include_technical_details:
+        return await run_in_threadpool(agent.generate_agent_response, query, conversation_history), None
+    answer, technical_details = await query_with_technical_details(agent, query, conversation_history)
+    return answer, technical_details if include_technical_details else None
+
+def build_technical_details(technical_details_dict: Dict[str, Any]) -> TechnicalDetails:
+    """將追蹤器收集的技術細節轉換為 API 回應模型"""
+    return TechnicalDetails(
         search_metadata=technical_details_dict.get('search_metadata'),
         hybrid_results=[
             SearchResult(
@@ -203,8 +298,6 @@ async def query_with_technical_details(agent, query: str, conversation_history:
         ] if technical_details_dict.get('used_chunks') else None,
         token_usage=technical_details_dict.get('token_usage', {})
     )
-    
-    return response, technical_details
 
 # === API 路由 ===
 
@@ -250,6 +343,47 @@ async def health_check():
         system_info=system_info
     )
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 指標端點（text exposition format 0.0.4）"""
+    return PlainTextResponse(REGISTRY.render(), media_type=REGISTRY.CONTENT_TYPE)
+
+@app.get("/debug/profile")
+async def debug_profile(
+    seconds: float = Query(10, gt=0, le=120, description="取樣秒數"),
+    format: str = Query("collapsed", pattern="^(collapsed|speedscope)$", description="輸出格式：collapsed 或 speedscope"),
+    interval_ms: float = Query(10, ge=1, le=1000, description="取樣間隔（毫秒）"),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """在線上流量下對所有執行緒做取樣分析（需設定 ADMIN_TOKEN 並帶 X-Admin-Token 標頭）"""
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), admin_token.encode()):
+        raise HTTPException(status_code=403, detail="管理員權杖無效")
+    if profile_lock.locked():
+        raise HTTPException(status_code=409, detail="已有取樣正在進行")
+    
+    async with profile_lock:
+        # 取樣在背景執行緒進行，這裡只讓出事件迴圈，不影響正在處理的請求
+        sampler = StackSampler(interval=interval_ms / 1000).start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            sampler.stop()
+    
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    print(f"🔬 取樣完成: {seconds:g} 秒，{sampler.sample_count} 次取樣")
+    if format == "speedscope":
+        return JSONResponse(
+            content=sampler.speedscope(name=f"api_server {timestamp}"),
+            headers={"Content-Disposition": f'attachment; filename="profile_{timestamp}.speedscope.json"'}
+        )
+    return PlainTextResponse(
+        sampler.collapsed(),
+        headers={"Content-Disposition": f'attachment; filename="profile_{timestamp}.collapsed"'}
+    )
+
 @app.post("/query", response_model=QueryResponse)
 async def query_labor_law(request: QueryRequest):
     """查詢勞動基準法"""
@@ -277,11 +411,8 @@ async def query_labor_law(request: QueryRequest):
                 })
         
         # 如果需要技術細節，使用追蹤器
-        if request.include_technical_details:
-            answer, technical_details = await query_with_technical_details(labor_agent, request.question, conversation_history)
-        else:
-            answer = labor_agent.generate_agent_response(request.question, conversation_history)
-            technical_details = None
+        answer, technical_details = await run_query(labor_agent, request.question, conversation_history,
+                                                    request.include_technical_details)
         
         # 計算處理時間
         processing_time = (datetime.now() - start_time).total_seconds()
@@ -300,6 +431,7 @@ async def query_labor_law(request: QueryRequest):
         
     except Exception as e:
         print(f"❌ 查詢處理失敗: {e}")
+        record_error("/query", e)
         raise HTTPException(
             status_code=500, 
             detail=f"查詢處理失敗: {str(e)}"
@@ -333,6 +465,7 @@ async def websocket_endpoint(websocket: WebSocket):
                 
                 # 處理查詢
                 start_time = datetime.now()
+                query_start = time.perf_counter()
                 
                 # 處理對話歷史
                 conversation_history = []
@@ -346,13 +479,9 @@ async def websocket_endpoint(websocket: WebSocket):
                 # 檢查是否需要技術細節
                 include_details = message.get("include_technical_details", False)
                 
-                if include_details:
-                    answer, technical_details = await query_with_technical_details(labor_agent, question, conversation_history)
-                    # 將技術細節轉換為可序列化的格式
-                    details_dict = technical_details.dict() if technical_details else None
-                else:
-                    answer = labor_agent.generate_agent_response(question, conversation_history)
-                    details_dict = None
+                answer, technical_details = await run_query(labor_agent, question, conversation_history, include_details)
+                # 將技術細節轉換為可序列化的格式
+                details_dict = technical_details.dict() if technical_details else None
                 
                 processing_time = (datetime.now() - start_time).total_seconds()
                 
@@ -368,12 +497,15 @@ async def websocket_endpoint(websocket: WebSocket):
                     response_data["technical_details"] = details_dict
                 
                 await manager.send_personal_message(response_data, websocket)
+                WEBSOCKET_QUERY_SECONDS.observe(time.perf_counter() - query_start)
                 
-            except json.JSONDecodeError:
+            except json.JSONDecodeError as e:
+                record_error("websocket", e)
                 await manager.send_personal_message({
                     "error": "無效的 JSON 格式"
                 }, websocket)
             except Exception as e:
+                record_error("websocket", e)
                 await manager.send_personal_message({
                     "error": f"處理失敗: {str(e)}"
                 }, websocket)
@@ -396,6 +528,7 @@ async def http_exception_handler(request, exc):
 async def general_exception_handler(request, exc):
     """通用異常處理器"""
     print(f"🚨 未處理的異常: {exc}")
+    record_error("unhandled", exc)
     return JSONResponse(
         status_code=500,
         content=ErrorResponse(
@@ -0,0 +1,4 @@
+"""
+Benchmarks for the Lab05 RAG system
+Run from the lab05_RAG directory, e.g. python -m benchmarks.pipeline_benchmark --offline
+"""
@@ -0,0 +1,289 @@
+"""
+RAG 管線端到端基準測試 (Pipeline Benchmark)
+
+以固定的問題集執行 LaborLawAgent.generate_agent_response，記錄每個階段的耗時：
+查詢改寫（rewrite）、embedding（embed）、資料庫搜尋（search）、重排序（rerank）、
+向量搜尋工具整體（vector_search）、網路搜尋（web_search）與每一輪 LLM 迭代（llm_iteration_N），
+輸出 p50 / p95 / p99 與每個問題的 token 數，結果存成 JSON，可與先前的結果比較。
+
+外部服務可以個別換成本地替身（見 standins.py），--offline 會全部替換。
+
+使用方式（在 lab05_RAG 目錄下執行）：
+    python -m benchmarks.pipeline_benchmark --offline --repeat 3
+    python -m benchmarks.pipeline_benchmark --offline --compare benchmarks/results/baseline.json
+"""
+
+import io
+import sys
+import time
+import json
+import argparse
+import platform
+import subprocess
+import threading
+from collections import defaultdict
+from contextlib import redirect_stdout
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# 以 python -m 或直接執行皆可匯入 lab05_RAG 下的模組
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from utils.agent_hooks import StageEvent, StageObserver, install_agent_hooks
+from benchmarks.stats import summarize_latency, summarize_values, save_results, load_results, compare_summaries, format_table
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+DEFAULT_QUESTIONS_PATH = BENCHMARK_DIR / "questions.jsonl"
+DEFAULT_RESULTS_DIR = BENCHMARK_DIR / "results"
+STAGE_ORDER = ["total", "rewrite", "vector_search", "embed", "search", "rerank", "web_search"]
+# agent 掛鉤的階段名稱 → 本測試沿用的名稱（與先前保存的結果相容）
+BENCHMARK_STAGE_NAMES = {"embedding": "embed", "db_search": "search"}
+
+
+class StageRecorder(StageObserver):
+    """收集每個問題、每個階段的耗時與 token 使用量（工具會在多個執行緒中執行，以鎖保護）"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.questions: List[Dict[str, Any]] = []
+        self.current: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    def start_question(self, question_id: str, question: str) -> None:
+        self.current = {
+            "id": question_id,
+            "question": question,
+            "stages": defaultdict(float),
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "llm_iterations": 0,
+        }
+
+    def finish_question(self, answer: str) -> Dict[str, Any]:
+        record = self.current
+        record["stages"] = {stage: seconds * 1000 for stage, seconds in record["stages"].items()}
+        record["total_tokens"] = record["prompt_tokens"] + record["completion_tokens"]
+        record["answer_chars"] = len(answer or "")
+        record["failed"] = not answer or answer.startswith("抱歉")
+        self.questions.append(record)
+        self.current = None
+        return record
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.samples[stage].append(seconds)
+            if self.current is not None:
+                self.current["stages"][stage] += seconds
+
+    def add_tokens(self, prompt_tokens: int, completion_tokens: int) -> None:
+        with self._lock:
+            if self.current is not None:
+                self.current["prompt_tokens"] += prompt_tokens
+                self.current["completion_tokens"] += completion_tokens
+
+    def next_llm_iteration(self) -> int:
+        with self._lock:
+            self.current["llm_iterations"] += 1
+            return self.current["llm_iterations"]
+
+    def on_stage_end(self, event: StageEvent) -> None:
+        """記錄 agent 掛鉤回報的階段；查詢改寫的 LLM 呼叫已包含在 rewrite 階段中"""
+        if event.stage == "llm":
+            if event.error is not None:
+                return
+            _, input_tokens, output_tokens = event.result
+            self.add_tokens(input_tokens, output_tokens)
+            if event.call_type == "agent":
+                self.record(f"llm_iteration_{self.next_llm_iteration()}", event.duration)
+        else:
+            self.record(BENCHMARK_STAGE_NAMES.get(event.stage, event.stage), event.duration)
+
+
+def load_questions(path: Path) -> List[Dict[str, str]]:
+    """讀取問題集（JSONL，每行包含 id 與 question）"""
+    with open(path, "r", encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def ordered_stages(stages) -> List[str]:
+    """依管線順序排列階段名稱，LLM 迭代依編號排在最後"""
+    iterations = sorted((s for s in stages if s.startswith("llm_iteration_")), key=lambda s: int(s.rsplit("_", 1)[1]))
+    others = sorted(s for s in stages if s not in STAGE_ORDER and not s.startswith("llm_iteration_"))
+    return [s for s in STAGE_ORDER if s in stages] + others + iterations
+
+
+def run_benchmark(agent, questions: List[Dict[str, str]], repeat: int = 1, warmup: int = 0,
+                  verbose: bool = False) -> Dict[str, Any]:
+    """
+    依序執行問題集並統計各階段耗時
+
+    Args:
+        agent: LaborLawAgent 實例（外部服務可以是替身）
+        questions (List[Dict[str, str]]): 問題集
+        repeat (int): 每個問題執行的次數
+        warmup (int): 正式計時前先執行（不計入結果）的問題數
+        verbose (bool): 是否顯示 agent 的執行訊息
+
+    Returns:
+        Dict[str, Any]: 包含 stages（各階段延遲分佈，毫秒）、tokens 與 questions（每次執行的明細）
+    """
+    def quiet():
+        return redirect_stdout(sys.stdout if verbose else io.StringIO())
+
+    for item in questions[:warmup]:
+        with quiet():
+            agent.generate_agent_response(item["question"])
+
+    recorder = StageRecorder()
+    total_runs = len(questions) * repeat
+    with install_agent_hooks(agent).observe(recorder):
+        for round_index in range(repeat):
+            for item in questions:
+                recorder.start_question(item.get("id", ""), item["question"])
+                start = time.perf_counter()
+                with quiet():
+                    answer = agent.generate_agent_response(item["question"])
+                recorder.record("total", time.perf_counter() - start)
+                record = recorder.finish_question(answer)
+                record["round"] = round_index + 1
+                print(f"[{len(recorder.questions)}/{total_runs}] {record['stages']['total']:.0f}ms | "
+                      f"迭代 {record['llm_iterations']} | token {record['prompt_tokens']}+{record['completion_tokens']} | "
+                      f"{'❌ ' if record['failed'] else ''}{item['question']}")
+
+    runs = recorder.questions
+    return {
+        "stages": {stage: summarize_latency(recorder.samples[stage]) for stage in ordered_stages(recorder.samples)},
+        "tokens": {
+            "prompt": summarize_values(run["prompt_tokens"] for run in runs),
+            "completion": summarize_values(run["completion_tokens"] for run in runs),
+            "total": summarize_values(run["total_tokens"] for run in runs),
+        },
+        "llm_iterations": summarize_values(run["llm_iterations"] for run in runs),
+        "failed": sum(run["failed"] for run in runs),
+        "questions": runs,
+    }
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    """顯示各階段延遲與 token 摘要"""
+    rows = [[stage, s["count"], f"{s['p50']:.1f}", f"{s['p95']:.1f}", f"{s['p99']:.1f}", f"{s['max']:.1f}"]
+            for stage, s in results["stages"].items() if s["count"]]
+    print("\n⏱️ 各階段延遲（毫秒）")
+    print(format_table(["階段", "次數", "p50", "p95", "p99", "max"], rows))
+
+    rows = [[name, f"{s['mean']:.0f}", f"{s['p50']:.0f}", f"{s['p95']:.0f}"]
+            for name, s in results["tokens"].items() if s["count"]]
+    print("\n📊 每個問題的 token 數")
+    print(format_table(["類型", "平均", "p50", "p95"], rows))
+    print(f"\n失敗回答: {results['failed']}/{len(results['questions'])}")
+
+
+def git_commit() -> Optional[str]:
+    """取得目前的 git commit（不在 git 專案中時回傳 None）"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=BENCHMARK_DIR, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def build_agent(args):
+    """依參數建立 agent，並把指定的外部服務換成本地替身"""
+    from benchmarks import standins
+
+    if args.fake_aoai:
+        from fake_aoai_server import FakeServerConfig, LatencySpec
+        config = FakeServerConfig(
+            chat_latency=LatencySpec.parse(args.fake_chat_latency),
+            embedding_latency=LatencySpec.parse(args.fake_embedding_latency),
+            tool_names=["vector_search"] if args.fake_tools == "vector" else None,
+        )
+        url = standins.start_fake_aoai_server(config)
+        print(f"🧪 模擬 AOAI 服務: {url}")
+
+    from query_test import LaborLawAgent
+    from utils.ai_client import get_embedding_for_content
+
+    reranker = standins.LexicalReranker(args.fake_rerank_ms / 1000) if args.fake_reranker else None
+    agent = LaborLawAgent(reranker=reranker)
+
+    if args.fake_db:
+        print("📚 以勞動基準法.pdf 建立記憶體向量庫...")
+        articles = standins.load_law_articles()
+        store = standins.InMemoryVectorStore.build(articles, get_embedding_for_content)
+        agent._search_database = store.search
+        print(f"✅ 共 {len(store.documents)} 條法條")
+
+    if args.fake_web_search:
+        agent.tools["web_search"]["function"] = standins.make_fake_web_search(args.fake_web_latency_ms / 1000)
+
+    return agent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LaborLawAgent 端到端管線基準測試")
+    parser.add_argument("--questions", type=Path, default=DEFAULT_QUESTIONS_PATH, help="問題集（JSONL）")
+    parser.add_argument("--repeat", type=int, default=1, help="每個問題執行的次數")
+    parser.add_argument("--warmup", type=int, default=1, help="正式計時前先執行的問題數")
+    parser.add_argument("--output", type=Path, default=None, help="結果 JSON 檔（預設存到 benchmarks/results/）")
+    parser.add_argument("--label", default="", help="這次測試的說明，記錄在結果中")
+    parser.add_argument("--compare", type=Path, default=None, help="與先前保存的結果比較")
+    parser.add_argument("--verbose", action="store_true", help="顯示 agent 的執行訊息")
+
+    standin = parser.add_argument_group("本地替身")
+    standin.add_argument("--offline", action="store_true", help="所有外部服務都使用本地替身")
+    standin.add_argument("--fake-aoai", action="store_true", help="使用模擬 AOAI 服務（聊天與 embedding）")
+    standin.add_argument("--fake-chat-latency", default="lognormal:600:0.3", help="模擬聊天延遲")
+    standin.add_argument("--fake-embedding-latency", default="normal:80:20", help="模擬 embedding 延遲")
+    standin.add_argument("--fake-tools", choices=["all", "vector"], default="all",
+                         help="模擬 LLM 要呼叫的工具：all（並行呼叫所有工具）或 vector（只呼叫 vector_search）")
+    standin.add_argument("--fake-db", action="store_true", help="使用記憶體向量庫取代 PostgreSQL")
+    standin.add_argument("--fake-reranker", action="store_true", help="使用字元重疊 Reranker 取代模型")
+    standin.add_argument("--fake-rerank-ms", type=float, default=0.0, help="替身 Reranker 每個文件的模擬推理毫秒數")
+    standin.add_argument("--fake-web-search", action="store_true", help="使用模擬網路搜尋取代 Tavily")
+    standin.add_argument("--fake-web-latency-ms", type=float, default=300.0, help="模擬網路搜尋的延遲毫秒數")
+    args = parser.parse_args()
+
+    if args.offline:
+        args.fake_aoai = args.fake_db = args.fake_reranker = args.fake_web_search = True
+
+    questions = load_questions(args.questions)
+    agent = build_agent(args)
+    print(f"🚀 開始測試：{len(questions)} 個問題 × {args.repeat} 次")
+    results = run_benchmark(agent, questions, repeat=args.repeat, warmup=args.warmup, verbose=args.verbose)
+
+    meta = {
+        "label": args.label,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "questions_file": str(args.questions),
+        "repeat": args.repeat,
+        "warmup": args.warmup,
+        "standins": {name: getattr(args, name) for name in ("fake_aoai", "fake_db", "fake_reranker", "fake_web_search")},
+        "fake_settings": {
+            "chat_latency": args.fake_chat_latency,
+            "embedding_latency": args.fake_embedding_latency,
+            "tools": args.fake_tools,
+            "rerank_ms_per_doc": args.fake_rerank_ms,
+            "web_latency_ms": args.fake_web_latency_ms,
+        } if args.offline or args.fake_aoai else {},
+    }
+    results = {"meta": meta, **results}
+    print_report(results)
+
+    output = args.output or DEFAULT_RESULTS_DIR / f"pipeline_{datetime.now():%Y%m%d_%H%M%S}.json"
+    print(f"\n💾 結果已儲存: {save_results(results, output)}")
+
+    if args.compare:
+        baseline = load_results(args.compare)
+        print(f"\n📈 與 {args.compare} 比較：各階段延遲（毫秒）")
+        print(compare_summaries(baseline["stages"], results["stages"]))
+        print("\n📈 每個問題的 token 數")
+        print(compare_summaries(baseline["tokens"], results["tokens"], metrics=("mean", "p50", "p95")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+Reranker 微基準測試 (Reranker Benchmark)
+
+在 CPU 上系統性地測試 ChineseReranker.rerank 的延遲與吞吐量，變動以下參數：
+
+- 模型：bge-reranker-base 與 MiniLM 備用模型（或任何 CrossEncoder 模型）
+- 候選數：每次重排序的文件數（對應 vector_search 的 limit）
+- 截斷長度：每個文件送進模型前的字元數（目前為 512）
+- 批次大小：CrossEncoder.predict 的 batch_size
+- torch intra-op 執行緒數（torch.set_num_threads）
+- 並行數與微批次：多個執行緒同時 rerank，並比較是否以 RerankBatcher 合併推理
+
+每個組合回報每次 rerank 的 p50 / p95 / p99（毫秒）、每秒處理的 (查詢, 文件) 配對數，
+以及前 k 名與該模型基準設定（512 字、批次 32、預設執行緒數）的一致率，
+用來確認較短的截斷或較小的模型沒有改變排序結果。
+
+候選文件取自勞動基準法.pdf 的逐條法條，以字元重疊挑出每個問題最相關的前 N 條，不需要資料庫與 Azure。
+
+使用方式（在 lab05_RAG 目錄下執行）：
+    python -m benchmarks.reranker_benchmark --model bge --model minilm
+    python -m benchmarks.reranker_benchmark --model bge --candidates 15 --max-chars 256 --max-chars 512 \\
+        --batch-size 16 --batch-size 32 --threads 1 --threads 4
+    python -m benchmarks.reranker_benchmark --model bge --candidates 15 --max-chars 512 --batch-size 32 \\
+        --concurrency 1 --concurrency 8 --micro-batch off --micro-batch 0 --micro-batch 5
+"""
+
+import io
+import sys
+import time
+import argparse
+import itertools
+import platform
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# 以 python -m 或直接執行皆可匯入 lab05_RAG 下的模組
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.pipeline_benchmark import DEFAULT_RESULTS_DIR, git_commit, load_questions
+from benchmarks.retrieval_benchmark import DEFAULT_GOLDEN_PATH, RERANKER_MODELS
+from benchmarks.stats import summarize_latency, save_results, load_results, compare_summaries, format_table
+
+REFERENCE_MAX_CHARS = 512
+REFERENCE_BATCH_SIZE = 32
+
+
+def load_reranker(spec: str):
+    """
+    載入 Reranker：bge、minilm、model:<CrossEncoder 模型路徑>，或 lexical（字元重疊替身，只用來檢查流程）
+
+    Returns:
+        Tuple[Any, float]: (Reranker 實例, 載入秒數)
+    """
+    start = time.perf_counter()
+    if spec == "lexical":
+        from benchmarks.standins import LexicalReranker
+        return LexicalReranker(), time.perf_counter() - start
+
+    from query_test import ChineseReranker
+    model_path = spec.split(":", 1)[1] if spec.startswith("model:") else RERANKER_MODELS.get(spec)
+    if not model_path:
+        raise ValueError(f"未知的 Reranker: {spec}")
+    with redirect_stdout(io.StringIO()):
+        reranker = ChineseReranker(model_path=model_path)
+    if reranker.model is None:
+        raise RuntimeError(f"無法載入 Reranker 模型: {model_path}")
+    return reranker, time.perf_counter() - start
+
+
+def build_candidate_sets(questions: List[Dict[str, Any]], max_candidates: int) -> List[List[Dict[str, Any]]]:
+    """以字元重疊從逐條法條中挑出每個問題的前 max_candidates 條作為候選"""
+    from benchmarks.standins import LexicalReranker, load_law_articles
+
+    articles = load_law_articles()
+    selector = LexicalReranker()
+    return [selector.rerank(item["question"], [dict(a) for a in articles], top_k=max_candidates) for item in questions]
+
+
+def set_torch_threads(threads: Optional[int]) -> Optional[int]:
+    """設定 torch intra-op 執行緒數，回傳實際的執行緒數（沒有安裝 torch 時回傳 None）"""
+    try:
+        import torch
+    except ImportError:
+        return None
+    if threads:
+        torch.set_num_threads(threads)
+    return torch.get_num_threads()
+
+
+def configure(reranker, max_chars: int, batch_size: int) -> None:
+    """調整 Reranker 的截斷長度與批次大小（替身沒有這些設定時略過）"""
+    if hasattr(reranker, "max_content_chars"):
+        reranker.max_content_chars = max_chars
+        reranker.batch_size = batch_size
+
+
+def configure_micro_batching(reranker, micro_batch_ms: Optional[float]) -> bool:
+    """啟用（micro_batch_ms 為等待毫秒數）或停用（None）微批次；替身不支援時回傳 False"""
+    if not hasattr(reranker, "enable_micro_batching"):
+        return False
+    if micro_batch_ms is not None:
+        with redirect_stdout(io.StringIO()):
+            return reranker.enable_micro_batching(max_wait_ms=micro_batch_ms)
+    reranker.disable_micro_batching()
+    return False
+
+
+def run_config(reranker, questions: List[Dict[str, Any]], candidate_sets: List[List[Dict[str, Any]]],
+               candidates: int, top_k: int, repeat: int, concurrency: int = 1) -> Dict[str, Any]:
+    """
+    以目前的 Reranker 設定重排序所有問題（concurrency > 1 時以多個執行緒同時送出）
+
+    Returns:
+        Dict[str, Any]: 每次 rerank 的延遲樣本（秒）、總耗時（秒）、處理的配對數與第一輪每題的前 k 名 id
+    """
+    # 暖機：第一次推理包含延遲初始化
+    with redirect_stdout(io.StringIO()):
+        reranker.rerank(questions[0]["question"], [dict(r) for r in candidate_sets[0][:candidates]], top_k=top_k)
+
+    def rerank_one(item: Dict[str, Any], candidate_set: List[Dict[str, Any]]):
+        results = [dict(r) for r in candidate_set[:candidates]]
+        start = time.perf_counter()
+        ranked = reranker.rerank(item["question"], results, top_k=top_k)
+        return time.perf_counter() - start, [r["id"] for r in ranked]
+
+    jobs = [(item, candidate_set) for _ in range(repeat) for item, candidate_set in zip(questions, candidate_sets)]
+    wall_start = time.perf_counter()
+    # rerank 會印出大量訊息，整段靜音（redirect_stdout 是全域的，不能在各執行緒內分別切換）
+    with redirect_stdout(io.StringIO()):
+        if concurrency > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                outcomes = list(executor.map(lambda job: rerank_one(*job), jobs))
+        else:
+            outcomes = [rerank_one(*job) for job in jobs]
+    wall_seconds = time.perf_counter() - wall_start
+
+    samples = [seconds for seconds, _ in outcomes]
+    rankings = [ranking for _, ranking in outcomes[:len(questions)]]
+    return {"samples": samples, "wall_seconds": wall_seconds, "pairs": len(samples) * candidates, "rankings": rankings}
+
+
+def agreement(rankings: List[List[Any]], reference: List[List[Any]]) -> float:
+    """前 k 名與基準設定重疊的比例（百分比）"""
+    overlaps = [len(set(a) & set(b)) / max(len(b), 1) for a, b in zip(rankings, reference)]
+    return sum(overlaps) / len(overlaps) * 100 if overlaps else 0.0
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    """顯示每個組合的延遲、吞吐量與排序一致率"""
+    rows = []
+    for config in results["configs"].values():
+        latency = config["latency"]
+        rows.append([
+            config["model"], config["candidates"], config["max_chars"], config["batch_size"],
+            config["threads"] if config["threads"] is not None else "-",
+            config.get("concurrency", 1), "-" if config.get("micro_batch_ms") is None else config["micro_batch_ms"],
+            f"{latency['p50']:.1f}", f"{latency['p95']:.1f}", f"{latency['p99']:.1f}",
+            f"{config['pairs_per_second']:.1f}", f"{config['ms_per_pair']:.2f}",
+            "-" if config["agreement"] is None else f"{config['agreement']:.1f}",
+        ])
+    print("\n🎯 Reranker 延遲（毫秒 / 次）與吞吐量")
+    print(format_table(["模型", "候選數", "截斷", "批次", "執行緒", "並行", "微批次ms", "p50", "p95", "p99", "配對/秒", "ms/配對", "一致率%"], rows))
+
+    rows = [[name, f"{seconds:.1f}"] for name, seconds in results["meta"]["load_seconds"].items()]
+    print("\n📦 模型載入")
+    print(format_table(["模型", "秒"], rows))
+
+
+def flatten_for_compare(results: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """將每個組合攤平成 compare_summaries 可比較的格式"""
+    return {name: {**config["latency"], "pairs_per_second": config["pairs_per_second"]}
+            for name, config in results["configs"].items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ChineseReranker 微基準測試（CPU）")
+    parser.add_argument("--model", action="append", default=None,
+                        help="模型，可重複指定：bge、minilm、model:<路徑>，或 lexical（替身）")
+    parser.add_argument("--candidates", action="append", type=int, default=None, help="候選數，可重複指定")
+    parser.add_argument("--max-chars", action="append", type=int, default=None, help="截斷字元數，可重複指定")
+    parser.add_argument("--batch-size", action="append", type=int, default=None, help="批次大小，可重複指定")
+    parser.add_argument("--threads", action="append", type=int, default=None,
+                        help="torch intra-op 執行緒數，可重複指定（預設使用 torch 的預設值）")
+    parser.add_argument("--concurrency", action="append", type=int, default=None,
+                        help="同時送出 rerank 的執行緒數，可重複指定（預設 1）")
+    parser.add_argument("--micro-batch", action="append", default=None,
+                        help="微批次：off 表示不合併，數字為等待毫秒數（0 只合併模型忙碌時排隊的請求），可重複指定（預設 off）")
+    parser.add_argument("--questions", type=Path, default=DEFAULT_GOLDEN_PATH, help="問題集（JSONL，需有 question 欄位）")
+    parser.add_argument("--limit", type=int, default=20, help="使用前幾個問題")
+    parser.add_argument("--top-k", type=int, default=5, help="重排序後保留的數量")
+    parser.add_argument("--repeat", type=int, default=3, help="每個問題重複的次數")
+    parser.add_argument("--output", type=Path, default=None, help="結果 JSON 檔（預設存到 benchmarks/results/）")
+    parser.add_argument("--label", default="", help="這次測試的說明，記錄在結果中")
+    parser.add_argument("--compare", type=Path, default=None, help="與先前保存的結果比較")
+    args = parser.parse_args()
+
+    models = args.model or ["bge", "minilm"]
+    candidate_counts = sorted(args.candidates or [5, 15, 30])
+    max_chars_options = args.max_chars or [256, REFERENCE_MAX_CHARS, 1024]
+    batch_sizes = args.batch_size or [8, REFERENCE_BATCH_SIZE]
+    thread_options = args.threads or [None]
+    concurrency_options = args.concurrency or [1]
+    micro_batch_options = [None if value == "off" else float(value) for value in (args.micro_batch or ["off"])]
+
+    default_threads = set_torch_threads(None)
+    questions = load_questions(args.questions)[:args.limit]
+    print(f"📚 為 {len(questions)} 個問題挑選最多 {max(candidate_counts)} 個候選法條...")
+    candidate_sets = build_candidate_sets(questions, max(candidate_counts))
+
+    configs: Dict[str, Dict[str, Any]] = {}
+    load_seconds: Dict[str, float] = {}
+    for model in models:
+        print(f"🔧 載入 {model}...")
+        try:
+            reranker, seconds = load_reranker(model)
+        except Exception as e:
+            print(f"⚠️ 略過 {model}：{e}")
+            continue
+        load_seconds[model] = seconds
+
+        # 每個候選數先以基準設定跑一次，作為排序一致率的參考
+        references = {}
+        for candidates in candidate_counts:
+            set_torch_threads(default_threads)
+            configure(reranker, REFERENCE_MAX_CHARS, REFERENCE_BATCH_SIZE)
+            configure_micro_batching(reranker, None)
+            references[candidates] = run_config(reranker, questions, candidate_sets, candidates, args.top_k, repeat=1)["rankings"]
+
+        for threads, candidates, max_chars, batch_size, concurrency, micro_batch_ms in itertools.product(
+                thread_options, candidate_counts, max_chars_options, batch_sizes,
+                concurrency_options, micro_batch_options):
+            actual_threads = set_torch_threads(threads or default_threads)
+            configure(reranker, max_chars, batch_size)
+            batching = configure_micro_batching(reranker, micro_batch_ms)
+            run = run_config(reranker, questions, candidate_sets, candidates, args.top_k, args.repeat, concurrency)
+            total_seconds = run["wall_seconds"]
+            name = f"{model}|c{candidates}|t{max_chars}|b{batch_size}|th{actual_threads}"
+            if len(concurrency_options) > 1 or concurrency > 1:
+                name += f"|p{concurrency}"
+            if batching:
+                name += f"|mb{micro_batch_ms:g}"
+            configs[name] = {
+                "model": model,
+                "candidates": candidates,
+                "max_chars": max_chars,
+                "batch_size": batch_size,
+                "threads": actual_threads,
+                "concurrency": concurrency,
+                "micro_batch_ms": micro_batch_ms if batching else None,
+                "latency": summarize_latency(run["samples"]),
+                "pairs_per_second": run["pairs"] / total_seconds if total_seconds else 0.0,
+                "ms_per_pair": total_seconds * 1000 / run["pairs"] if run["pairs"] else 0.0,
+                "agreement": agreement(run["rankings"], references[candidates]) if hasattr(reranker, "model") else None,
+            }
+            latency = configs[name]["latency"]
+            print(f"   {name}: p50 {latency['p50']:.1f}ms | p95 {latency['p95']:.1f}ms | "
+                  f"{configs[name]['pairs_per_second']:.1f} 配對/秒")
+        configure_micro_batching(reranker, None)
+        set_torch_threads(default_threads)
+
+    if not configs:
+        print("❌ 沒有可測試的模型")
+        return
+
+    meta = {
+        "label": args.label,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "questions_file": str(args.questions),
+        "questions": len(questions),
+        "top_k": args.top_k,
+        "repeat": args.repeat,
+        "default_threads": default_threads,
+        "load_seconds": load_seconds,
+    }
+    results = {"meta": meta, "configs": configs}
+    print_report(results)
+
+    output = args.output or DEFAULT_RESULTS_DIR / f"reranker_{datetime.now():%Y%m%d_%H%M%S}.json"
+    print(f"\n💾 結果已儲存: {save_results(results, output)}")
+
+    if args.compare:
+        baseline = load_results(args.compare)
+        print(f"\n📈 與 {args.compare} 比較：每次 rerank 延遲（毫秒）")
+        print(compare_summaries(flatten_for_compare(baseline), flatten_for_compare(results)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+"""
+檢索品質 vs 延遲基準測試 (Retrieval Benchmark)
+
+以標註好的黃金問題集（golden_set.jsonl：問題 → 相關的勞動基準法條號）評估每一種
+向量後端 × Reranker 設定的檢索品質與延遲：
+
+- 品質：recall@1 / @3 / @5、候選召回率（rerank 前所有候選的 recall）與 MRR
+- 延遲：向量搜尋與重排序的 p50 / p95（毫秒）
+
+語料可以是資料庫中的段落（--corpus db，可與 PL/pgSQL 函數比較），或由勞動基準法.pdf
+逐條切分（--corpus pdf，不需要資料庫）。資料庫段落沒有條號欄位，以文字比對找出段落所屬的法條。
+
+使用方式（在 lab05_RAG 目錄下執行）：
+    python -m benchmarks.retrieval_benchmark --offline
+    python -m benchmarks.retrieval_benchmark --corpus db --backend plpgsql --backend exact --backend ivf:nprobe=4 \\
+        --reranker none --reranker bge --reranker minilm --candidates 15 --candidates 30
+"""
+
+import io
+import re
+import sys
+import time
+import argparse
+import platform
+from contextlib import redirect_stdout
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+# 以 python -m 或直接執行皆可匯入 lab05_RAG 下的模組
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.pipeline_benchmark import DEFAULT_RESULTS_DIR, git_commit, load_questions
+from benchmarks.stats import summarize_latency, save_results, load_results, compare_summaries, format_table
+from benchmarks.vector_backends import VectorBackend, PostgresCosineBackend, create_backend
+
+BENCHMARK_DIR = Path(__file__).resolve().parent
+DEFAULT_GOLDEN_PATH = BENCHMARK_DIR / "golden_set.jsonl"
+RECALL_AT = (1, 3, 5)
+
+# Reranker 簡稱 → CrossEncoder 模型
+RERANKER_MODELS = {
+    "bge": "BAAI/bge-reranker-base",
+    "minilm": "cross-encoder/ms-marco-MiniLM-L-6-v2",
+}
+
+
+def _compact(text: str) -> str:
+    return re.sub(r"\s+", "", text)
+
+
+class ArticleMatcher:
+    """以文字比對找出一段內容屬於哪些法條（資料庫段落以 400 字切分，可能跨越多條）"""
+
+    def __init__(self, articles: List[Dict[str, Any]], window: int = 20, min_hits: int = 2):
+        """
+        Args:
+            articles (List[Dict[str, Any]]): load_law_articles 的結果
+            window (int): 比對用的片段長度（字元）
+            min_hits (int): 至少要有幾個片段只出現在同一條法條中才算涵蓋
+        """
+        # 去掉條號標題，只以條文本文比對
+        self.articles = [(a["article"], _compact(a["content"].split("條", 1)[1])) for a in articles]
+        self.window = window
+        self.min_hits = min_hits
+
+    def match(self, content: str) -> List[str]:
+        """
+        Args:
+            content (str): 段落內容
+
+        Returns:
+            List[str]: 段落涵蓋的條號，依在段落中出現的順序排列
+        """
+        text = _compact(content)
+        step = max(self.window // 4, 1)
+        hits: Dict[str, int] = {}
+        for begin in range(0, max(len(text) - self.window, 0) + 1, step):
+            piece = text[begin:begin + self.window]
+            matched = [article for article, body in self.articles if piece in body]
+            # 多條共用的語句（例如「經勞資會議同意後」）無法判斷歸屬，略過
+            if len(matched) == 1:
+                hits[matched[0]] = hits.get(matched[0], 0) + 1
+        return [article for article, count in hits.items() if count >= self.min_hits]
+
+
+def evaluate_ranking(ranked_articles: List[List[str]], relevant: Set[str]) -> Dict[str, float]:
+    """
+    計算單一問題的檢索品質（以結果名次計算，一個結果可能涵蓋多條法條）
+
+    Args:
+        ranked_articles (List[List[str]]): 依名次排列的每個結果所涵蓋的條號
+        relevant (Set[str]): 相關的條號
+
+    Returns:
+        Dict[str, float]: recall@k（百分比）、candidate_recall 與 mrr（百分比）
+    """
+    metrics = {}
+    for k in RECALL_AT:
+        found = {article for articles in ranked_articles[:k] for article in articles}
+        metrics[f"recall@{k}"] = len(found & relevant) / len(relevant) * 100
+    found = {article for articles in ranked_articles for article in articles}
+    metrics["candidate_recall"] = len(found & relevant) / len(relevant) * 100
+    first_hit = next((rank for rank, articles in enumerate(ranked_articles, 1) if relevant & set(articles)), None)
+    metrics["mrr"] = 100.0 / first_hit if first_hit else 0.0
+    return metrics
+
+
+def load_corpus(corpus: str, db_config: Optional[Dict[str, Any]], articles: List[Dict[str, Any]],
+                matcher: ArticleMatcher) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+    """
+    載入要建立索引的語料
+
+    Args:
+        corpus (str): "db"（資料庫中的段落與向量）或 "pdf"（逐條法條，現場計算 embedding）
+        db_config (Optional[Dict[str, Any]]): 資料庫設定
+        articles (List[Dict[str, Any]]): 逐條法條
+        matcher (ArticleMatcher): 條號比對器
+
+    Returns:
+        Tuple[List[Dict[str, Any]], np.ndarray]: 文件（含 id、content、articles）與 embedding 矩陣
+    """
+    if corpus == "db":
+        rows = PostgresCosineBackend(db_config).load_documents()
+        documents = [{"id": row["id"], "content": row["content"], "articles": matcher.match(row["content"])}
+                     for row in rows]
+        return documents, np.array([row["embedding"] for row in rows], dtype=np.float32)
+
+    from benchmarks.standins import InMemoryVectorStore
+    from utils.ai_client import get_embedding_for_content
+
+    store = InMemoryVectorStore.build(articles, get_embedding_for_content)
+    documents = [{"id": a["id"], "content": a["content"], "articles": [a["article"]]} for a in store.documents]
+    return documents, store.backend.matrix
+
+
+def create_reranker(spec: str):
+    """
+    依名稱建立 Reranker：none、lexical、bge、minilm，或「model:<CrossEncoder 模型路徑>」
+
+    Returns:
+        具有 rerank(query, results, top_k) 的物件；none 回傳 None
+    """
+    if spec == "none":
+        return None
+    if spec == "lexical":
+        from benchmarks.standins import LexicalReranker
+        return LexicalReranker()
+
+    from query_test import ChineseReranker
+    model_path = spec.split(":", 1)[1] if spec.startswith("model:") else RERANKER_MODELS.get(spec)
+    if not model_path:
+        raise ValueError(f"未知的 Reranker: {spec}")
+    reranker = ChineseReranker(model_path=model_path)
+    if reranker.model is None:
+        raise RuntimeError(f"無法載入 Reranker 模型: {model_path}")
+    return reranker
+
+
+def embed_questions(questions: List[Dict[str, Any]], rewrite: bool = False) -> Tuple[List[str], np.ndarray, List[float]]:
+    """
+    計算所有問題的查詢向量（可先經過 LaborLawAgent 的查詢改寫）
+
+    Returns:
+        Tuple[List[str], np.ndarray, List[float]]: 實際搜尋的查詢文字、查詢向量、每次 embedding 的秒數
+    """
+    from utils.ai_client import get_embedding_for_content
+
+    rewriter = None
+    if rewrite:
+        from query_test import LaborLawAgent
+        rewriter = LaborLawAgent(reranker=object())  # 只使用查詢改寫，不需要載入 Reranker 模型
+
+    queries, vectors, seconds = [], [], []
+    for item in questions:
+        query = item["question"]
+        if rewriter:
+            with redirect_stdout(io.StringIO()):
+                query = rewriter.rewrite_query(query)
+        start = time.perf_counter()
+        vector = get_embedding_for_content(query)
+        seconds.append(time.perf_counter() - start)
+        if not vector:
+            raise RuntimeError(f"無法取得查詢 embedding: {query}")
+        queries.append(query)
+        vectors.append(vector)
+    return queries, np.array(vectors, dtype=np.float32), seconds
+
+
+def run_benchmark(backends: Dict[str, VectorBackend], rerankers: Dict[str, Any], documents: List[Dict[str, Any]],
+                  questions: List[Dict[str, Any]], queries: List[str], query_vectors: np.ndarray,
+                  candidates: List[int], top_k: int = 5, repeat: int = 1) -> Dict[str, Any]:
+    """
+    對每個後端 × 候選數 × Reranker 組合執行所有問題
+
+    Args:
+        backends (Dict[str, VectorBackend]): 已建置好的後端，名稱 → 後端
+        rerankers (Dict[str, Any]): Reranker 名稱 → 實例（None 代表不重排序）
+        documents (List[Dict[str, Any]]): 語料文件，id 對應後端回傳的 id
+        questions (List[Dict[str, Any]]): 黃金問題集
+        queries (List[str]): 實際搜尋的查詢文字
+        query_vectors (np.ndarray): 查詢向量
+        candidates (List[int]): 向量搜尋取回的候選數
+        top_k (int): 重排序後保留的數量
+        repeat (int): 每個問題重複搜尋的次數（品質以第一次為準，延遲取所有樣本）
+
+    Returns:
+        Dict[str, Any]: configs（每個組合的品質與延遲）與 questions（每題每組合的名次明細）
+    """
+    documents_by_id = {document["id"]: document for document in documents}
+    configs, details = {}, []
+
+    for backend_name, backend in backends.items():
+        for limit in candidates:
+            search_seconds = []
+            rerank_seconds = {name: [] for name in rerankers}
+            quality = {name: [] for name in rerankers}
+            for item, query, vector in zip(questions, queries, query_vectors):
+                relevant = set(item["relevant_articles"])
+                for round_index in range(repeat):
+                    start = time.perf_counter()
+                    ids, scores = backend.search(vector, limit)
+                    search_seconds.append(time.perf_counter() - start)
+                    results = [{**documents_by_id[doc_id], "similarity": float(score)}
+                               for doc_id, score in zip(ids.tolist(), scores)]
+
+                    for reranker_name, reranker in rerankers.items():
+                        start = time.perf_counter()
+                        if reranker is None:
+                            ranked = results[:top_k]
+                        else:
+                            with redirect_stdout(io.StringIO()):
+                                ranked = reranker.rerank(query, [dict(r) for r in results], top_k=top_k)
+                        rerank_seconds[reranker_name].append(time.perf_counter() - start)
+                        if round_index:
+                            continue
+
+                        metrics = evaluate_ranking([r["articles"] for r in ranked], relevant)
+                        # 候選召回率以 rerank 前的全部候選計算
+                        metrics["candidate_recall"] = evaluate_ranking([r["articles"] for r in results],
+                                                                       relevant)["candidate_recall"]
+                        quality[reranker_name].append(metrics)
+                        details.append({
+                            "id": item["id"],
+                            "config": f"{backend_name}|{reranker_name}|{limit}",
+                            "query": query,
+                            "relevant": item["relevant_articles"],
+                            "ranked_articles": [r["articles"] for r in ranked],
+                            **metrics,
+                        })
+
+            search_summary = summarize_latency(search_seconds)
+            for reranker_name in rerankers:
+                totals = [s + r for s, r in zip(search_seconds, rerank_seconds[reranker_name])]
+                configs[f"{backend_name}|{reranker_name}|{limit}"] = {
+                    "backend": backend_name,
+                    "reranker": reranker_name,
+                    "candidates": limit,
+                    "quality": {metric: float(np.mean([m[metric] for m in quality[reranker_name]]))
+                                for metric in quality[reranker_name][0]},
+                    "search": search_summary,
+                    "rerank": summarize_latency(rerank_seconds[reranker_name]),
+                    "total": summarize_latency(totals),
+                }
+    return {"configs": configs, "questions": details}
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    """顯示每個組合的品質與延遲"""
+    rows = []
+    for config in results["configs"].values():
+        quality = config["quality"]
+        rows.append([
+            config["backend"], config["reranker"], config["candidates"],
+            *[f"{quality[f'recall@{k}']:.1f}" for k in RECALL_AT],
+            f"{quality['candidate_recall']:.1f}", f"{quality['mrr']:.1f}",
+            f"{config['search']['p50']:.2f}", f"{config['search']['p95']:.2f}",
+            f"{config['rerank']['p50']:.2f}", f"{config['rerank']['p95']:.2f}",
+        ])
+    print("\n🎯 檢索品質（%）與延遲（毫秒）")
+    print(format_table(["後端", "Reranker", "候選數", *[f"R@{k}" for k in RECALL_AT], "候選R", "MRR",
+                        "搜尋p50", "搜尋p95", "重排p50", "重排p95"], rows))
+
+    rows = [[name, f"{info['build_seconds'] * 1000:.1f}", f"{info['memory_bytes'] / 1024 / 1024:.2f}"] for name, info in results["meta"]["backends"].items()]
+    print("\n🏗️ 後端建置")
+    print(format_table(["後端", "建置ms", "記憶體MB"], rows))
+
+
+def flatten_for_compare(results: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """將每個組合的品質與延遲攤平成 compare_summaries 可比較的格式"""
+    return {name: {**config["quality"], "search_p50": config["search"]["p50"], "total_p95": config["total"]["p95"]}
+            for name, config in results["configs"].items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="檢索品質 vs 延遲基準測試（黃金問題集）")
+    parser.add_argument("--golden", type=Path, default=DEFAULT_GOLDEN_PATH, help="黃金問題集（JSONL）")
+    parser.add_argument("--corpus", choices=["db", "pdf"], default="db", help="語料來源：資料庫段落或 PDF 逐條法條")
+    parser.add_argument("--backend", action="append", default=None,
+                        help="向量後端，可重複指定，例如 plpgsql、exact、ivf:nlist=16,nprobe=2、hnsw:m=16,ef_search=32")
+    parser.add_argument("--reranker", action="append", default=None,
+                        help="Reranker 設定，可重複指定：none、lexical、bge、minilm 或 model:<路徑>")
+    parser.add_argument("--candidates", action="append", type=int, default=None, help="向量搜尋的候選數，可重複指定")
+    parser.add_argument("--top-k", type=int, default=5, help="重排序後保留的數量")
+    parser.add_argument("--repeat", type=int, default=3, help="每個問題重複搜尋的次數（用於延遲統計）")
+    parser.add_argument("--rewrite", action="store_true", help="搜尋前先以 LLM 改寫問題（與 agent 相同）")
+    parser.add_argument("--output", type=Path, default=None, help="結果 JSON 檔（預設存到 benchmarks/results/）")
+    parser.add_argument("--label", default="", help="這次測試的說明，記錄在結果中")
+    parser.add_argument("--compare", type=Path, default=None, help="與先前保存的結果比較")
+    parser.add_argument("--offline", action="store_true",
+                        help="使用模擬 AOAI 服務計算 embedding，並以 PDF 逐條法條為語料（不需要資料庫與 Azure）")
+    args = parser.parse_args()
+
+    if args.offline:
+        from benchmarks.standins import start_fake_aoai_server
+        from fake_aoai_server import FakeServerConfig, LatencySpec
+        args.corpus = "pdf"
+        url = start_fake_aoai_server(FakeServerConfig(embedding_latency=LatencySpec.parse("fixed:0")))
+        print(f"🧪 模擬 AOAI 服務: {url}")
+
+    backend_specs = args.backend or (["plpgsql", "exact", "ivf:nprobe=2"] if args.corpus == "db"
+                                     else ["exact", "ivf:nlist=16,nprobe=2"])
+    reranker_specs = args.reranker or ["none", "lexical", "bge"]
+    candidates = args.candidates or [15, 30]
+
+    from dotenv import load_dotenv
+    from utils.database_config import get_database_config
+    from benchmarks.standins import load_law_articles
+
+    load_dotenv()
+    db_config = get_database_config() if args.corpus == "db" else None
+    articles = load_law_articles()
+    matcher = ArticleMatcher(articles)
+
+    print(f"📚 載入語料（{args.corpus}）...")
+    documents, embeddings = load_corpus(args.corpus, db_config, articles, matcher)
+    print(f"✅ 共 {len(documents)} 個段落")
+
+    backends, backend_info = {}, {}
+    for spec in backend_specs:
+        if spec.startswith("plpgsql") and args.corpus != "db":
+            print(f"⚠️ 略過 {spec}：PL/pgSQL 後端需要 --corpus db")
+            continue
+        try:
+            backend = create_backend(spec, db_config)
+        except ImportError as e:
+            print(f"⚠️ 略過 {spec}：缺少套件 ({e})")
+            continue
+        build_seconds = 0.0
+        if not isinstance(backend, PostgresCosineBackend):
+            build_seconds = backend.build(np.array([document["id"] for document in documents]), embeddings)
+        backends[spec] = backend
+        backend_info[spec] = {**backend.describe(), "build_seconds": build_seconds, "memory_bytes": backend.memory_bytes}
+
+    rerankers = {}
+    for spec in reranker_specs:
+        try:
+            rerankers[spec] = create_reranker(spec)
+        except Exception as e:
+            print(f"⚠️ 略過 Reranker {spec}：{e}")
+
+    questions = load_questions(args.golden)
+    print(f"🔢 計算 {len(questions)} 個問題的查詢向量...")
+    queries, query_vectors, embed_seconds = embed_questions(questions, rewrite=args.rewrite)
+
+    print(f"🚀 開始測試：{len(backends)} 個後端 × {len(rerankers)} 個 Reranker × {len(candidates)} 種候選數")
+    results = run_benchmark(backends, rerankers, documents, questions, queries, query_vectors,
+                            candidates=candidates, top_k=args.top_k, repeat=args.repeat)
+
+    meta = {
+        "label": args.label,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "golden_file": str(args.golden),
+        "corpus": args.corpus,
+        "documents": len(documents),
+        "offline": args.offline,
+        "rewrite": args.rewrite,
+        "top_k": args.top_k,
+        "repeat": args.repeat,
+        "backends": backend_info,
+        "embed": summarize_latency(embed_seconds),
+    }
+    results = {"meta": meta, **results}
+    print_report(results)
+
+    output = args.output or DEFAULT_RESULTS_DIR / f"retrieval_{datetime.now():%Y%m%d_%H%M%S}.json"
+    print(f"\n💾 結果已儲存: {save_results(results, output)}")
+
+    if args.compare:
+        baseline = load_results(args.compare)
+        print(f"\n📈 與 {args.compare} 比較")
+        print(compare_summaries(flatten_for_compare(baseline), flatten_for_compare(results),
+                                metrics=("recall@5", "mrr", "search_p50", "total_p95")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+向量搜尋規模基準測試 (Scaling Benchmark)
+
+以合成語料（synthetic_corpus.py）在不同資料量下比較各向量後端：
+
+- 查詢延遲 p50 / p95 / p99（毫秒）與每秒查詢數
+- 建置時間、索引記憶體、建置期間的 Python 配置峰值（tracemalloc）與行程 RSS 變化
+- 近似索引相對於精確搜尋的 recall@k
+
+找出每種做法在什麼規模開始超出延遲預算、記憶體上限或逾時（「斷點」），
+某個後端在較小規模就失敗後，更大的規模會直接略過。
+
+使用方式（在 lab05_RAG 目錄下執行）：
+    python -m benchmarks.scaling_benchmark --rows 10000 --rows 100000
+    python -m benchmarks.scaling_benchmark --rows 10000 --rows 100000 --rows 1000000 \\
+        --backend plpgsql --backend exact --backend ivf:nprobe=8 --backend hnsw --max-memory-gb 16
+"""
+
+import gc
+import os
+import sys
+import time
+import argparse
+import platform
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+# 以 python -m 或直接執行皆可匯入 lab05_RAG 下的模組
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.pipeline_benchmark import DEFAULT_RESULTS_DIR, git_commit
+from benchmarks.stats import summarize_latency, save_results, load_results, compare_summaries, format_table
+from benchmarks.synthetic_corpus import DEFAULT_DATA_DIR, DEFAULT_DIM, generate_corpus, make_queries, exact_neighbors
+from benchmarks.vector_backends import PostgresCosineBackend, create_backend
+
+DEFAULT_ROWS = [10_000, 100_000, 1_000_000]
+
+
+def current_rss_bytes() -> int:
+    """目前行程的常駐記憶體（RSS），不支援的平台回傳 0"""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def estimate_memory_bytes(spec: str, rows: int, dim: int) -> int:
+    """
+    估計後端建置時需要的記憶體（用來在超出上限前略過，避免整台機器被拖垮）
+
+    Args:
+        spec (str): 後端設定字串
+        rows (int): 筆數
+        dim (int): 維度
+    """
+    vectors = rows * dim * 4
+    name = spec.split(":", 1)[0]
+    if name == "plpgsql":
+        return 0
+    if name == "hnsw":
+        return vectors * 2 + rows * 32 * 2 * 4  # 正規化副本 + faiss 內部的向量與連結
+    return vectors * 2  # 正規化副本 + 排序後的副本 / 查詢時的暫存
+
+
+def prepare_table(backend: PostgresCosineBackend, corpus: np.ndarray, reuse: bool) -> float:
+    """寫入合成資料表；reuse 時若筆數相同則直接沿用，回傳寫入秒數"""
+    if reuse and backend.count_rows() == len(corpus):
+        print(f"   ♻️ 沿用既有資料表 {backend.table}")
+        return 0.0
+    return backend.build(np.arange(len(corpus)), corpus)
+
+
+def run_backend(spec: str, corpus: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int,
+                db_config: Optional[Dict[str, Any]], args) -> Dict[str, Any]:
+    """
+    建置單一後端並執行所有查詢
+
+    Returns:
+        Dict[str, Any]: 建置時間、記憶體、延遲分佈與 recall；失敗時 status 不是 "ok"
+    """
+    rows, dim = corpus.shape
+    record: Dict[str, Any] = {"backend": spec, "rows": rows, "dim": dim, "status": "ok"}
+
+    table = f"synthetic_embeddings_{rows}_{dim}"
+    try:
+        backend = create_backend(spec, db_config, table=table, statement_timeout_ms=int(args.query_timeout * 1000))
+    except ImportError as e:
+        return {**record, "status": "skipped", "reason": f"缺少套件 ({e})"}
+
+    rss_before = current_rss_bytes()
+    tracemalloc.start()
+    try:
+        if isinstance(backend, PostgresCosineBackend):
+            record["build_seconds"] = prepare_table(backend, corpus, args.reuse_tables)
+        else:
+            record["build_seconds"] = backend.build(np.arange(rows), corpus)
+        record["build_peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+    except MemoryError:
+        return {**record, "status": "failed", "reason": "建置時記憶體不足"}
+    except Exception as e:
+        # 例如資料庫無法連線：屬於環境問題，不視為規模斷點
+        print(f"   ❌ 建置失敗: {e}")
+        return {**record, "status": "error", "reason": str(e).strip().splitlines()[0]}
+    finally:
+        tracemalloc.stop()
+    record["rss_delta_mb"] = (current_rss_bytes() - rss_before) / 1024 ** 2
+    record["index_mb"] = (backend.table_bytes() if isinstance(backend, PostgresCosineBackend)
+                          else backend.memory_bytes) / 1024 ** 2
+    record["config"] = backend.describe()
+
+    latencies, hits = [], []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        try:
+            ids, _ = backend.search(query, k)
+        except Exception as e:
+            record.update(status="timeout" if "timeout" in str(e).lower() or "cancel" in str(e).lower() else "failed",
+                          reason=str(e).strip().splitlines()[0])
+            break
+        elapsed = time.perf_counter() - start
+        latencies.append(elapsed)
+        hits.append(len(set(ids.tolist()) & set(expected.tolist())) / k)
+        if elapsed > args.query_timeout:
+            record.update(status="timeout", reason=f"單一查詢 {elapsed:.1f} 秒，超過 {args.query_timeout} 秒")
+            break
+
+    record["latency"] = summarize_latency(latencies)
+    record["qps"] = len(latencies) / sum(latencies) if latencies else 0.0
+    record[f"recall@{k}"] = float(np.mean(hits) * 100) if hits else None
+    if record["status"] == "ok" and record["latency"]["p95"] > args.latency_budget_ms:
+        record["over_budget"] = True
+
+    del backend
+    gc.collect()
+    return record
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    """依規模列出每個後端的延遲、建置與記憶體"""
+    k = results["meta"]["k"]
+    rows = []
+    for run in results["runs"]:
+        latency = run.get("latency", {})
+        if run["status"] in ("skipped", "error"):
+            rows.append([f"{run['rows']:,}", run["backend"], f"{'略過' if run['status'] == 'skipped' else '錯誤'}：{run['reason']}", "", "", "", "", "", "", ""])
+            continue
+        status = run["status"] if run["status"] != "ok" else ("超出預算" if run.get("over_budget") else "ok")
+        recall = run.get(f"recall@{k}")
+        rows.append([
+            f"{run['rows']:,}", run["backend"], status,
+            f"{latency['p50']:.2f}" if latency.get("count") else "-",
+            f"{latency['p95']:.2f}" if latency.get("count") else "-",
+            f"{run['qps']:.1f}",
+            "-" if recall is None else f"{recall:.1f}",
+            f"{run.get('build_seconds', 0):.2f}",
+            f"{run.get('index_mb', 0):.1f}",
+            f"{run.get('build_peak_mb', 0):.1f}",
+        ])
+    print(f"\n📏 規模測試（延遲毫秒、記憶體 MB、recall@{k} 以精確搜尋為標準答案）")
+    print(format_table(["筆數", "後端", "狀態", "p50", "p95", "QPS", f"R@{k}", "建置秒", "索引MB", "建置峰值MB"], rows))
+
+    for title, key in (("⚠️ 首次超出延遲預算", "over_budget"), ("💥 斷點（逾時、失敗或記憶體不足）", "breakpoints")):
+        if results[key]:
+            print(f"\n{title}")
+            for backend, info in results[key].items():
+                print(f"   {backend}: {info['rows']:,} 筆 — {info['reason']}")
+
+
+def flatten_for_compare(results: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """將每個後端 × 規模攤平成 compare_summaries 可比較的格式"""
+    flat = {}
+    for run in results["runs"]:
+        latency = run.get("latency", {})
+        if latency.get("count"):
+            flat[f"{run['backend']}@{run['rows']}"] = {
+                "p50": latency["p50"], "p95": latency["p95"],
+                "build_s": run.get("build_seconds", 0.0), "index_mb": run.get("index_mb", 0.0),
+            }
+    return flat
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量搜尋後端的規模基準測試（合成語料）")
+    parser.add_argument("--rows", action="append", type=int, default=None, help="語料筆數，可重複指定（預設 1 萬、10 萬、100 萬）")
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM, help="向量維度")
+    parser.add_argument("--clusters", type=int, default=256, help="合成語料的主題群集數")
+    parser.add_argument("--backend", action="append", default=None,
+                        help="向量後端，可重複指定，例如 plpgsql、exact、ivf:nprobe=8、hnsw:m=16,ef_search=64")
+    parser.add_argument("--queries", type=int, default=50, help="查詢數")
+    parser.add_argument("--k", type=int, default=10, help="每次查詢取回的數量（recall@k）")
+    parser.add_argument("--latency-budget-ms", type=float, default=200.0, help="p95 延遲預算（毫秒），超過會標示")
+    parser.add_argument("--query-timeout", type=float, default=30.0, help="單一查詢的逾時秒數，超過視為斷點")
+    parser.add_argument("--max-memory-gb", type=float, default=4.0, help="估計記憶體超過此值的後端會被略過")
+    parser.add_argument("--reuse-tables", action="store_true", help="資料表已存在且筆數相同時不重新寫入")
+    parser.add_argument("--data-dir", type=Path, default=DEFAULT_DATA_DIR, help="合成語料 .npy 的存放目錄")
+    parser.add_argument("--output", type=Path, default=None, help="結果 JSON 檔（預設存到 benchmarks/results/）")
+    parser.add_argument("--label", default="", help="這次測試的說明，記錄在結果中")
+    parser.add_argument("--compare", type=Path, default=None, help="與先前保存的結果比較")
+    args = parser.parse_args()
+
+    row_counts = sorted(args.rows or DEFAULT_ROWS)
+    specs = args.backend or ["exact", "ivf:nprobe=8", "hnsw"]
+
+    db_config = None
+    if any(spec.startswith("plpgsql") for spec in specs):
+        from dotenv import load_dotenv
+        from utils.database_config import get_database_config
+        load_dotenv()
+        db_config = get_database_config()
+
+    runs: List[Dict[str, Any]] = []
+    breakpoints: Dict[str, Dict[str, Any]] = {}
+    over_budget: Dict[str, Dict[str, Any]] = {}
+    unavailable: Dict[str, str] = {}
+    for rows in row_counts:
+        print(f"\n📦 產生 / 讀取合成語料：{rows:,} × {args.dim}")
+        start = time.perf_counter()
+        corpus = generate_corpus(rows, args.dim, args.clusters, data_dir=args.data_dir)
+        queries = make_queries(corpus, min(args.queries, rows))
+        truth = exact_neighbors(corpus, queries, args.k)
+        print(f"   完成，耗時 {time.perf_counter() - start:.1f} 秒")
+
+        for spec in specs:
+            if spec in unavailable:
+                runs.append({"backend": spec, "rows": rows, "status": "skipped", "reason": unavailable[spec]})
+                continue
+            if spec in breakpoints:
+                runs.append({"backend": spec, "rows": rows, "status": "skipped",
+                             "reason": f"已在 {breakpoints[spec]['rows']:,} 筆失敗"})
+                continue
+            estimate = estimate_memory_bytes(spec, rows, args.dim) / 1024 ** 3
+            if estimate > args.max_memory_gb:
+                reason = f"估計需要 {estimate:.1f} GB，超過上限 {args.max_memory_gb} GB"
+                runs.append({"backend": spec, "rows": rows, "status": "skipped", "reason": reason})
+                breakpoints[spec] = {"rows": rows, "reason": reason}
+                continue
+
+            print(f"🚀 {spec} @ {rows:,}")
+            record = run_backend(spec, corpus, queries, truth, args.k, db_config, args)
+            runs.append(record)
+            latency = record.get("latency", {})
+            if latency.get("count"):
+                print(f"   p50 {latency['p50']:.2f}ms | p95 {latency['p95']:.2f}ms | 建置 {record['build_seconds']:.2f}s"
+                      f" | {record['status']}")
+            if record["status"] == "skipped":
+                unavailable[spec] = record["reason"]
+            if record["status"] in ("timeout", "failed"):
+                breakpoints[spec] = {"rows": rows, "reason": record.get("reason", record["status"])}
+            elif record.get("over_budget") and spec not in over_budget:
+                # 只超出延遲預算時仍繼續測更大的規模
+                over_budget[spec] = {"rows": rows, "reason": f"p95 {latency['p95']:.1f}ms 超過預算 {args.latency_budget_ms}ms"}
+
+        del corpus
+        gc.collect()
+
+    meta = {
+        "label": args.label,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "dim": args.dim,
+        "clusters": args.clusters,
+        "queries": args.queries,
+        "k": args.k,
+        "latency_budget_ms": args.latency_budget_ms,
+        "query_timeout": args.query_timeout,
+        "max_memory_gb": args.max_memory_gb,
+    }
+    results = {"meta": meta, "runs": runs, "breakpoints": breakpoints, "over_budget": over_budget}
+    print_report(results)
+
+    output = args.output or DEFAULT_RESULTS_DIR / f"scaling_{datetime.now():%Y%m%d_%H%M%S}.json"
+    print(f"\n💾 結果已儲存: {save_results(results, output)}")
+
+    if args.compare:
+        baseline = load_results(args.compare)
+        print(f"\n📈 與 {args.compare} 比較")
+        print(compare_summaries(flatten_for_compare(baseline), flatten_for_compare(results),
+                                metrics=("p50", "p95", "build_s", "index_mb")))
+
+
+if __name__ == "__main__":
+    main()
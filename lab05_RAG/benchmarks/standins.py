@@ -0,0 +1,203 @@
+"""
+基準測試用的本地替身 (Stand-ins)
+
+讓 LaborLawAgent 的完整流程可以在沒有 Azure、PostgreSQL、Tavily 與 Reranker 模型的環境下執行：
+
+1. 模擬 AOAI 服務：在背景執行緒啟動 fake_aoai_server，並設定 FAKE_AOAI_URL
+2. 記憶體向量庫：從勞動基準法.pdf 切出逐條法條，以 NumPy 精確搜尋（或 vector_backends 中的其他後端）
+3. 字元重疊 Reranker：不需要下載模型，可設定每個文件的模擬推理時間
+4. 模擬網路搜尋：回傳固定格式的結果，可設定延遲
+"""
+
+import os
+import re
+import time
+import socket
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.vector_backends import NumpyExactBackend, VectorBackend
+
+LAB_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_PDF_PATH = LAB_DIR / "勞動基準法.pdf"
+
+# 法條標題（例：「第 24 條」、「第 9-1 條」）獨立成一行
+ARTICLE_PATTERN = re.compile(r"^\s*第\s*(\d+(?:-\d+)?)\s*條\s*$", re.M)
+CHAPTER_PATTERN = re.compile(r"^\s*第\s*[一二三四五六七八九十]+\s*章.*$", re.M)
+
+
+def load_law_articles(pdf_path: Path = DEFAULT_PDF_PATH) -> List[Dict[str, Any]]:
+    """
+    讀取勞動基準法 PDF，依法條切分成段落
+
+    Args:
+        pdf_path (Path): PDF 檔案路徑
+
+    Returns:
+        List[Dict[str, Any]]: 每條法條一筆，包含 id、article（條號，例如 "24"、"9-1"）與 content
+    """
+    import PyPDF2
+
+    with open(pdf_path, "rb") as file:
+        reader = PyPDF2.PdfReader(file)
+        text = "\n".join(page.extract_text() for page in reader.pages)
+
+    matches = list(ARTICLE_PATTERN.finditer(text))
+    articles = []
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        body = CHAPTER_PATTERN.sub("", text[match.end():end])
+        # PDF 會在句子中間換行，中文直接接回；段落編號後的多個空白縮成一個
+        body = re.sub(r"[ \t]*\n[ \t]*", "", body)
+        body = re.sub(r"[ \t]{2,}", " ", body).strip()
+        articles.append({
+            "id": i + 1,
+            "article": match.group(1),
+            "content": f"第 {match.group(1)} 條 {body}",
+        })
+    return articles
+
+
+class InMemoryVectorStore:
+    """以記憶體向量後端搜尋，回傳與資料庫查詢相同欄位的結果"""
+
+    def __init__(self, documents: List[Dict[str, Any]], embeddings: np.ndarray, backend: Optional[VectorBackend] = None):
+        """
+        Args:
+            documents (List[Dict[str, Any]]): 文件列表，需包含 id 與 content
+            embeddings (np.ndarray): 與文件順序相同的 embedding 矩陣
+            backend (Optional[VectorBackend]): 向量後端，未指定時使用精確搜尋
+        """
+        self.documents = documents
+        self.backend = backend or NumpyExactBackend()
+        self.backend.build(np.arange(len(documents)), np.asarray(embeddings, dtype=np.float32))
+        self.created_at = datetime.now()
+
+    @classmethod
+    def build(cls, documents: List[Dict[str, Any]], embed_fn: Callable[[str], List[float]],
+              max_workers: int = 8, backend: Optional[VectorBackend] = None) -> "InMemoryVectorStore":
+        """
+        以 embed_fn 並行計算所有文件的 embedding 並建立向量庫（embedding 失敗的文件會被略過）
+
+        Args:
+            documents (List[Dict[str, Any]]): 文件列表
+            embed_fn (Callable[[str], List[float]]): 取得單一文字 embedding 的函數
+            max_workers (int): 並行的執行緒數
+            backend (Optional[VectorBackend]): 向量後端，未指定時使用精確搜尋
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            vectors = list(executor.map(lambda document: embed_fn(document["content"]), documents))
+        kept = [(document, vector) for document, vector in zip(documents, vectors) if vector]
+        if not kept:
+            raise RuntimeError("所有文件的 embedding 都失敗，無法建立向量庫")
+        return cls([document for document, _ in kept], np.array([vector for _, vector in kept]), backend=backend)
+
+    def search(self, query_embedding: List[float], limit: int) -> List[Dict[str, Any]]:
+        """
+        找出與查詢向量最相似的文件（介面與 LaborLawAgent._search_database 相同）
+
+        Args:
+            query_embedding (List[float]): 查詢向量
+            limit (int): 回傳數量
+
+        Returns:
+            List[Dict[str, Any]]: 依相似度由高到低排序的結果
+        """
+        positions, scores = self.backend.search(np.asarray(query_embedding, dtype=np.float32), limit)
+        return [{
+            "id": self.documents[i]["id"],
+            "content": self.documents[i]["content"],
+            "created_at": self.created_at,
+            "similarity": float(score),
+            "char_count": len(self.documents[i]["content"]),
+        } for i, score in zip(positions, scores)]
+
+
+def _char_bigrams(text: str) -> set:
+    text = re.sub(r"\s+", "", text)
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class LexicalReranker:
+    """以字元二元組重疊率排序的 Reranker 替身（介面與 ChineseReranker.rerank 相同）"""
+
+    def __init__(self, seconds_per_doc: float = 0.0):
+        """
+        Args:
+            seconds_per_doc (float): 每個文件的模擬推理時間（秒），用來模擬模型的 CPU 成本
+        """
+        self.seconds_per_doc = seconds_per_doc
+
+    def rerank(self, query: str, results: List[Dict], top_k: int = 5) -> List[Dict]:
+        query_grams = _char_bigrams(query)
+        for result in results:
+            content_grams = _char_bigrams(result.get("content", ""))
+            result["rerank_score"] = len(query_grams & content_grams) / max(len(query_grams), 1)
+        if self.seconds_per_doc > 0:
+            time.sleep(self.seconds_per_doc * len(results))
+        return sorted(results, key=lambda x: x.get("rerank_score", 0), reverse=True)[:top_k]
+
+
+def make_fake_web_search(latency: float = 0.0) -> Callable[..., Dict[str, Any]]:
+    """
+    建立模擬的網路搜尋工具（回傳格式與 LaborLawAgent._tool_web_search 相同）
+
+    Args:
+        latency (float): 每次搜尋的模擬延遲（秒）
+    """
+    def fake_web_search(query: str, max_results: int = 5) -> Dict[str, Any]:
+        if latency > 0:
+            time.sleep(latency)
+        results = [{
+            "title": f"模擬搜尋結果 {i + 1}",
+            "content": f"關於「{query}」的補充資訊（模擬資料）",
+            "url": f"https://example.com/search/{i + 1}",
+            "score": round(1.0 - i * 0.1, 2),
+        } for i in range(max_results)]
+        return {"success": True, "results": results, "count": len(results), "query": query, "cache_status": "miss"}
+
+    return fake_web_search
+
+
+def _find_free_port(host: str) -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def start_fake_aoai_server(config=None, host: str = "127.0.0.1", port: Optional[int] = None,
+                           timeout: float = 10.0) -> str:
+    """
+    在背景執行緒啟動模擬 AOAI 服務，並設定 FAKE_AOAI_URL 讓 utils/ai_client 改連到它
+
+    Args:
+        config (FakeServerConfig | None): 模擬服務設定，未指定時使用預設值（無延遲、無錯誤）
+        host (str): 監聽位址
+        port (Optional[int]): 監聽埠號，未指定時自動選擇可用的埠
+        timeout (float): 等待服務啟動的秒數
+
+    Returns:
+        str: 模擬服務的網址
+    """
+    import uvicorn
+    from fake_aoai_server import FakeServerConfig, create_app
+
+    port = port or _find_free_port(host)
+    server = uvicorn.Server(uvicorn.Config(create_app(config or FakeServerConfig()), host=host, port=port,
+                                           log_level="warning"))
+    threading.Thread(target=server.run, name="fake-aoai-server", daemon=True).start()
+
+    deadline = time.monotonic() + timeout
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("模擬 AOAI 服務啟動逾時")
+        time.sleep(0.05)
+
+    url = f"http://{host}:{port}"
+    os.environ["FAKE_AOAI_URL"] = url
+    return url
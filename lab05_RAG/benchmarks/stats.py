@@ -0,0 +1,90 @@
+"""
+基準測試的統計與結果比較工具
+"""
+
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+
+def summarize_values(values: Iterable[float]) -> Dict[str, float]:
+    """
+    計算一組數值的分佈摘要
+
+    Args:
+        values (Iterable[float]): 數值序列
+
+    Returns:
+        Dict[str, float]: count、mean、p50、p95、p99、max；沒有資料時只有 count
+    """
+    array = np.asarray(list(values), dtype=np.float64)
+    if array.size == 0:
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(array, [50, 95, 99])
+    return {
+        "count": int(array.size),
+        "mean": float(array.mean()),
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+        "max": float(array.max()),
+    }
+
+
+def summarize_latency(seconds: Iterable[float]) -> Dict[str, float]:
+    """將以秒為單位的延遲樣本轉成毫秒後計算分佈摘要"""
+    return summarize_values(value * 1000 for value in seconds)
+
+
+def save_results(results: Dict[str, Any], path: Path) -> Path:
+    """將測試結果寫成 JSON 檔"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(results, file, ensure_ascii=False, indent=2, default=str)
+    return path
+
+
+def load_results(path: Path) -> Dict[str, Any]:
+    """讀取先前保存的測試結果"""
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def format_table(headers: List[str], rows: List[List[Any]]) -> str:
+    """將資料排成對齊的文字表格"""
+    cells = [[str(cell) for cell in row] for row in [headers, *rows]]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(headers))]
+    lines = ["  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in cells]
+    lines.insert(1, "  ".join("-" * width for width in widths))
+    return "\n".join(lines)
+
+
+def compare_summaries(baseline: Dict[str, Dict[str, float]], current: Dict[str, Dict[str, float]],
+                      metrics: tuple = ("p50", "p95", "p99")) -> str:
+    """
+    比較兩次測試的分佈摘要（例如各階段延遲），列出數值與變化百分比
+
+    Args:
+        baseline (Dict[str, Dict[str, float]]): 基準結果，名稱 → 分佈摘要
+        current (Dict[str, Dict[str, float]]): 本次結果
+        metrics (tuple): 要比較的欄位
+
+    Returns:
+        str: 比較表格
+    """
+    rows = []
+    for name in list(current) + [name for name in baseline if name not in current]:
+        row = [name]
+        for metric in metrics:
+            old = baseline.get(name, {}).get(metric)
+            new = current.get(name, {}).get(metric)
+            if old is None or new is None:
+                row.append(f"{'-' if old is None else f'{old:.1f}'} → {'-' if new is None else f'{new:.1f}'}")
+            else:
+                change = (new - old) / old * 100 if old else 0.0
+                row.append(f"{old:.1f} → {new:.1f} ({change:+.1f}%)")
+        rows.append(row)
+    return format_table(["名稱", *metrics], rows)
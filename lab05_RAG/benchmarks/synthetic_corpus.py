@@ -0,0 +1,175 @@
+"""
+合成 Embedding 語料產生器 (Synthetic Corpus)
+
+產生與 text-embedding 相似分佈的合成向量（多個主題群集 + 雜訊，正規化成單位向量），
+用來測試向量搜尋在 1 萬 / 10 萬 / 100 萬筆資料時的表現。
+
+- 依區塊產生並寫入 .npy（memmap），100 萬筆 × 1536 維（約 6GB）也不需要一次放進記憶體
+- 每個區塊使用獨立的亂數種子，相同參數一定產生相同的資料
+- 可選擇寫入 PostgreSQL 資料表（與 embeddings 表相同的 double precision[] 欄位），測試 cosine_similarity 函數
+
+使用方式（在 lab05_RAG 目錄下執行）：
+    python -m benchmarks.synthetic_corpus --rows 100000
+    python -m benchmarks.synthetic_corpus --rows 100000 --load-db
+"""
+
+import sys
+import time
+import argparse
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+import numpy as np
+
+# 以 python -m 或直接執行皆可匯入 lab05_RAG 下的模組
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.vector_backends import SYNTHETIC_TABLE_PREFIX, normalize_rows
+
+DEFAULT_DATA_DIR = Path(__file__).resolve().parent / "data"
+DEFAULT_DIM = 1536  # text-embedding-3-small 的維度
+CHUNK_ROWS = 50_000
+
+
+def corpus_path(rows: int, dim: int, clusters: int, noise: float, seed: int, data_dir: Path = DEFAULT_DATA_DIR) -> Path:
+    """依所有產生參數決定 .npy 檔名，參數完全相同才會重複使用先前產生的檔案"""
+    return Path(data_dir) / f"synthetic_{rows}x{dim}_c{clusters}_n{noise:g}_s{seed}.npy"
+
+
+def cluster_centers(dim: int, clusters: int, seed: int) -> np.ndarray:
+    """產生主題群集的中心（單位向量）"""
+    return normalize_rows(np.random.default_rng([seed, 0]).standard_normal((clusters, dim)))
+
+
+def iter_chunks(rows: int, dim: int = DEFAULT_DIM, clusters: int = 256, noise: float = 0.6,
+                seed: int = 42, chunk_rows: int = CHUNK_ROWS) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    依區塊產生合成向量
+
+    Args:
+        rows (int): 總筆數
+        dim (int): 向量維度
+        clusters (int): 主題群集數
+        noise (float): 每筆資料相對於群集中心的雜訊比例，越大群集越分散
+        seed (int): 亂數種子
+        chunk_rows (int): 每個區塊的筆數
+
+    Yields:
+        Tuple[int, np.ndarray]: (區塊起始位置, 正規化後的 float32 向量)
+    """
+    centers = cluster_centers(dim, clusters, seed)
+    for chunk_index, start in enumerate(range(0, rows, chunk_rows), start=1):
+        size = min(chunk_rows, rows - start)
+        rng = np.random.default_rng([seed, chunk_index])
+        assignment = rng.integers(0, clusters, size)
+        vectors = centers[assignment] + noise / np.sqrt(dim) * rng.standard_normal((size, dim), dtype=np.float32)
+        yield start, normalize_rows(vectors)
+
+
+def generate_corpus(rows: int, dim: int = DEFAULT_DIM, clusters: int = 256, noise: float = 0.6, seed: int = 42,
+                    data_dir: Path = DEFAULT_DATA_DIR, overwrite: bool = False) -> np.ndarray:
+    """
+    產生（或讀取已存在的）合成語料，以 memmap 方式回傳
+
+    Returns:
+        np.ndarray: 形狀為 (rows, dim) 的唯讀 memmap
+    """
+    path = corpus_path(rows, dim, clusters, noise, seed, data_dir)
+    if path.exists() and not overwrite:
+        return np.load(path, mmap_mode="r")
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_suffix(".partial.npy")
+    output = np.lib.format.open_memmap(partial, mode="w+", dtype=np.float32, shape=(rows, dim))
+    for start, vectors in iter_chunks(rows, dim, clusters, noise, seed):
+        output[start:start + len(vectors)] = vectors
+    output.flush()
+    del output
+    partial.replace(path)
+    return np.load(path, mmap_mode="r")
+
+
+def make_queries(corpus: np.ndarray, count: int, noise: float = 0.3, seed: int = 7) -> np.ndarray:
+    """
+    以語料中隨機挑選的向量加上雜訊作為查詢（模擬「與某些段落相近」的問題）
+
+    Args:
+        corpus (np.ndarray): 語料向量
+        count (int): 查詢數
+        noise (float): 雜訊比例
+        seed (int): 亂數種子
+    """
+    rng = np.random.default_rng(seed)
+    picks = np.sort(rng.choice(len(corpus), count, replace=False))
+    dim = corpus.shape[1]
+    return normalize_rows(corpus[picks] + noise / np.sqrt(dim) * rng.standard_normal((count, dim), dtype=np.float32))
+
+
+def exact_neighbors(corpus: np.ndarray, queries: np.ndarray, k: int, chunk_rows: int = CHUNK_ROWS) -> np.ndarray:
+    """
+    分區塊計算每個查詢的精確前 k 名（作為近似索引召回率的標準答案）
+
+    Returns:
+        np.ndarray: 形狀為 (查詢數, k) 的語料位置
+    """
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_ids = np.zeros((len(queries), k), dtype=np.int64)
+    for start in range(0, len(corpus), chunk_rows):
+        scores = queries @ np.asarray(corpus[start:start + chunk_rows]).T
+        merged_scores = np.concatenate([best_scores, scores], axis=1)
+        merged_ids = np.concatenate([best_ids, np.arange(start, start + scores.shape[1])[None, :].repeat(len(queries), 0)], axis=1)
+        top = np.argsort(-merged_scores, axis=1)[:, :k]
+        best_scores = np.take_along_axis(merged_scores, top, axis=1)
+        best_ids = np.take_along_axis(merged_ids, top, axis=1)
+    return best_ids
+
+
+def load_into_database(corpus: np.ndarray, table: str, db_config: Optional[dict] = None) -> float:
+    """
+    將合成語料寫入 PostgreSQL 資料表（id 為語料位置），回傳寫入秒數
+
+    Args:
+        corpus (np.ndarray): 語料向量
+        table (str): 資料表名稱（必須以 synthetic_ 開頭），已存在時會被重建
+        db_config (Optional[dict]): 資料庫設定，未指定時讀取環境變數
+    """
+    from benchmarks.vector_backends import PostgresCosineBackend
+
+    if db_config is None:
+        from dotenv import load_dotenv
+        from utils.database_config import get_database_config
+        load_dotenv()
+        db_config = get_database_config()
+
+    backend = PostgresCosineBackend(db_config, table=table)
+    return backend.build(np.arange(len(corpus)), corpus)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="產生合成 embedding 語料")
+    parser.add_argument("--rows", type=int, required=True, help="筆數，例如 10000、100000、1000000")
+    parser.add_argument("--dim", type=int, default=DEFAULT_DIM, help="向量維度")
+    parser.add_argument("--clusters", type=int, default=256, help="主題群集數")
+    parser.add_argument("--noise", type=float, default=0.6, help="群集內的雜訊比例")
+    parser.add_argument("--seed", type=int, default=42, help="亂數種子")
+    parser.add_argument("--data-dir", type=Path, default=DEFAULT_DATA_DIR, help=".npy 檔的存放目錄")
+    parser.add_argument("--overwrite", action="store_true", help="即使檔案已存在也重新產生")
+    parser.add_argument("--load-db", action="store_true", help="同時寫入 PostgreSQL 資料表")
+    parser.add_argument("--table", default=None, help="資料表名稱，必須以 synthetic_ 開頭（預設 synthetic_embeddings_<筆數>_<維度>，與 scaling_benchmark 相同）")
+    args = parser.parse_args()
+    if args.load_db and args.table and not args.table.startswith(SYNTHETIC_TABLE_PREFIX):
+        parser.error(f"--table 必須以 {SYNTHETIC_TABLE_PREFIX} 開頭，避免覆寫線上的資料表")
+
+    start = time.perf_counter()
+    corpus = generate_corpus(args.rows, args.dim, args.clusters, args.noise, args.seed, args.data_dir, args.overwrite)
+    print(f"✅ 合成語料 {corpus.shape[0]:,} × {corpus.shape[1]}（{corpus.nbytes / 1024 ** 3:.2f} GB）"
+          f"：{corpus_path(args.rows, args.dim, args.clusters, args.noise, args.seed, args.data_dir)}，耗時 {time.perf_counter() - start:.1f} 秒")
+
+    if args.load_db:
+        table = args.table or f"synthetic_embeddings_{args.rows}_{args.dim}"
+        print(f"🗄️ 寫入資料表 {table}...")
+        print(f"✅ 寫入完成，耗時 {load_into_database(corpus, table):.1f} 秒")
+
+
+if __name__ == "__main__":
+    main()
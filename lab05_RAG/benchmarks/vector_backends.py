@@ -0,0 +1,377 @@
+"""
+向量搜尋後端 (Vector Backends)
+
+基準測試用的各種向量搜尋實作，介面一致，方便比較召回率、延遲、建置時間與記憶體：
+
+- PostgresCosineBackend：目前使用的 PL/pgSQL cosine_similarity 全表掃描（與 LaborLawAgent._search_database 相同）
+- NumpyExactBackend：記憶體中的正規化矩陣，一次矩陣乘法取得精確結果
+- NumpyIVFBackend：以球面 k-means 分群的倒排索引（IVF），只搜尋最接近的 nprobe 個群
+- FaissHNSWBackend：faiss 的 HNSW 圖索引（選用，需安裝 faiss-cpu）
+
+所有後端都以 build(ids, vectors) 建置，search(query, limit) 回傳 (文件 id 陣列, 相似度陣列)。
+"""
+
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+TABLE_NAME_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+SYNTHETIC_TABLE_PREFIX = "synthetic_"  # build() 只會重建此前綴的資料表，避免誤刪線上的 embeddings 表
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """將每一列正規化成單位向量（內積即為餘弦相似度）"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def top_k(scores: np.ndarray, limit: int) -> np.ndarray:
+    """取出分數最高的 limit 個位置，依分數由高到低排序"""
+    limit = min(limit, len(scores))
+    if limit <= 0:
+        return np.array([], dtype=np.int64)
+    top = np.argpartition(-scores, limit - 1)[:limit]
+    return top[np.argsort(-scores[top])]
+
+
+class VectorBackend:
+    """向量搜尋後端的共同介面"""
+
+    name = "base"
+
+    def build(self, ids: np.ndarray, vectors: np.ndarray) -> float:
+        """建置索引，回傳建置秒數"""
+        raise NotImplementedError
+
+    def search(self, query: np.ndarray, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+        """搜尋最相似的 limit 筆，回傳 (文件 id, 相似度)"""
+        raise NotImplementedError
+
+    @property
+    def memory_bytes(self) -> int:
+        """索引在記憶體中佔用的位元組數（資料庫後端為 0）"""
+        return 0
+
+    def describe(self) -> Dict[str, Any]:
+        return {"name": self.name}
+
+
+class NumpyExactBackend(VectorBackend):
+    """記憶體中的精確搜尋：正規化矩陣 × 查詢向量"""
+
+    name = "numpy_exact"
+
+    def __init__(self):
+        self.ids: Optional[np.ndarray] = None
+        self.matrix: Optional[np.ndarray] = None
+
+    def build(self, ids: np.ndarray, vectors: np.ndarray) -> float:
+        start = time.perf_counter()
+        self.ids = np.asarray(ids)
+        self.matrix = normalize_rows(vectors)
+        return time.perf_counter() - start
+
+    def search(self, query: np.ndarray, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+        scores = self.matrix @ normalize_rows(query)
+        top = top_k(scores, limit)
+        return self.ids[top], scores[top]
+
+    @property
+    def memory_bytes(self) -> int:
+        return 0 if self.matrix is None else self.matrix.nbytes + self.ids.nbytes
+
+
+class NumpyIVFBackend(VectorBackend):
+    """倒排檔索引（IVF）：以球面 k-means 將向量分成 nlist 群，查詢時只掃描最接近的 nprobe 群"""
+
+    name = "numpy_ivf"
+
+    def __init__(self, nlist: Optional[int] = None, nprobe: int = 8, iterations: int = 10,
+                 sample_per_list: int = 64, seed: int = 0):
+        """
+        Args:
+            nlist (Optional[int]): 群數，未指定時使用 sqrt(資料筆數)
+            nprobe (int): 查詢時搜尋的群數，越大召回率越高、速度越慢
+            iterations (int): k-means 迭代次數
+            sample_per_list (int): 每群抽樣多少筆資料訓練 k-means
+            seed (int): 亂數種子
+        """
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.sample_per_list = sample_per_list
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        self.vectors: Optional[np.ndarray] = None
+        self.ids: Optional[np.ndarray] = None
+        self.offsets: Optional[np.ndarray] = None
+
+    def _assign(self, vectors: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+        """分批計算每個向量最接近的群，避免一次產生 (筆數 × 群數) 的大矩陣"""
+        return np.concatenate([
+            np.argmax(vectors[start:start + chunk_size] @ self.centroids.T, axis=1)
+            for start in range(0, len(vectors), chunk_size)
+        ])
+
+    def build(self, ids: np.ndarray, vectors: np.ndarray) -> float:
+        start = time.perf_counter()
+        rng = np.random.default_rng(self.seed)
+        vectors = normalize_rows(vectors)
+        nlist = min(self.nlist or max(1, int(np.sqrt(len(vectors)))), len(vectors))
+
+        sample_size = min(len(vectors), nlist * self.sample_per_list)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+        self.centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            assignment = np.argmax(sample @ self.centroids.T, axis=1)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=nlist)
+            empty = counts == 0
+            # 空的群重新從樣本中挑一個點當中心
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            self.centroids = normalize_rows(sums)
+
+        # 依群排序後連續存放，每一群就是一段切片
+        assignment = self._assign(vectors)
+        order = np.argsort(assignment, kind="stable")
+        self.vectors = vectors[order]
+        self.ids = np.asarray(ids)[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=nlist))])
+        return time.perf_counter() - start
+
+    def search(self, query: np.ndarray, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+        query = normalize_rows(query)
+        probes = top_k(self.centroids @ query, self.nprobe)
+        positions = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in probes])
+        scores = self.vectors[positions] @ query
+        top = top_k(scores, limit)
+        return self.ids[positions[top]], scores[top]
+
+    @property
+    def memory_bytes(self) -> int:
+        if self.vectors is None:
+            return 0
+        return self.vectors.nbytes + self.ids.nbytes + self.centroids.nbytes + self.offsets.nbytes
+
+    def describe(self) -> Dict[str, Any]:
+        nlist = None if self.centroids is None else len(self.centroids)
+        return {"name": self.name, "nlist": nlist or self.nlist, "nprobe": self.nprobe}
+
+
+class FaissHNSWBackend(VectorBackend):
+    """faiss 的 HNSW 圖索引（內積距離，向量先正規化）"""
+
+    name = "faiss_hnsw"
+
+    def __init__(self, m: int = 32, ef_construction: int = 200, ef_search: int = 64):
+        """
+        Args:
+            m (int): 每個節點的連結數
+            ef_construction (int): 建置時的候選數
+            ef_search (int): 查詢時的候選數，越大召回率越高、速度越慢
+        """
+        import faiss  # 選用套件：pip install faiss-cpu
+
+        self.faiss = faiss
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.index = None
+        self.ids: Optional[np.ndarray] = None
+        self._memory_bytes = 0
+
+    def build(self, ids: np.ndarray, vectors: np.ndarray) -> float:
+        start = time.perf_counter()
+        vectors = normalize_rows(vectors)
+        self.index = self.faiss.IndexHNSWFlat(vectors.shape[1], self.m, self.faiss.METRIC_INNER_PRODUCT)
+        self.index.hnsw.efConstruction = self.ef_construction
+        self.index.add(vectors)
+        self.index.hnsw.efSearch = self.ef_search
+        self.ids = np.asarray(ids)
+        elapsed = time.perf_counter() - start
+        # 向量本身加上每個節點約 2M 個鄰居連結（int32）
+        self._memory_bytes = vectors.nbytes + len(vectors) * self.m * 2 * 4 + self.ids.nbytes
+        return elapsed
+
+    def search(self, query: np.ndarray, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+        scores, positions = self.index.search(normalize_rows(query)[None, :], limit)
+        valid = positions[0] >= 0
+        return self.ids[positions[0][valid]], scores[0][valid]
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._memory_bytes
+
+    def describe(self) -> Dict[str, Any]:
+        return {"name": self.name, "m": self.m, "ef_construction": self.ef_construction, "ef_search": self.ef_search}
+
+
+class PostgresCosineBackend(VectorBackend):
+    """以 PL/pgSQL cosine_similarity 函數全表掃描（目前線上使用的方式）"""
+
+    name = "plpgsql_cosine"
+
+    def __init__(self, db_config: Dict[str, Any], table: str = "embeddings", persistent_connection: bool = False,
+                 statement_timeout_ms: Optional[int] = None):
+        """
+        Args:
+            db_config (Dict[str, Any]): PostgreSQL 連線設定
+            table (str): 資料表名稱（需有 id 與 embedding_vector 欄位；build() 只能用於 synthetic_ 開頭的資料表）
+            persistent_connection (bool): 是否重複使用連線；預設與 LaborLawAgent 相同，每次查詢重新連線
+            statement_timeout_ms (Optional[int]): 單一查詢的逾時毫秒數（大型資料表全表掃描可能要數分鐘）
+        """
+        if not TABLE_NAME_PATTERN.match(table):
+            raise ValueError(f"不合法的資料表名稱: {table}")
+        self.db_config = db_config
+        self.table = table
+        self.persistent_connection = persistent_connection
+        self.statement_timeout_ms = statement_timeout_ms
+        self._conn = None
+
+    def _open(self):
+        import psycopg2
+
+        conn = psycopg2.connect(**self.db_config)
+        if self.statement_timeout_ms:
+            with conn.cursor() as cur:
+                cur.execute("SET statement_timeout = %s", (int(self.statement_timeout_ms),))
+            conn.commit()
+        return conn
+
+    def _connect(self):
+        if not self.persistent_connection:
+            return self._open()
+        if self._conn is None or self._conn.closed:
+            self._conn = self._open()
+        return self._conn
+
+    def _release(self, conn) -> None:
+        if not self.persistent_connection:
+            conn.close()
+
+    def build(self, ids: np.ndarray, vectors: np.ndarray, batch_size: int = 1000) -> float:
+        """
+        建立（或重建）資料表並寫入向量，用於合成資料的規模測試
+
+        只接受 synthetic_ 開頭的資料表，線上使用的 embeddings 等資料表不會被刪除
+        """
+        from psycopg2.extras import execute_values
+
+        if not self.table.startswith(SYNTHETIC_TABLE_PREFIX):
+            raise ValueError(f"只能重建 {SYNTHETIC_TABLE_PREFIX} 開頭的合成資料表，拒絕刪除 {self.table}")
+
+        start = time.perf_counter()
+        conn = self._connect()
+        try:
+            with conn, conn.cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS {self.table}")
+                cur.execute(f"CREATE TABLE {self.table} (id BIGINT PRIMARY KEY, embedding_vector double precision[])")
+                for begin in range(0, len(ids), batch_size):
+                    rows = [(int(i), vector.tolist()) for i, vector in
+                            zip(ids[begin:begin + batch_size], vectors[begin:begin + batch_size])]
+                    execute_values(cur, f"INSERT INTO {self.table} (id, embedding_vector) VALUES %s", rows)
+        finally:
+            self._release(conn)
+        return time.perf_counter() - start
+
+    def search(self, query: np.ndarray, limit: int) -> Tuple[np.ndarray, np.ndarray]:
+        conn = self._connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT id, cosine_similarity(embedding_vector, %s::double precision[]) AS similarity
+                    FROM {self.table}
+                    WHERE embedding_vector IS NOT NULL
+                    ORDER BY similarity DESC
+                    LIMIT %s;
+                """, (np.asarray(query, dtype=np.float64).tolist(), limit))
+                rows = cur.fetchall()
+            if self.persistent_connection:
+                conn.rollback()  # 結束唯讀交易，避免長時間持有快照
+        finally:
+            self._release(conn)
+        return np.array([row[0] for row in rows]), np.array([row[1] for row in rows], dtype=np.float64)
+
+    def count_rows(self) -> int:
+        """資料表的筆數（資料表不存在時回傳 0）"""
+        conn = self._connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT to_regclass(%s)", (self.table,))
+                if cur.fetchone()[0] is None:
+                    return 0
+                cur.execute(f"SELECT count(*) FROM {self.table}")
+                count = cur.fetchone()[0]
+            if self.persistent_connection:
+                conn.rollback()
+        finally:
+            self._release(conn)
+        return count
+
+    def table_bytes(self) -> int:
+        """資料表（含 TOAST 與索引）在磁碟上佔用的位元組數"""
+        conn = self._connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_total_relation_size(%s)", (self.table,))
+                size = cur.fetchone()[0]
+            if self.persistent_connection:
+                conn.rollback()
+        finally:
+            self._release(conn)
+        return size
+
+    def load_documents(self) -> List[Dict[str, Any]]:
+        """讀取資料表中的所有段落與向量（讓記憶體後端使用與資料庫相同的語料）"""
+        conn = self._connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT id, content, embedding_vector FROM {self.table} WHERE embedding_vector IS NOT NULL ORDER BY id")
+                rows = cur.fetchall()
+        finally:
+            self._release(conn)
+        return [{"id": row[0], "content": row[1], "embedding": row[2]} for row in rows]
+
+    def describe(self) -> Dict[str, Any]:
+        return {"name": self.name, "table": self.table, "persistent_connection": self.persistent_connection,
+                "statement_timeout_ms": self.statement_timeout_ms}
+
+
+def create_backend(spec: str, db_config: Optional[Dict[str, Any]] = None, table: str = "embeddings",
+                   statement_timeout_ms: Optional[int] = None) -> VectorBackend:
+    """
+    依字串建立後端，格式為「名稱:參數=值,參數=值」，例如：
+    exact、ivf:nlist=64,nprobe=4、hnsw:m=16,ef_search=32、plpgsql、plpgsql:persistent=1
+
+    Args:
+        spec (str): 後端設定字串
+        db_config (Optional[Dict[str, Any]]): PostgreSQL 連線設定（plpgsql 後端需要）
+        table (str): plpgsql 後端使用的資料表
+        statement_timeout_ms (Optional[int]): plpgsql 後端單一查詢的逾時毫秒數
+
+    Returns:
+        VectorBackend: 後端實例
+    """
+    name, _, option_text = spec.partition(":")
+    options = {}
+    for item in filter(None, option_text.split(",")):
+        key, _, value = item.partition("=")
+        options[key.strip()] = int(value)
+
+    name = name.strip().lower()
+    if name == "exact":
+        return NumpyExactBackend()
+    if name == "ivf":
+        return NumpyIVFBackend(**options)
+    if name == "hnsw":
+        return FaissHNSWBackend(**options)
+    if name == "plpgsql":
+        if db_config is None:
+            raise ValueError("plpgsql 後端需要資料庫設定")
+        return PostgresCosineBackend(db_config, table=table, persistent_connection=bool(options.get("persistent", 0)),
+                                     statement_timeout_ms=statement_timeout_ms)
+    raise ValueError(f"未知的向量後端: {spec}")
@@ -0,0 +1,386 @@
+"""
+本地模擬 Azure OpenAI 服務 (Fake AOAI Server)
+
+LaborLawAgent、api_server.py 與 process_data.py 都需要真實的 Azure 金鑰才能執行，
+無法在沒有網路的筆電上測試吞吐量與並行度的調整。這個伺服器提供與 Azure OpenAI 相容的：
+
+1. Chat Completions：支援 tool_calls（依請求中的工具定義產生參數）與 SSE 串流
+2. Embeddings：以字元 n-gram 雜湊產生向量，相同文字永遠得到相同向量，相似文字的向量也相近
+3. 可設定的延遲分佈（fixed / uniform / normal / lognormal）與串流每個片段的延遲
+4. 以機率或每分鐘請求數上限注入 429 錯誤（附 Retry-After 標頭）
+5. 所有輸出都是確定性的：相同的請求得到相同的回應；延遲與錯誤注入使用固定亂數種子
+
+使用方式：
+    python fake_aoai_server.py --port 8001 --chat-latency lognormal:800:0.4 --error-rate 0.05
+
+並在 .env 設定 FAKE_AOAI_URL=http://localhost:8001，utils/ai_client 就會改為連線到這個伺服器。
+"""
+
+import json
+import time
+import base64
+import random
+import asyncio
+import hashlib
+import argparse
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal")
+
+
+@dataclass
+class LatencySpec:
+    """延遲分佈設定，字串格式為「分佈:中位數毫秒:參數」
+
+    - fixed:200            固定 200ms
+    - uniform:100:300      100～300ms 均勻分佈
+    - normal:500:100       平均 500ms、標準差 100ms
+    - lognormal:800:0.4    中位數 800ms、對數標準差 0.4（長尾，最接近真實 API）
+    """
+    distribution: str = "fixed"
+    value: float = 0.0
+    spread: float = 0.0
+
+    @classmethod
+    def parse(cls, text: str) -> "LatencySpec":
+        parts = text.split(":")
+        distribution = parts[0].strip().lower()
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"未知的延遲分佈: {distribution}（可用: {', '.join(LATENCY_DISTRIBUTIONS)}）")
+        value = float(parts[1]) if len(parts) > 1 else 0.0
+        spread = float(parts[2]) if len(parts) > 2 else 0.0
+        return cls(distribution, value, spread)
+
+    def sample(self, rng: random.Random) -> float:
+        """抽樣一次延遲（秒）"""
+        if self.distribution == "uniform":
+            milliseconds = rng.uniform(self.value, self.spread or self.value)
+        elif self.distribution == "normal":
+            milliseconds = rng.gauss(self.value, self.spread)
+        elif self.distribution == "lognormal":
+            milliseconds = self.value * rng.lognormvariate(0.0, self.spread)
+        else:
+            milliseconds = self.value
+        return max(milliseconds, 0.0) / 1000
+
+
+@dataclass
+class FakeServerConfig:
+    """模擬伺服器的行為設定"""
+    chat_latency: LatencySpec = field(default_factory=LatencySpec)
+    embedding_latency: LatencySpec = field(default_factory=LatencySpec)
+    stream_chunk_latency: LatencySpec = field(default_factory=LatencySpec)
+    error_rate: float = 0.0          # 隨機回傳 429 的機率
+    rate_limit_rpm: int = 0          # 每分鐘請求數上限，超過即回傳 429（0 表示不限制）
+    retry_after: float = 1.0         # 429 回應的 Retry-After 秒數
+    embedding_dim: int = 1536        # embedding 向量維度
+    tool_rounds: int = 1             # 有工具時，先回傳幾輪 tool_calls 才給最終回答
+    tool_names: Optional[List[str]] = None  # 要呼叫的工具名稱，未指定時呼叫請求中的所有工具
+    stream_chunk_chars: int = 8      # 串流時每個片段的字元數
+    seed: int = 42                   # 延遲與錯誤注入的亂數種子
+
+
+class FakeAOAIServer:
+    """產生確定性回應的模擬 AOAI 服務，並記錄請求統計"""
+
+    def __init__(self, config: FakeServerConfig):
+        self.config = config
+        self._rng = random.Random(config.seed)
+        self._rng_lock = threading.Lock()
+        self._request_times: deque = deque()
+        self.stats = {"chat": 0, "chat_stream": 0, "embeddings": 0, "embedding_inputs": 0, "rate_limited": 0}
+
+    # === 延遲與錯誤注入 ===
+
+    def _sample(self, spec: LatencySpec) -> float:
+        with self._rng_lock:
+            return spec.sample(self._rng)
+
+    def check_rate_limit(self) -> Optional[JSONResponse]:
+        """依錯誤率與每分鐘請求數判斷是否回傳 429"""
+        now = time.monotonic()
+        with self._rng_lock:
+            limited = self._rng.random() < self.config.error_rate
+            if self.config.rate_limit_rpm > 0:
+                while self._request_times and now - self._request_times[0] > 60:
+                    self._request_times.popleft()
+                if len(self._request_times) >= self.config.rate_limit_rpm:
+                    limited = True
+                else:
+                    self._request_times.append(now)
+        if not limited:
+            return None
+        self.stats["rate_limited"] += 1
+        return JSONResponse(
+            status_code=429,
+            headers={"Retry-After": f"{self.config.retry_after:g}"},
+            content={"error": {"code": "429", "message": "Rate limit is exceeded (fake server)."}},
+        )
+
+    # === Embeddings ===
+
+    def embed(self, text: str) -> np.ndarray:
+        """以字元 1～2-gram 雜湊到固定維度產生向量（正規化），內容重疊越多的文字越相似"""
+        vector = np.zeros(self.config.embedding_dim, dtype=np.float32)
+        grams = list(text) + [text[i:i + 2] for i in range(len(text) - 1)]
+        for gram in grams:
+            digest = hashlib.md5(gram.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.config.embedding_dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            vector[0] = 1.0
+            return vector
+        return vector / norm
+
+    def embeddings_response(self, body: Dict[str, Any], model: str) -> Dict[str, Any]:
+        inputs = body.get("input", "")
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        # 已經轉成 token 的輸入以文字形式處理
+        inputs = [item if isinstance(item, str) else " ".join(map(str, item)) for item in inputs]
+        use_base64 = body.get("encoding_format") == "base64"
+
+        data = []
+        for index, text in enumerate(inputs):
+            vector = self.embed(text)
+            embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii") if use_base64 else vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+
+        tokens = sum(len(text) for text in inputs)
+        self.stats["embeddings"] += 1
+        self.stats["embedding_inputs"] += len(inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": model,
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    # === Chat Completions ===
+
+    def _pending_tool_rounds(self, messages: List[Dict[str, Any]]) -> int:
+        """計算最後一則使用者訊息之後已經回傳過幾輪 tool_calls"""
+        rounds = 0
+        for message in reversed(messages):
+            if message.get("role") == "user":
+                break
+            if message.get("role") == "assistant" and message.get("tool_calls"):
+                rounds += 1
+        return rounds
+
+    def _tool_arguments(self, schema: Dict[str, Any], query: str) -> Dict[str, Any]:
+        """依工具的參數定義填入必要參數：字串填入使用者問題，其餘使用預設值"""
+        properties = schema.get("properties", {})
+        arguments = {}
+        for name in schema.get("required", []):
+            spec = properties.get(name, {})
+            if "default" in spec:
+                arguments[name] = spec["default"]
+            elif spec.get("type") == "integer":
+                arguments[name] = 5
+            elif spec.get("type") == "boolean":
+                arguments[name] = False
+            else:
+                arguments[name] = query
+        return arguments
+
+    def build_chat_message(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """依請求內容產生確定性的助手訊息"""
+        messages = body.get("messages", [])
+        last_user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        if isinstance(last_user, list):  # 多段內容格式
+            last_user = " ".join(part.get("text", "") for part in last_user if isinstance(part, dict))
+        request_hash = hashlib.sha256(
+            json.dumps(messages, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+
+        tools = body.get("tools") or []
+        if tools and body.get("tool_choice") != "none" and self._pending_tool_rounds(messages) < self.config.tool_rounds:
+            selected = [tool["function"] for tool in tools
+                        if not self.config.tool_names or tool["function"]["name"] in self.config.tool_names]
+            if selected:
+                tool_calls = [{
+                    "id": f"call_{request_hash[i * 8:i * 8 + 24]}",
+                    "type": "function",
+                    "function": {
+                        "name": function["name"],
+                        "arguments": json.dumps(self._tool_arguments(function.get("parameters", {}), last_user),
+                                                ensure_ascii=False),
+                    },
+                } for i, function in enumerate(selected)]
+                return {"role": "assistant", "content": None, "tool_calls": tool_calls}
+
+        tool_results = [m for m in messages if m.get("role") == "tool"]
+        if tool_results:
+            content = f"（模擬回答）根據 {len(tool_results)} 筆工具結果回答：{last_user}"
+        else:
+            content = f"（模擬回應）{last_user}"
+
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") in ("json_object", "json_schema"):
+            content = json.dumps({"response": content, "request_id": request_hash[:12]}, ensure_ascii=False)
+        return {"role": "assistant", "content": content}
+
+    @staticmethod
+    def _usage(body: Dict[str, Any], message: Dict[str, Any]) -> Dict[str, int]:
+        """以字元數估算 token 數（中文約 1 字 1 token）"""
+        prompt_tokens = sum(len(str(m.get("content") or "")) for m in body.get("messages", [])) + 4 * len(body.get("messages", []))
+        completion_tokens = len(message.get("content") or "") + sum(
+            len(call["function"]["arguments"]) + len(call["function"]["name"]) for call in message.get("tool_calls", [])
+        )
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens}
+
+    def chat_response(self, body: Dict[str, Any], model: str) -> Dict[str, Any]:
+        message = self.build_chat_message(body)
+        self.stats["chat"] += 1
+        return {
+            "id": f"chatcmpl-fake-{int(time.time() * 1000)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if message.get("tool_calls") else "stop",
+            }],
+            "usage": self._usage(body, message),
+        }
+
+    async def chat_stream(self, body: Dict[str, Any], model: str):
+        """以 SSE 格式逐段輸出回應（tool_calls 依 OpenAI 格式以 delta 分段傳送）"""
+        message = self.build_chat_message(body)
+        self.stats["chat_stream"] += 1
+        completion_id = f"chatcmpl-fake-{int(time.time() * 1000)}"
+        created = int(time.time())
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None, usage: Optional[Dict] = None) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if usage is None else [],
+            }
+            if usage is not None:
+                payload["usage"] = usage
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        yield chunk({"role": "assistant", "content": ""})
+
+        size = max(self.config.stream_chunk_chars, 1)
+        for index, call in enumerate(message.get("tool_calls", [])):
+            yield chunk({"tool_calls": [{"index": index, "id": call["id"], "type": "function",
+                                         "function": {"name": call["function"]["name"], "arguments": ""}}]})
+            arguments = call["function"]["arguments"]
+            for start in range(0, len(arguments), size):
+                await asyncio.sleep(self._sample(self.config.stream_chunk_latency))
+                yield chunk({"tool_calls": [{"index": index, "function": {"arguments": arguments[start:start + size]}}]})
+
+        content = message.get("content") or ""
+        for start in range(0, len(content), size):
+            await asyncio.sleep(self._sample(self.config.stream_chunk_latency))
+            yield chunk({"content": content[start:start + size]})
+
+        yield chunk({}, "tool_calls" if message.get("tool_calls") else "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield chunk({}, usage=self._usage(body, message))
+        yield "data: [DONE]\n\n"
+
+
+def create_app(config: FakeServerConfig) -> FastAPI:
+    """建立模擬伺服器，同時提供 Azure（/openai/deployments/...）與 OpenAI（/v1/...）兩種路徑"""
+    server = FakeAOAIServer(config)
+    app = FastAPI(title="Fake Azure OpenAI Server", description="離線測試用的模擬 AOAI 服務")
+    app.state.fake_server = server
+
+    async def handle_chat(request: Request, model: str):
+        limited = server.check_rate_limit()
+        if limited is not None:
+            return limited
+        body = await request.json()
+        model = body.get("model") or model
+        # 首個位元組前的延遲（模擬排隊與預填充時間）
+        await asyncio.sleep(server._sample(config.chat_latency))
+        if body.get("stream"):
+            return StreamingResponse(server.chat_stream(body, model), media_type="text/event-stream")
+        return server.chat_response(body, model)
+
+    async def handle_embeddings(request: Request, model: str):
+        limited = server.check_rate_limit()
+        if limited is not None:
+            return limited
+        body = await request.json()
+        await asyncio.sleep(server._sample(config.embedding_latency))
+        return server.embeddings_response(body, body.get("model") or model)
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def azure_chat(deployment: str, request: Request):
+        return await handle_chat(request, deployment)
+
+    @app.post("/openai/deployments/{deployment}/embeddings")
+    async def azure_embeddings(deployment: str, request: Request):
+        return await handle_embeddings(request, deployment)
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        return await handle_chat(request, "fake-chat")
+
+    @app.post("/v1/embeddings")
+    async def openai_embeddings(request: Request):
+        return await handle_embeddings(request, "fake-embedding")
+
+    @app.get("/stats")
+    async def stats():
+        """請求統計（方便壓力測試時確認實際送出的請求數）"""
+        return server.stats
+
+    return app
+
+
+def main():
+    """啟動模擬 AOAI 服務"""
+    parser = argparse.ArgumentParser(description="離線測試用的 Azure OpenAI 相容模擬伺服器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--chat-latency", default="fixed:0", help="聊天回應延遲，例：lognormal:800:0.4")
+    parser.add_argument("--embedding-latency", default="fixed:0", help="embedding 回應延遲，例：normal:120:30")
+    parser.add_argument("--stream-chunk-latency", default="fixed:0", help="串流每個片段之間的延遲，例：fixed:20")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="隨機回傳 429 的機率（0～1）")
+    parser.add_argument("--rate-limit-rpm", type=int, default=0, help="每分鐘請求數上限，0 表示不限制")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429 回應的 Retry-After 秒數")
+    parser.add_argument("--embedding-dim", type=int, default=1536, help="embedding 向量維度")
+    parser.add_argument("--tool-rounds", type=int, default=1, help="給最終回答前回傳幾輪 tool_calls")
+    parser.add_argument("--tools", default="", help="要呼叫的工具名稱（逗號分隔），預設呼叫請求中的所有工具")
+    parser.add_argument("--seed", type=int, default=42, help="延遲與錯誤注入的亂數種子")
+    args = parser.parse_args()
+
+    config = FakeServerConfig(
+        chat_latency=LatencySpec.parse(args.chat_latency),
+        embedding_latency=LatencySpec.parse(args.embedding_latency),
+        stream_chunk_latency=LatencySpec.parse(args.stream_chunk_latency),
+        error_rate=args.error_rate,
+        rate_limit_rpm=args.rate_limit_rpm,
+        retry_after=args.retry_after,
+        embedding_dim=args.embedding_dim,
+        tool_rounds=args.tool_rounds,
+        tool_names=[name.strip() for name in args.tools.split(",") if name.strip()] or None,
+        seed=args.seed,
+    )
+
+    print(f"🧪 啟動模擬 AOAI 服務: http://{args.host}:{args.port}")
+    print(f"   聊天延遲 {args.chat_latency}、embedding 延遲 {args.embedding_latency}、429 機率 {args.error_rate}")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,7 @@ import {
   BarChartOutlined,
   FileTextOutlined
 } from '@ant-design/icons'
-import type { TechnicalDetails, SearchResult, SearchMetadata, UsedChunk } from '../types'
+import type { TechnicalDetails, SearchResult, SearchMetadata, UsedChunk, TimingSpan } from '../types'
 
 const { Text, Paragraph } = Typography
 const { Panel } = Collapse
@@ -278,11 +278,69 @@ const TechnicalDetailsComponent: React.FC<Props> = ({ details }) => {
     )
   }
 
+  const renderTimings = () => {
+    if (!details.timings || details.timings.spans.length === 0) return null
+
+    const { total_ms, stages, spans } = details.timings
+
+    const columns = [
+      {
+        title: '階段',
+        dataIndex: 'name',
+        key: 'name',
+        width: 140,
+        render: (name: string) => <Tag color="blue">{name}</Tag>
+      },
+      {
+        title: '起始',
+        dataIndex: 'start_ms',
+        key: 'start_ms',
+        width: 90,
+        render: (start: number) => <Text style={{ color: '#8c8c8c' }}>{start.toFixed(0)} ms</Text>
+      },
+      {
+        title: '耗時',
+        key: 'duration_ms',
+        render: (record: TimingSpan) => (
+          <Progress
+            percent={total_ms ? Math.min(100, Math.round((record.duration_ms / total_ms) * 100)) : 0}
+            size="small"
+            strokeColor="#faad14"
+            format={() => `${record.duration_ms.toFixed(1)} ms`}
+          />
+        )
+      }
+    ]
+
+    return (
+      <Panel header={`⏱️ 各階段耗時（總計 ${(total_ms / 1000).toFixed(2)} 秒）`} key="timings">
+        <div style={{ marginBottom: '12px' }}>
+          {Object.entries(stages).map(([name, duration]) => (
+            <Tag key={name} color="gold" style={{ marginBottom: '4px' }}>
+              {name}: {duration.toFixed(0)} ms
+            </Tag>
+          ))}
+        </div>
+        <Text style={{ display: 'block', marginBottom: '12px', color: '#8c8c8c' }}>
+          📌 依起始時間排列，並行執行的工具會有重疊的區段
+        </Text>
+        <Table
+          dataSource={spans}
+          columns={columns}
+          pagination={false}
+          size="small"
+          rowKey={(record: TimingSpan) => `${record.name}_${record.start_ms}`}
+        />
+      </Panel>
+    )
+  }
+
   return (
     <div className="technical-details">
       <Collapse ghost>
         {renderUsedChunks()}
         {renderTokenUsage()}
+        {renderTimings()}
       </Collapse>
     </div>
   )
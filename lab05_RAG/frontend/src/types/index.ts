@@ -34,6 +34,19 @@ export interface UsedChunk {
   used_in_response: boolean
 }
 
+export interface TimingSpan {
+  name: string
+  start_ms: number
+  duration_ms: number
+  thread?: string
+}
+
+export interface RequestTimings {
+  total_ms: number
+  stages: Record<string, number>
+  spans: TimingSpan[]
+}
+
 export interface TechnicalDetails {
   search_metadata?: Record<string, any>
   hybrid_results?: SearchResult[]
@@ -49,6 +62,7 @@ export interface TechnicalDetails {
     output: number
     total: number
   }
+  timings?: RequestTimings
 }
 
 export interface QueryResponse {
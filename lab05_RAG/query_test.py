@@ -4,31 +4,60 @@
 """
 
 import os
+import sys
 import json
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from typing import List, Dict, Any, Callable
+from typing import List, Dict, Any, Callable, Optional
 import numpy as np
 from datetime import datetime
+from pathlib import Path
 from dotenv import load_dotenv
-from tavily import TavilyClient
 from utils.database_config import get_database_config
 from utils.ai_client import get_embedding_for_content, chat_with_azure_openai
+from utils.rerank_batcher import RerankBatcher, RerankBatcherClosed
 from sentence_transformers import CrossEncoder
 import concurrent.futures
+import contextvars
 import time
 
+# 共用模組位於專案根目錄
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from shared.search_cache import CachedTavilyClient
+
 # 載入環境變數
 load_dotenv()
 
-tavily_client = TavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
+# Tavily 客戶端（含共用快取：相同查詢在有效期限內直接使用快取，同時發出的相同查詢只搜尋一次）
+tavily_client = CachedTavilyClient(api_key=os.getenv("TAVILY_API_KEY"))
 
 class ChineseReranker:
     """繁體中文專用 Reranker 模型"""
     
-    def __init__(self):
-        """初始化繁體中文Reranker模型"""
+    def __init__(self, model_path: Optional[str] = None, max_content_chars: int = 512, batch_size: int = 32):
+        """
+        初始化繁體中文Reranker模型
+
+        Args:
+            model_path (Optional[str]): 指定的 CrossEncoder 模型（例如 'cross-encoder/ms-marco-MiniLM-L-6-v2'），
+                未指定時使用 bge-reranker-base，失敗時依序嘗試備用模型
+            max_content_chars (int): 每個文件送進模型前截斷的字元數
+            batch_size (int): 模型推理的批次大小
+        """
         self.model = None
+        self.max_content_chars = max_content_chars
+        self.batch_size = batch_size
+        self.batcher: Optional[RerankBatcher] = None
+        
+        if model_path:
+            try:
+                print(f"🔧 正在加載 {model_path} Reranker模型...")
+                self.model = CrossEncoder(model_path)
+                print(f"✅ {model_path} 模型加載成功")
+            except Exception as e:
+                print(f"❌ {model_path} 模型加載失敗: {e}")
+                print("⚠️ 將使用無rerank模式")
+            return
         
         # 使用BAAI的BGE Reranker base - 平衡速度與質量，支援繁體中文
         model_config = {
@@ -59,6 +88,33 @@ class ChineseReranker:
                     print(f"❌ 所有備用模型都無法加載: {e3}")
                     print("⚠️ 將使用無rerank模式")
     
+    def enable_micro_batching(self, max_wait_ms: float = 5.0, max_batch_pairs: int = 64) -> bool:
+        """
+        啟用跨請求的微批次：同時進行的 rerank 會在 max_wait_ms 內合併成一次模型推理
+
+        Args:
+            max_wait_ms (float): 每批最多等待其他請求的毫秒數
+            max_batch_pairs (int): 累積到這麼多配對就立即推理
+
+        Returns:
+            bool: 是否成功啟用（沒有模型時不啟用）
+        """
+        if not self.model:
+            return False
+        if self.batcher:
+            self.batcher.close()
+        self.batcher = RerankBatcher(self.model, max_wait_ms=max_wait_ms, max_batch_pairs=max_batch_pairs,
+                                     batch_size=self.batch_size)
+        print(f"✅ Reranker 微批次已啟用（等待 {max_wait_ms:g}ms，每批最多 {max_batch_pairs} 個配對）")
+        return True
+    
+    def disable_micro_batching(self):
+        """停用微批次，回到每次 rerank 各自推理"""
+        # 先清除參考讓新的 rerank 直接推理，再關閉（已排隊的請求仍會完成）
+        batcher, self.batcher = self.batcher, None
+        if batcher:
+            batcher.close()
+    
     def rerank(self, query: str, results: List[Dict], top_k: int = 5) -> List[Dict]:
         """使用繁體中文Reranker進行排序"""
         if not self.model or not results:
@@ -76,14 +132,23 @@ class ChineseReranker:
             for result in results:
                 content = result.get('content', '')
                 # 限制文本長度以提升性能
-                if len(content) > 512:
-                    content = content[:512] + "..."
+                if len(content) > self.max_content_chars:
+                    content = content[:self.max_content_chars] + "..."
                 query_doc_pairs.append([query, content])
             prep_time = time.time() - prep_start
             
             # 使用模型評分
             predict_start = time.time()
-            scores = self.model.predict(query_doc_pairs)
+            # 讀一次 batcher，避免與 disable_micro_batching 同時執行時取到 None
+            batcher = self.batcher
+            scores = None
+            if batcher:
+                try:
+                    scores = batcher.predict(query_doc_pairs)
+                except RerankBatcherClosed:
+                    scores = None  # 微批次剛被停用，改為直接推理
+            if scores is None:
+                scores = self.model.predict(query_doc_pairs, batch_size=self.batch_size)
             predict_time = time.time() - predict_start
             
             # 添加rerank分數到結果並排序
@@ -126,14 +191,22 @@ class ChineseReranker:
 class LaborLawAgent:
     """勞動基準法 AI Agent 系統 - 簡化版"""
     
-    def __init__(self):
-        """初始化 AI Agent 系統"""
+    def __init__(self, reranker=None):
+        """初始化 AI Agent 系統
+        
+        Args:
+            reranker: 自訂的 Reranker（需提供 rerank(query, results, top_k) 方法），
+                      未指定時載入繁體中文 Reranker 模型；基準測試可傳入本地替身
+        """
         # PostgreSQL連接配置
         self.db_config = get_database_config()
         
         # 初始化繁體中文 Reranker 系統
-        print("🔧 正在初始化繁體中文 Reranker 系統...")
-        self.reranker = ChineseReranker()
+        if reranker is not None:
+            self.reranker = reranker
+        else:
+            print("🔧 正在初始化繁體中文 Reranker 系統...")
+            self.reranker = ChineseReranker()
         
         # 初始化工具系統
         self._setup_tools()
@@ -203,30 +276,7 @@ class LaborLawAgent:
             return {"error": "無法生成查詢embedding"}
         
         try:
-            conn = psycopg2.connect(**self.db_config)
-            cur = conn.cursor(cursor_factory=RealDictCursor)
-            
-            # 向量搜索SQL
-            search_sql = """
-            SELECT 
-                id,
-                content,
-                created_at,
-                cosine_similarity(embedding_vector, %s::double precision[]) as similarity,
-                length(content) as char_count
-            FROM embeddings
-            WHERE embedding_vector IS NOT NULL
-            ORDER BY similarity DESC
-            LIMIT %s;
-            """
-            
-            cur.execute(search_sql, (query_embedding, limit))
-            results = cur.fetchall()
-            
-            cur.close()
-            conn.close()
-            
-            search_results = [dict(row) for row in results]
+            search_results = self._search_database(query_embedding, limit)
             print(f"✅ 找到 {len(search_results)} 個相關結果")
             
             # 使用繁體中文 Reranker 進行重排序
@@ -258,13 +308,40 @@ class LaborLawAgent:
             print(f"❌ {error_msg}")
             return {"error": error_msg}
 
+    def _search_database(self, query_embedding: List[float], limit: int) -> List[Dict]:
+        """在 PostgreSQL 中以餘弦相似度找出最相近的段落"""
+        conn = psycopg2.connect(**self.db_config)
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        
+        # 向量搜索SQL
+        search_sql = """
+        SELECT 
+            id,
+            content,
+            created_at,
+            cosine_similarity(embedding_vector, %s::double precision[]) as similarity,
+            length(content) as char_count
+        FROM embeddings
+        WHERE embedding_vector IS NOT NULL
+        ORDER BY similarity DESC
+        LIMIT %s;
+        """
+        
+        cur.execute(search_sql, (query_embedding, limit))
+        results = cur.fetchall()
+        
+        cur.close()
+        conn.close()
+        
+        return [dict(row) for row in results]
+
     def _tool_web_search(self, query: str, max_results: int = 5) -> Dict[str, Any]:
         """工具：網路搜索"""
         print(f"🌐 執行網路搜索: '{query}'")
         
         try:
-            # 使用 Tavily 客戶端進行搜索
-            search_result = tavily_client.search(query, max_results=max_results)
+            # 使用 Tavily 客戶端進行搜索（優先使用共用快取）
+            search_result, cache_status = tavily_client.search_with_status(query, max_results=max_results)
             
             # 提取有用的搜索結果
             if search_result and 'results' in search_result:
@@ -278,13 +355,14 @@ class LaborLawAgent:
                     }
                     results.append(result_item)
                 
-                print(f"✅ 網路搜索找到 {len(results)} 個結果")
+                print(f"✅ 網路搜索找到 {len(results)} 個結果（快取: {cache_status}）")
                 
                 return {
                     "success": True,
                     "results": results,
                     "count": len(results),
-                    "query": query
+                    "query": query,
+                    "cache_status": cache_status
                 }
             else:
                 return {"error": "網路搜索未返回有效結果"}
@@ -325,8 +403,9 @@ class LaborLawAgent:
                 function_name = tool_call.function.name
                 function_args = json.loads(tool_call.function.arguments)
                 
-                # 提交任務到執行器
-                future = executor.submit(self.execute_tool, function_name, **function_args)
+                # 提交任務到執行器（每個任務帶一份目前的 context，讓請求層級的追蹤在工具執行緒中也生效）
+                context = contextvars.copy_context()
+                future = executor.submit(context.run, self.execute_tool, function_name, **function_args)
                 futures.append((tool_call, future))
                 
                 print(f"📋 已提交工具任務: {function_name} 參數: {function_args}")
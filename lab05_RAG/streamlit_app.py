@@ -842,6 +842,33 @@ class RAGStreamlitApp:
                     輸入: {token_info.get("input", 0)} | 輸出: {token_info.get("output", 0)} | 總計: {token_info.get("total", 0)}
                 </div>
                 ''', unsafe_allow_html=True)
+            
+            # 各階段耗時
+            if details.get("timings"):
+                self.render_timings(details["timings"])
+    
+    def render_timings(self, timings: Dict[str, Any]):
+        """渲染各階段耗時（依管線順序列出，並顯示每個區段的起始時間）"""
+        total_ms = timings.get("total_ms", 0) or 0
+        st.subheader(f"⏱️ 各階段耗時（總計 {total_ms / 1000:.2f} 秒）")
+        
+        stages = timings.get("stages", {})
+        if stages:
+            st.table([
+                {
+                    "階段": name,
+                    "耗時 (ms)": f"{duration:.1f}",
+                    "佔比": f"{duration / total_ms * 100:.1f}%" if total_ms else "-"
+                }
+                for name, duration in stages.items()
+            ])
+        
+        spans = timings.get("spans", [])
+        if spans:
+            st.caption("時間軸（並行執行的工具會有重疊的區段）")
+            for span in spans:
+                ratio = min(span["duration_ms"] / total_ms, 1.0) if total_ms else 0.0
+                st.progress(ratio, text=f"{span['name']}：{span['start_ms']:.0f} ms 起，耗時 {span['duration_ms']:.1f} ms")
     
     def run(self):
         """運行應用程式"""
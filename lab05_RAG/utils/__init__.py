@@ -6,10 +6,12 @@ Contains shared utilities and configurations
 from .database_config import get_database_config
 from .ai_client import get_azure_openai_client, get_embedding_client
 from .tracking_utils import TokenAndDetailsTracker
+from .timing_utils import TimingCollector
 
 __all__ = [
     'get_database_config',
     'get_azure_openai_client', 
     'get_embedding_client',
-    'TokenAndDetailsTracker'
+    'TokenAndDetailsTracker',
+    'TimingCollector'
 ]
\ No newline at end of file
@@ -0,0 +1,179 @@
+"""
+Agent stage hooks for Lab05 RAG system
+Wraps the agent's pipeline stages once and reports every call to registered observers,
+so timings, metrics, token tracking and benchmarks share one instrumentation layer
+"""
+
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+# Agent methods wrapped as stages; tool functions use their tool name and reranker.rerank is "rerank"
+STAGE_METHODS = {
+    "rewrite_query": "rewrite",
+    "chat_with_aoai_gpt": "llm",
+    "query_aoai_embedding": "embedding",
+    "_search_database": "db_search",
+}
+
+# Observers of the current request; set per request with AgentHooks.observe()
+_request_observers: contextvars.ContextVar[Tuple[Any, ...]] = contextvars.ContextVar("agent_hook_observers", default=())
+
+
+@dataclass
+class StageEvent:
+    """One call of a pipeline stage"""
+    stage: str
+    start: float
+    end: float = 0.0
+    call_type: str = ""  # LLM calls only: "rewrite" or "agent"
+    result: Any = None
+    error: Optional[BaseException] = None
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class StageObserver:
+    """Base class for hook observers; override the callbacks you need"""
+
+    def on_stage_start(self, event: StageEvent):
+        """Called before a stage runs"""
+
+    def on_stage_end(self, event: StageEvent):
+        """Called after a stage finished (event.result or event.error is set)"""
+
+
+class AgentHooks:
+    """
+    Stage wrappers installed once per agent
+
+    Process-wide observers (e.g. Prometheus metrics) are added with add_observer(); per-request
+    observers (timings, token tracking) are scoped with observe() through a ContextVar, so
+    concurrent requests never see each other's events and nothing is patched per request.
+    Worker threads must run with a copy of the caller's context (contextvars.copy_context()).
+    """
+
+    def __init__(self, agent):
+        """
+        Initialize hooks (use install_agent_hooks() instead of calling this directly)
+
+        Args:
+            agent: LaborLawAgent instance
+        """
+        self.agent = agent
+        self._global_observers: Tuple[Any, ...] = ()
+        self._lock = threading.Lock()
+        self._in_rewrite = threading.local()
+        self._wrappers: Dict[Tuple[str, str], Callable] = {}
+
+    def install(self) -> "AgentHooks":
+        """
+        Wrap all stages; stages replaced since the last call (e.g. with stand-ins) are wrapped again
+
+        Returns:
+            AgentHooks: self
+        """
+        for method, stage in STAGE_METHODS.items():
+            if hasattr(self.agent, method):
+                setattr(self.agent, method, self._ensure_wrapped(("agent", method), stage, getattr(self.agent, method)))
+        reranker = getattr(self.agent, "reranker", None)
+        if callable(getattr(reranker, "rerank", None)):
+            reranker.rerank = self._ensure_wrapped(("reranker", "rerank"), "rerank", reranker.rerank)
+        for name, tool in getattr(self.agent, "tools", {}).items():
+            tool["function"] = self._ensure_wrapped(("tool", name), name, tool["function"])
+        return self
+
+    def add_observer(self, observer) -> Callable[[], None]:
+        """
+        Add a process-wide observer
+
+        Args:
+            observer: Object with on_stage_start / on_stage_end
+
+        Returns:
+            Callable[[], None]: Function that removes the observer
+        """
+        with self._lock:
+            self._global_observers = self._global_observers + (observer,)
+
+        def remove():
+            with self._lock:
+                self._global_observers = tuple(o for o in self._global_observers if o is not observer)
+        return remove
+
+    @contextmanager
+    def observe(self, *observers):
+        """
+        Report stages called in the current context (and contexts copied from it) to observers
+
+        Args:
+            *observers: Objects with on_stage_start / on_stage_end
+        """
+        token = _request_observers.set(_request_observers.get() + observers)
+        try:
+            yield
+        finally:
+            _request_observers.reset(token)
+
+    def _ensure_wrapped(self, key: Tuple[str, str], stage: str, current: Callable) -> Callable:
+        if self._wrappers.get(key) is current:
+            return current
+        wrapper = self._wrap(stage, current)
+        self._wrappers[key] = wrapper
+        return wrapper
+
+    def _dispatch(self, callback: str, event: StageEvent):
+        for observer in self._global_observers + _request_observers.get():
+            try:
+                getattr(observer, callback)(event)
+            except Exception as e:
+                print(f"❌ Agent hook observer error ({type(observer).__name__}.{callback}): {e}")
+
+    def _wrap(self, stage: str, func: Callable) -> Callable:
+        def wrapper(*args, **kwargs):
+            event = StageEvent(stage=stage, start=time.perf_counter())
+            if stage == "llm":
+                # The rewrite LLM call runs inside the rewrite stage on the same thread
+                event.call_type = "rewrite" if getattr(self._in_rewrite, "active", False) else "agent"
+            self._dispatch("on_stage_start", event)
+            if stage == "rewrite":
+                self._in_rewrite.active = True
+            try:
+                event.result = func(*args, **kwargs)
+                return event.result
+            except Exception as e:
+                event.error = e
+                raise
+            finally:
+                if stage == "rewrite":
+                    self._in_rewrite.active = False
+                event.end = time.perf_counter()
+                self._dispatch("on_stage_end", event)
+        return wrapper
+
+
+_install_lock = threading.Lock()
+
+
+def install_agent_hooks(agent) -> AgentHooks:
+    """
+    Get the agent's hooks, installing them on first use (idempotent)
+
+    Args:
+        agent: LaborLawAgent instance
+
+    Returns:
+        AgentHooks: Hooks of the agent
+    """
+    with _install_lock:
+        hooks = getattr(agent, "_agent_hooks", None)
+        if hooks is None:
+            hooks = AgentHooks(agent)
+            agent._agent_hooks = hooks
+        return hooks.install()
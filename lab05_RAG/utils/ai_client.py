@@ -1,12 +1,28 @@
 """
 Azure OpenAI client utilities for Lab05 RAG system
 Provides centralized Azure OpenAI client initialization and embedding services
+
+Set FAKE_AOAI_URL (e.g. http://localhost:8001, see fake_aoai_server.py) to send both
+chat and embedding requests to the local fake server instead of Azure
 """
 
 import os
 from typing import List, Optional, Tuple
 from openai import AzureOpenAI
 
+FAKE_API_KEY = "fake-key"
+FAKE_EMBEDDING_MODEL = "fake-embedding"
+
+
+def get_fake_aoai_url() -> Optional[str]:
+    """
+    Get the URL of the local fake AOAI server, if configured
+    
+    Returns:
+        Optional[str]: FAKE_AOAI_URL, or None when requests should go to Azure
+    """
+    return os.getenv("FAKE_AOAI_URL") or None
+
 
 def get_azure_openai_client() -> AzureOpenAI:
     """
@@ -18,6 +34,10 @@ def get_azure_openai_client() -> AzureOpenAI:
     api_key = os.getenv("AOAI_KEY")
     api_url = os.getenv("AOAI_URL")
     
+    fake_url = get_fake_aoai_url()
+    if fake_url:
+        api_key, api_url = api_key or FAKE_API_KEY, fake_url
+    
     if not api_key or not api_url:
         raise ValueError("Azure OpenAI API key or URL not configured")
     
@@ -38,9 +58,21 @@ def get_embedding_client() -> AzureOpenAI:
     api_key = os.getenv("EMBEDDING_API_KEY")
     api_base = os.getenv("EMBEDDING_URL")
     
+    fake_url = get_fake_aoai_url()
+    if fake_url:
+        api_key, api_base = api_key or FAKE_API_KEY, fake_url
+    
     if not api_key or not api_base:
         raise ValueError("Azure OpenAI Embedding API key or URL not configured")
     
+    if fake_url:
+        # The fake server ignores api-version, but the SDK still requires one
+        return AzureOpenAI(
+            api_key=api_key,
+            azure_endpoint=api_base,
+            api_version=os.getenv("OPENAI_API_VERSION", "2024-02-15-preview")
+        )
+    
     return AzureOpenAI(
         api_key=api_key,
         azure_endpoint=api_base,
@@ -59,6 +91,8 @@ def get_embedding_for_content(content: str, max_retries: int = 2) -> List[float]
         List[float]: Embedding vector, empty list if failed
     """
     embedding_model = os.getenv("EMBEDDING_MODEL")
+    if not embedding_model and get_fake_aoai_url():
+        embedding_model = FAKE_EMBEDDING_MODEL
     if not embedding_model:
         raise ValueError("EMBEDDING_MODEL not configured")
     
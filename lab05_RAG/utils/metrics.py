@@ -0,0 +1,375 @@
+"""
+Prometheus-style metrics for Lab05 RAG system
+Provides a small thread-safe metrics registry rendered in the Prometheus text exposition format,
+plus the application metrics and the agent instrumentation that feeds them
+"""
+
+import time
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .agent_hooks import StageEvent, StageObserver, install_agent_hooks
+
+
+# Latency buckets in seconds, covering fast local stages up to long multi-iteration LLM answers
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape_label_value(value: Any) -> str:
+    """Escape a label value for the text exposition format"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[Any], extra: Optional[Tuple[str, str]] = None) -> str:
+    """Format a label set such as {method="GET",path="/health"}"""
+    pairs = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    """Format a sample value (integers without a trailing .0)"""
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    """Base class for labelled metrics"""
+
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        """
+        Initialize metric
+
+        Args:
+            name (str): Metric name
+            documentation (str): Help text
+            labelnames (Tuple[str, ...]): Label names; values must be given for all of them
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def collect(self) -> List[str]:
+        """Render sample lines"""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """Render HELP, TYPE and sample lines"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        return "\n".join(lines + self.collect())
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        """
+        Increase the counter
+
+        Args:
+            amount (float): Non-negative amount
+            **labels: Label values
+        """
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        """Get the current value for a label set"""
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def items(self) -> List[Tuple[Dict[str, str], float]]:
+        """Get all (labels, value) pairs"""
+        with self._lock:
+            return [(dict(zip(self.labelnames, key)), value) for key, value in self._values.items()]
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be computed on every scrape"""
+
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+
+    def set(self, value: float, **labels):
+        """Set the gauge"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        """Increase the gauge"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        """Decrease the gauge"""
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        """Get the current value for a label set"""
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def set_function(self, function: Callable[[], Dict[Tuple[str, ...], float]]):
+        """
+        Compute the gauge on every scrape instead of storing values
+
+        Args:
+            function: Returns {label values tuple: value}; use () as the key for an unlabelled gauge
+        """
+        self._function = function
+
+    def collect(self) -> List[str]:
+        if self._function:
+            items = sorted(self._function().items())
+        else:
+            with self._lock:
+                items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed buckets"""
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (per-bucket counts, sum, count)
+        self._values: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, **labels):
+        """
+        Record an observation
+
+        Args:
+            value (float): Observed value (seconds for latency histograms)
+            **labels: Label values
+        """
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels):
+        """Context manager that observes the elapsed time of a block"""
+        return _HistogramTimer(self, labels)
+
+    def get_count(self, **labels) -> int:
+        """Get the number of observations for a label set"""
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(state[0]), state[1], state[2])) for key, state in self._values.items())
+        lines = []
+        for key, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class _HistogramTimer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, Any]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """Holds metrics and renders them in the Prometheus text exposition format"""
+
+    CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        """
+        Register a metric (registering the same name twice returns the existing metric)
+
+        Args:
+            metric (_Metric): Metric to register
+
+        Returns:
+            _Metric: The registered metric
+        """
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """
+        Render all metrics
+
+        Returns:
+            str: Text exposition format
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+# === Application metrics ===
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "rag_http_request_duration_seconds", "HTTP request latency by endpoint", ("method", "path", "status"))
+WEBSOCKET_QUERY_SECONDS = REGISTRY.histogram(
+    "rag_websocket_query_duration_seconds", "Latency of queries answered over the WebSocket endpoint")
+STAGE_SECONDS = REGISTRY.histogram(
+    "rag_stage_duration_seconds", "Pipeline stage latency", ("stage",))
+TOKENS_TOTAL = REGISTRY.counter(
+    "rag_llm_tokens_total", "LLM tokens by direction and call type", ("direction", "call_type"))
+CACHE_REQUESTS_TOTAL = REGISTRY.counter(
+    "rag_cache_requests_total", "Cache lookups by cache and result (hit / coalesced / miss)", ("cache", "result"))
+CACHE_HIT_RATIO = REGISTRY.gauge(
+    "rag_cache_hit_ratio", "Share of cache lookups served without a new upstream request", ("cache",))
+RERANKER_QUEUE_DEPTH = REGISTRY.gauge(
+    "rag_reranker_queue_depth", "Rerank requests waiting or running")
+RERANKER_BATCH_PAIRS = REGISTRY.histogram(
+    "rag_reranker_batch_pairs", "Pairs scored per reranker model call when micro-batching is on",
+    buckets=(1, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 256))
+WEBSOCKET_CONNECTIONS = REGISTRY.gauge(
+    "rag_websocket_connections", "Active WebSocket connections")
+ERRORS_TOTAL = REGISTRY.counter(
+    "rag_errors_total", "Errors by source and type", ("source", "type"))
+
+# Unlabelled gauges are exported as 0 before the first update
+RERANKER_QUEUE_DEPTH.set(0)
+WEBSOCKET_CONNECTIONS.set(0)
+
+# Cache results that did not need a new upstream request
+CACHE_HIT_RESULTS = ("hit", "coalesced")
+
+
+def _cache_hit_ratios() -> Dict[Tuple[str, ...], float]:
+    totals: Dict[str, float] = {}
+    hits: Dict[str, float] = {}
+    for labels, value in CACHE_REQUESTS_TOTAL.items():
+        totals[labels["cache"]] = totals.get(labels["cache"], 0.0) + value
+        if labels["result"] in CACHE_HIT_RESULTS:
+            hits[labels["cache"]] = hits.get(labels["cache"], 0.0) + value
+    return {(cache,): hits.get(cache, 0.0) / total for cache, total in totals.items() if total}
+
+
+CACHE_HIT_RATIO.set_function(_cache_hit_ratios)
+
+
+def record_error(source: str, error: Any):
+    """
+    Count an error
+
+    Args:
+        source (str): Where the error happened, e.g. "/query", "websocket", "tool:web_search"
+        error (Any): Exception instance or error type name
+    """
+    error_type = error if isinstance(error, str) else type(error).__name__
+    ERRORS_TOTAL.inc(source=source, type=error_type)
+
+
+class MetricsObserver(StageObserver):
+    """Feeds the stage, token, cache, queue and error metrics from the agent stage hooks"""
+
+    # Hook stage names that are not tools
+    CORE_STAGES = ("rewrite", "llm", "embedding", "db_search", "rerank")
+
+    def on_stage_start(self, event: StageEvent):
+        if event.stage == "rerank":
+            RERANKER_QUEUE_DEPTH.inc()
+
+    def on_stage_end(self, event: StageEvent):
+        if event.stage == "rerank":
+            RERANKER_QUEUE_DEPTH.dec()
+        STAGE_SECONDS.observe(event.duration, stage="llm_call" if event.stage == "llm" else event.stage)
+
+        if event.stage == "llm":
+            if event.error is not None:
+                record_error(f"llm:{event.call_type}", event.error)
+            elif isinstance(event.result, tuple) and len(event.result) == 3:
+                _, input_tokens, output_tokens = event.result
+                TOKENS_TOTAL.inc(input_tokens or 0, direction="input", call_type=event.call_type)
+                TOKENS_TOTAL.inc(output_tokens or 0, direction="output", call_type=event.call_type)
+        elif event.stage not in self.CORE_STAGES:
+            if event.error is not None:
+                record_error(f"tool:{event.stage}", event.error)
+            elif isinstance(event.result, dict):
+                if event.result.get("error"):
+                    record_error(f"tool:{event.stage}", "ToolError")
+                if event.result.get("cache_status"):
+                    CACHE_REQUESTS_TOTAL.inc(cache=event.stage, result=event.result["cache_status"])
+
+
+def instrument_agent_metrics(agent) -> Callable[[], None]:
+    """
+    Register the metrics observer on the agent's stage hooks, so every query (HTTP or WebSocket,
+    with or without technical details) is measured
+
+    Args:
+        agent: LaborLawAgent instance
+
+    Returns:
+        Callable[[], None]: Function that removes the observer
+    """
+    return install_agent_hooks(agent).add_observer(MetricsObserver())
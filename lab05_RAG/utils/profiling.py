@@ -0,0 +1,221 @@
+"""
+Sampling profiler utilities for Lab05 RAG system
+Samples the Python stacks of all threads from a background thread and aggregates them as collapsed stacks
+"""
+
+import os
+import sys
+import time
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+
+# Code object -> frame label; building labels dominates the cost of a sample otherwise
+_label_cache: Dict[Any, str] = {}
+
+
+def _frame_label(frame) -> str:
+    """Label a frame as function (file:first line) so that lines of one function aggregate together"""
+    code = frame.f_code
+    label = _label_cache.get(code)
+    if label is None:
+        label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        _label_cache[code] = label
+    return label
+
+
+def snapshot_stacks(exclude: Optional[set] = None) -> List[str]:
+    """
+    Take one sample of every thread
+
+    Args:
+        exclude (Optional[set]): Thread idents to skip
+
+    Returns:
+        List[str]: One "thread;root;...;leaf" stack per thread
+    """
+    names: Dict[int, str] = {thread.ident: thread.name for thread in threading.enumerate()}
+    stacks = []
+    for thread_id, frame in sys._current_frames().items():
+        if exclude and thread_id in exclude:
+            continue
+        labels = []
+        while frame is not None:
+            labels.append(_frame_label(frame))
+            frame = frame.f_back
+        labels.append(names.get(thread_id, f"thread-{thread_id}"))
+        stacks.append(";".join(reversed(labels)))
+    return stacks
+
+
+class StackSampler:
+    """
+    Wall-clock sampling profiler across all threads
+
+    Samples are taken with sys._current_frames(), so waiting on I/O (LLM and embedding calls,
+    database queries) shows up as well as CPU work.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        """
+        Initialize sampler
+
+        Args:
+            interval (float): Seconds between samples
+        """
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.sample_count = 0
+        self.duration = 0.0
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._started_at = 0.0
+
+    def start(self) -> "StackSampler":
+        """Start sampling in a daemon thread"""
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "StackSampler":
+        """Stop sampling and wait for the sampler thread"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+        self.duration = time.perf_counter() - self._started_at
+        return self
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            self.sample(exclude={own_id})
+
+    def sample(self, exclude: Optional[set] = None):
+        """
+        Take one sample of every thread
+
+        Args:
+            exclude (Optional[set]): Thread idents to skip
+        """
+        self.add_sample(snapshot_stacks(exclude))
+
+    def add_sample(self, stacks: List[str]):
+        """Add one sample taken elsewhere (see SharedStackSampler)"""
+        self.stacks.update(stacks)
+        self.sample_count += 1
+
+    def collapsed(self) -> str:
+        """
+        Get samples in collapsed stack format (one "root;...;leaf count" line per stack),
+        readable by flamegraph.pl, speedscope and inferno
+
+        Returns:
+            str: Collapsed stacks, most frequent first
+        """
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def speedscope(self, name: str = "lab05 RAG profile") -> Dict[str, Any]:
+        """
+        Get samples as a speedscope file (one sampled profile per thread), see
+        https://github.com/jlfwong/speedscope/wiki/Importing-from-custom-sources
+
+        Args:
+            name (str): Profile name shown in speedscope
+
+        Returns:
+            Dict[str, Any]: JSON-serializable speedscope document
+        """
+        frames: List[Dict[str, str]] = []
+        frame_index: Dict[str, int] = {}
+        per_thread: Dict[str, Dict[str, list]] = {}
+        for stack, count in self.stacks.most_common():
+            thread_name, *labels = stack.split(";")
+            indices = []
+            for label in labels:
+                if label not in frame_index:
+                    frame_index[label] = len(frames)
+                    frames.append({"name": label})
+                indices.append(frame_index[label])
+            profile = per_thread.setdefault(thread_name, {"samples": [], "weights": []})
+            profile["samples"].append(indices)
+            profile["weights"].append(round(count * self.interval, 6))
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "lab05_RAG utils.profiling",
+            "shared": {"frames": frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": thread_name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": round(sum(profile["weights"]), 6),
+                    "samples": profile["samples"],
+                    "weights": profile["weights"]
+                }
+                for thread_name, profile in per_thread.items()
+            ]
+        }
+
+
+class SharedStackSampler:
+    """
+    One sampling thread shared by all concurrent recordings
+
+    Each query gets its own recording, but every sample is taken once and added to all recordings
+    that are open at that moment, so the cost does not grow with the number of concurrent queries.
+    The thread only runs while at least one recording is open.
+    """
+
+    def __init__(self, interval: float = 0.05):
+        """
+        Initialize shared sampler
+
+        Args:
+            interval (float): Seconds between samples
+        """
+        self.interval = interval
+        self._recordings: List[StackSampler] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> StackSampler:
+        """
+        Open a recording
+
+        Returns:
+            StackSampler: Recording that collects samples until stop() is called with it
+        """
+        recording = StackSampler(self.interval)
+        recording._started_at = time.perf_counter()
+        with self._lock:
+            self._recordings.append(recording)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="shared-stack-sampler", daemon=True)
+                self._thread.start()
+        return recording
+
+    def stop(self, recording: StackSampler) -> StackSampler:
+        """Close a recording"""
+        with self._lock:
+            if recording in self._recordings:
+                self._recordings.remove(recording)
+        recording.duration = time.perf_counter() - recording._started_at
+        return recording
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                recordings = list(self._recordings)
+                if not recordings:
+                    self._thread = None
+                    return
+            stacks = snapshot_stacks(exclude={own_id})
+            for recording in recordings:
+                recording.add_sample(stacks)
@@ -0,0 +1,340 @@
+"""
+Slow query log for Lab05 RAG system
+Records every API query in a local SQLite database and keeps a sampling profile for slow ones
+
+Usage:
+    python -m utils.query_log summary --limit 10
+    python -m utils.query_log show 42
+    python -m utils.query_log profile 42 -o slow_42.collapsed
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .profiling import SharedStackSampler, StackSampler
+
+
+DEFAULT_LOG_PATH = Path(__file__).resolve().parent.parent / "logs" / "query_log.db"
+DEFAULT_SLOW_THRESHOLD_MS = 5000.0
+# One sample costs ~0.1ms of GIL time with a dozen threads, i.e. ~0.25% of a core at 50ms,
+# shared by all concurrent queries
+DEFAULT_PROFILE_INTERVAL_MS = 50.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS query_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    question_hash TEXT NOT NULL,
+    latency_ms REAL NOT NULL,
+    stages TEXT,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    chunk_ids TEXT,
+    cache TEXT,
+    error TEXT,
+    slow INTEGER NOT NULL DEFAULT 0,
+    profile TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_query_log_latency ON query_log (latency_ms);
+CREATE INDEX IF NOT EXISTS idx_query_log_question_hash ON query_log (question_hash);
+"""
+
+
+def question_hash(question: str) -> str:
+    """Hash a question so repeats can be grouped without storing the text"""
+    return hashlib.sha256(question.strip().encode("utf-8")).hexdigest()[:16]
+
+
+class QueryLog:
+    """
+    SQLite-backed query log with automatic profiling of slow queries
+
+    Every query is recorded by one shared low-rate stack sampler; the samples are only stored
+    when the query turns out to be slower than the threshold. Samples cover all threads, so a
+    slow query's profile also shows the queries running next to it.
+    """
+
+    def __init__(self, path: Path = DEFAULT_LOG_PATH, slow_threshold_ms: float = DEFAULT_SLOW_THRESHOLD_MS,
+                 profile_slow: bool = True, profile_interval_ms: float = DEFAULT_PROFILE_INTERVAL_MS):
+        """
+        Initialize query log
+
+        Args:
+            path (Path): SQLite database file
+            slow_threshold_ms (float): Queries at or above this latency are marked slow
+            profile_slow (bool): Store a sampling profile with slow queries
+            profile_interval_ms (float): Sampling interval of the profiler
+        """
+        self.path = Path(path)
+        self.slow_threshold_ms = slow_threshold_ms
+        self.profile_slow = profile_slow
+        self.profile_interval_ms = profile_interval_ms
+        self._sampler = SharedStackSampler(interval=profile_interval_ms / 1000)
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @classmethod
+    def from_env(cls) -> Optional["QueryLog"]:
+        """
+        Create a query log from environment variables
+
+        QUERY_LOG_ENABLED (default 1), QUERY_LOG_PATH, QUERY_LOG_SLOW_MS (default 5000),
+        QUERY_LOG_PROFILE (default 1), QUERY_LOG_PROFILE_INTERVAL_MS (default 50)
+
+        Returns:
+            Optional[QueryLog]: Query log, or None when disabled or the database cannot be opened
+        """
+        if os.getenv("QUERY_LOG_ENABLED", "1").lower() in ("0", "false", "no"):
+            return None
+        try:
+            return cls(
+                path=Path(os.getenv("QUERY_LOG_PATH", str(DEFAULT_LOG_PATH))),
+                slow_threshold_ms=float(os.getenv("QUERY_LOG_SLOW_MS", DEFAULT_SLOW_THRESHOLD_MS)),
+                profile_slow=os.getenv("QUERY_LOG_PROFILE", "1").lower() not in ("0", "false", "no"),
+                profile_interval_ms=float(os.getenv("QUERY_LOG_PROFILE_INTERVAL_MS", DEFAULT_PROFILE_INTERVAL_MS))
+            )
+        except (sqlite3.Error, OSError, ValueError) as e:
+            print(f"❌ Query log disabled: {e}")
+            return None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.path), timeout=5)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def start_profiler(self) -> Optional[StackSampler]:
+        """
+        Start a profiler for one query
+
+        Returns:
+            Optional[StackSampler]: Open recording, or None when profiling is off
+        """
+        if not self.profile_slow:
+            return None
+        return self._sampler.start()
+
+    def record(self, question: str, latency_ms: float, technical_details: Optional[Dict[str, Any]] = None,
+               profiler: Optional[StackSampler] = None, error: Optional[str] = None) -> Optional[int]:
+        """
+        Record one query (closes the profiler recording if given); blocking, call it off the event loop
+
+        Args:
+            question (str): User question (only its hash is stored)
+            latency_ms (float): End-to-end latency
+            technical_details (Optional[Dict[str, Any]]): Details from execute_query_with_tracking
+            profiler (Optional[StackSampler]): Profiler started for this query
+            error (Optional[str]): Error message if the query failed
+
+        Returns:
+            Optional[int]: Log entry id, or None if writing failed
+        """
+        if profiler:
+            self._sampler.stop(profiler)
+        details = technical_details or {}
+        token_usage = details.get("token_usage") or {}
+        stages = (details.get("timings") or {}).get("stages", {})
+        chunk_ids = [chunk.get("id") for chunk in details.get("used_chunks") or []]
+        cache = {
+            tool: metadata["cache_status"]
+            for tool, metadata in (details.get("search_metadata") or {}).items()
+            if isinstance(metadata, dict) and metadata.get("cache_status")
+        }
+        slow = latency_ms >= self.slow_threshold_ms
+        profile = profiler.collapsed() if slow and profiler and profiler.sample_count else None
+
+        try:
+            with self._lock, self._connect() as conn:
+                cursor = conn.execute(
+                    """INSERT INTO query_log (created_at, question_hash, latency_ms, stages, input_tokens,
+                                              output_tokens, chunk_ids, cache, error, slow, profile)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    (datetime.now().isoformat(timespec="seconds"), question_hash(question), round(latency_ms, 2),
+                     json.dumps(stages), token_usage.get("input"), token_usage.get("output"),
+                     json.dumps(chunk_ids), json.dumps(cache), error, int(slow), profile)
+                )
+                return cursor.lastrowid
+        except sqlite3.Error as e:
+            print(f"❌ Query log write error: {e}")
+            return None
+
+    def worst(self, limit: int = 10, since: Optional[str] = None, slow_only: bool = False) -> List[Dict[str, Any]]:
+        """
+        Get the slowest queries
+
+        Args:
+            limit (int): Number of entries
+            since (Optional[str]): Only entries created at or after this ISO timestamp
+            slow_only (bool): Only entries above the slow threshold
+
+        Returns:
+            List[Dict[str, Any]]: Entries ordered by latency, without the profile text
+        """
+        conditions, params = [], []
+        if since:
+            conditions.append("created_at >= ?")
+            params.append(since)
+        if slow_only:
+            conditions.append("slow = 1")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"""SELECT id, created_at, question_hash, latency_ms, stages, input_tokens, output_tokens,
+                           chunk_ids, cache, error, slow, profile IS NOT NULL AS has_profile
+                    FROM query_log {where} ORDER BY latency_ms DESC LIMIT ?""",
+                params + [limit]
+            ).fetchall()
+        return [self._row_to_dict(row) for row in rows]
+
+    def get(self, entry_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get one entry including its profile
+
+        Args:
+            entry_id (int): Log entry id
+
+        Returns:
+            Optional[Dict[str, Any]]: Entry, or None if not found
+        """
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM query_log WHERE id = ?", (entry_id,)).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def summary(self, since: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get overall counts and the average share of each stage in slow queries
+
+        Args:
+            since (Optional[str]): Only entries created at or after this ISO timestamp
+
+        Returns:
+            Dict[str, Any]: total, slow, errors, p50_ms, p95_ms and slow_stage_ms (average per stage)
+        """
+        where, params = ("WHERE created_at >= ?", [since]) if since else ("", [])
+        with self._connect() as conn:
+            rows = conn.execute(f"SELECT latency_ms, stages, slow, error FROM query_log {where}", params).fetchall()
+        latencies = sorted(row["latency_ms"] for row in rows)
+        slow_rows = [row for row in rows if row["slow"]]
+        stage_totals: Dict[str, float] = {}
+        for row in slow_rows:
+            for stage, duration in json.loads(row["stages"] or "{}").items():
+                stage_totals[stage] = stage_totals.get(stage, 0.0) + duration
+        return {
+            "total": len(rows),
+            "slow": len(slow_rows),
+            "errors": sum(1 for row in rows if row["error"]),
+            "p50_ms": _percentile(latencies, 50),
+            "p95_ms": _percentile(latencies, 95),
+            "slow_stage_ms": {
+                stage: round(total / len(slow_rows), 2)
+                for stage, total in sorted(stage_totals.items(), key=lambda item: -item[1])
+            }
+        }
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        entry = dict(row)
+        for key in ("stages", "chunk_ids", "cache"):
+            if entry.get(key):
+                entry[key] = json.loads(entry[key])
+        entry["slow"] = bool(entry["slow"])
+        return entry
+
+
+def _percentile(sorted_values: List[float], percent: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _slowest_stage(stages: Dict[str, float]) -> str:
+    if not stages:
+        return "-"
+    stage, duration = max(stages.items(), key=lambda item: item[1])
+    return f"{stage} {duration:.0f}ms"
+
+
+def print_summary(log: QueryLog, limit: int, since: Optional[str], slow_only: bool):
+    """Print overall statistics and the worst offenders"""
+    summary = log.summary(since)
+    if not summary["total"]:
+        print("No queries logged yet")
+        return
+    print(f"Queries: {summary['total']}  slow (>= {log.slow_threshold_ms:.0f}ms): {summary['slow']}  "
+          f"errors: {summary['errors']}  p50: {summary['p50_ms']:.0f}ms  p95: {summary['p95_ms']:.0f}ms")
+    if summary["slow_stage_ms"]:
+        print("Average stage time in slow queries:")
+        for stage, duration in summary["slow_stage_ms"].items():
+            print(f"  {stage:<20} {duration:>10.1f}ms")
+
+    print(f"\nWorst {limit} queries:")
+    print(f"{'id':>6}  {'created_at':<19}  {'latency':>9}  {'question':<16}  {'tokens':>11}  "
+          f"{'slowest stage':<28}  {'cache':<10}  profile")
+    for entry in log.worst(limit, since, slow_only):
+        tokens = f"{entry['input_tokens'] or 0}/{entry['output_tokens'] or 0}"
+        cache = ",".join(f"{status}" for status in (entry["cache"] or {}).values()) or "-"
+        flags = "yes" if entry["has_profile"] else "-"
+        if entry["error"]:
+            flags += " (error)"
+        print(f"{entry['id']:>6}  {entry['created_at']:<19}  {entry['latency_ms']:>7.0f}ms  {entry['question_hash']:<16}  "
+              f"{tokens:>11}  {_slowest_stage(entry['stages'] or {}):<28}  {cache:<10}  {flags}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize the API server query log")
+    parser.add_argument("--db", type=Path, default=Path(os.getenv("QUERY_LOG_PATH", str(DEFAULT_LOG_PATH))),
+                        help="Query log database")
+    subparsers = parser.add_subparsers(dest="command")
+
+    summary_parser = subparsers.add_parser("summary", help="Overall statistics and the slowest queries")
+    summary_parser.add_argument("--limit", type=int, default=10, help="Number of queries to list")
+    summary_parser.add_argument("--since", help="Only queries at or after this ISO timestamp, e.g. 2026-10-01")
+    summary_parser.add_argument("--slow-only", action="store_true", help="Only queries above the slow threshold")
+
+    show_parser = subparsers.add_parser("show", help="Show one log entry")
+    show_parser.add_argument("id", type=int)
+
+    profile_parser = subparsers.add_parser("profile", help="Export the profile of a slow query (collapsed stacks)")
+    profile_parser.add_argument("id", type=int)
+    profile_parser.add_argument("-o", "--output", type=Path, help="Output file (default: stdout)")
+
+    args = parser.parse_args()
+    if not args.db.exists():
+        print(f"❌ Query log not found: {args.db}")
+        return
+
+    log = QueryLog(args.db, slow_threshold_ms=float(os.getenv("QUERY_LOG_SLOW_MS", DEFAULT_SLOW_THRESHOLD_MS)))
+    if args.command in (None, "summary"):
+        print_summary(log, getattr(args, "limit", 10), getattr(args, "since", None), getattr(args, "slow_only", False))
+        return
+
+    entry = log.get(args.id)
+    if not entry:
+        print(f"❌ Log entry not found: {args.id}")
+        return
+    if args.command == "show":
+        profile = entry.pop("profile")
+        print(json.dumps(entry, ensure_ascii=False, indent=2))
+        if profile:
+            print(f"\nProfile: {len(profile.splitlines())} stacks "
+                  f"(export with: python -m utils.query_log profile {args.id} -o slow_{args.id}.collapsed)")
+    elif not entry["profile"]:
+        print(f"❌ No profile stored for entry {args.id}")
+    elif args.output:
+        args.output.write_text(entry["profile"], encoding="utf-8")
+        print(f"✅ Profile written to {args.output} (open with https://www.speedscope.app or flamegraph.pl)")
+    else:
+        print(entry["profile"], end="")
+
+
+if __name__ == "__main__":
+    main()
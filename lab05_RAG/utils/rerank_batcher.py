@@ -0,0 +1,134 @@
+"""
+Reranker micro-batching for Lab05 RAG system
+Collects (query, document) pairs from concurrent rerank calls and scores them with one CrossEncoder.predict
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, List, Optional, Sequence
+
+from .metrics import RERANKER_BATCH_PAIRS
+
+
+class RerankBatcherClosed(RuntimeError):
+    """Raised for requests made to (or left queued in) a closed batcher"""
+
+
+class RerankBatcher:
+    """
+    In-process micro-batching service for a CrossEncoder-style model
+
+    Callers block in predict() while a single worker thread gathers pending requests for up to
+    max_wait_ms (or until max_batch_pairs pairs are waiting), runs one model.predict over all of
+    them and hands each caller its own slice of the scores. Requests that arrive while the model
+    is busy are always merged into the next batch, so max_wait_ms=0 batches under load without
+    adding latency when the service is idle. If a merged model call fails, each caller's pairs
+    are retried on their own so one bad request cannot fail unrelated concurrent requests.
+    """
+
+    def __init__(self, model, max_wait_ms: float = 5.0, max_batch_pairs: int = 64, batch_size: int = 32):
+        """
+        Initialize batcher and start its worker thread
+
+        Args:
+            model: Object with predict(pairs, batch_size=...) returning one score per pair
+            max_wait_ms (float): How long the first request of a batch waits for others
+            max_batch_pairs (int): Flush as soon as this many pairs are waiting
+            batch_size (int): batch_size passed to model.predict
+        """
+        self.model = model
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_pairs = max_batch_pairs
+        self.batch_size = batch_size
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()  # Makes the closed check and the enqueue atomic with close()
+        self._worker = threading.Thread(target=self._run, name="rerank-batcher", daemon=True)
+        self._worker.start()
+
+    def predict(self, pairs: Sequence[Sequence[str]], timeout: Optional[float] = None) -> List[float]:
+        """
+        Score pairs, sharing the model call with concurrent callers
+
+        Args:
+            pairs (Sequence[Sequence[str]]): [query, document] pairs
+            timeout (Optional[float]): Seconds to wait for the scores
+
+        Returns:
+            List[float]: One score per pair, in input order
+        """
+        if not pairs:
+            return []
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RerankBatcherClosed("RerankBatcher is closed")
+            self._queue.put((list(pairs), future))
+        return future.result(timeout)
+
+    def close(self):
+        """Stop the worker after pending requests are served; anything still queued afterwards is failed"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._worker.join()
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[1].set_exception(RerankBatcherClosed("RerankBatcher is closed"))
+
+    def _collect(self, first: tuple) -> List[tuple]:
+        """Gather requests arriving within max_wait of the first one"""
+        batch = [first]
+        pair_count = len(first[0])
+        deadline = time.perf_counter() + self.max_wait
+        while pair_count < self.max_batch_pairs:
+            remaining = deadline - time.perf_counter()
+            try:
+                # Requests already queued (e.g. arrived during the previous predict) join without waiting
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Re-queue the close marker so the run loop stops after this batch
+                self._queue.put(None)
+                break
+            batch.append(item)
+            pair_count += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = self._collect(first)
+            pairs: List[Any] = [pair for request_pairs, _ in batch for pair in request_pairs]
+            RERANKER_BATCH_PAIRS.observe(len(pairs))
+            try:
+                scores = list(self.model.predict(pairs, batch_size=self.batch_size))
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(e)
+                else:
+                    self._predict_each(batch)
+                continue
+            offset = 0
+            for request_pairs, future in batch:
+                future.set_result(scores[offset:offset + len(request_pairs)])
+                offset += len(request_pairs)
+
+    def _predict_each(self, batch: List[tuple]):
+        """Score each request of a failed merged batch separately so failures stay with their caller"""
+        for request_pairs, future in batch:
+            try:
+                future.set_result(list(self.model.predict(request_pairs, batch_size=self.batch_size)))
+            except Exception as e:
+                future.set_exception(e)
@@ -0,0 +1,128 @@
+"""
+Per-request timing utilities for Lab05 RAG system
+Collects span-level timings for each pipeline stage of a single query
+"""
+
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List
+
+from .agent_hooks import StageEvent, StageObserver
+
+
+# Display order of pipeline stages; LLM iterations are appended by number
+STAGE_ORDER = ["rewrite", "llm_iteration", "vector_search", "embedding", "db_search", "rerank", "web_search", "serialization"]
+
+
+class TimingCollector(StageObserver):
+    """
+    Collects timing spans for one request (thread-safe: tools run in parallel threads)
+
+    Register it for a request with install_agent_hooks(agent).observe(collector).
+    """
+
+    def __init__(self):
+        """Start the request clock"""
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self.spans: List[Dict[str, Any]] = []
+
+    def add_span(self, name: str, start: float, end: float):
+        """
+        Record a finished span
+
+        Args:
+            name (str): Stage name
+            start (float): time.perf_counter() at span start
+            end (float): time.perf_counter() at span end
+        """
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "start_ms": round((start - self._origin) * 1000, 2),
+                "duration_ms": round((end - start) * 1000, 2),
+                "thread": threading.current_thread().name
+            })
+
+    @contextmanager
+    def span(self, name: str):
+        """
+        Time a block of code as a span
+
+        Args:
+            name (str): Stage name
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, time.perf_counter())
+
+    def timed(self, name: str, func: Callable) -> Callable:
+        """
+        Wrap a function so that every call is recorded as a span
+
+        Args:
+            name (str): Stage name
+            func (Callable): Function to wrap
+
+        Returns:
+            Callable: Wrapped function
+        """
+        def wrapper(*args, **kwargs):
+            with self.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def on_stage_end(self, event: StageEvent):
+        """Record a hooked agent stage; the rewrite LLM call is already covered by the rewrite span"""
+        if event.stage == "llm":
+            if event.call_type == "rewrite":
+                return
+            self.add_span(self.next_name("llm_iteration"), event.start, event.end)
+        else:
+            self.add_span(event.stage, event.start, event.end)
+
+    def next_name(self, prefix: str) -> str:
+        """
+        Get a numbered span name such as llm_iteration_1, llm_iteration_2
+
+        Args:
+            prefix (str): Name prefix
+
+        Returns:
+            str: Numbered name
+        """
+        with self._lock:
+            self._counters[prefix] = self._counters.get(prefix, 0) + 1
+            return f"{prefix}_{self._counters[prefix]}"
+
+    def get_timings(self) -> Dict[str, Any]:
+        """
+        Get the timing summary of the request so far
+
+        Returns:
+            Dict[str, Any]: total_ms, per-stage totals (stages) and individual spans ordered by start time
+        """
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["start_ms"])
+        stages: Dict[str, float] = {}
+        for span in spans:
+            stages[span["name"]] = round(stages.get(span["name"], 0.0) + span["duration_ms"], 2)
+        return {
+            "total_ms": round((time.perf_counter() - self._origin) * 1000, 2),
+            "stages": dict(sorted(stages.items(), key=lambda item: _stage_sort_key(item[0]))),
+            "spans": spans
+        }
+
+
+def _stage_sort_key(name: str):
+    """Sort stages in pipeline order; numbered stages by their number"""
+    prefix, _, number = name.rpartition("_")
+    if number.isdigit() and prefix in STAGE_ORDER:
+        return STAGE_ORDER.index(prefix), int(number)
+    if name in STAGE_ORDER:
+        return STAGE_ORDER.index(name), 0
+    return len(STAGE_ORDER), 0
@@ -4,10 +4,11 @@ Provides centralized tracking for token usage and technical details
 """
 
 from typing import Dict, List, Any, Optional, Tuple
-from .ai_client import chat_with_azure_openai
+from .agent_hooks import StageEvent, StageObserver, install_agent_hooks
+from .timing_utils import TimingCollector
 
 
-class TokenAndDetailsTracker:
+class TokenAndDetailsTracker(StageObserver):
     """
     Unified tracker for token usage and technical details across different components
     """
@@ -39,6 +40,21 @@ class TokenAndDetailsTracker:
         self.total_input_tokens += input_tokens
         self.total_output_tokens += output_tokens
     
+    def on_stage_end(self, event: StageEvent):
+        """
+        Track a hooked agent stage: LLM token usage and tool results
+        
+        Args:
+            event (StageEvent): Finished stage
+        """
+        if event.error is not None:
+            return
+        if event.stage == "llm" and isinstance(event.result, tuple) and len(event.result) == 3:
+            _, input_tokens, output_tokens = event.result
+            self.track_tokens(input_tokens, output_tokens)
+        elif event.stage in getattr(self.agent, "tools", {}) and isinstance(event.result, dict):
+            self.track_tool_result(event.stage, event.result)
+    
     def track_tool_result(self, tool_name: str, tool_result: Dict[str, Any]):
         """
         Track tool execution results
@@ -51,7 +67,8 @@ class TokenAndDetailsTracker:
             self.web_search_results = tool_result.get("results", [])
             self.search_metadata["web_search"] = {
                 "count": tool_result.get("count", 0),
-                "query": tool_result.get("query", "")
+                "query": tool_result.get("query", ""),
+                "cache_status": tool_result.get("cache_status", "")
             }
         elif tool_name == "vector_search" and tool_result.get("success"):
             self._track_vector_search(tool_result)
@@ -167,83 +184,33 @@ class TokenAndDetailsTracker:
         return details
 
 
-def create_tracking_wrapper(agent, tracker: TokenAndDetailsTracker) -> Tuple[callable, callable]:
-    """
-    Create wrapped methods for tracking token usage and tool execution
-    
-    Args:
-        agent: The agent instance to wrap
-        tracker: The tracker instance
-        
-    Returns:
-        Tuple[callable, callable]: (wrapped_chat_method, wrapped_execute_tool)
-    """
-    # Store original methods
-    original_chat_method = getattr(agent, 'chat_with_aoai_gpt', None)
-    original_execute_tool = getattr(agent, 'execute_tool', None)
-    
-    def wrapped_chat_method(*args, **kwargs):
-        """Wrapped chat method with token tracking"""
-        if original_chat_method:
-            result = original_chat_method(*args, **kwargs)
-            if len(result) == 3:  # (message, input_tokens, output_tokens)
-                message, input_tokens, output_tokens = result
-                tracker.track_tokens(input_tokens, output_tokens)
-            return result
-        else:
-            # Fallback to direct Azure OpenAI call
-            return chat_with_azure_openai(*args, **kwargs)
-    
-    def wrapped_execute_tool(tool_name: str, **kwargs):
-        """Wrapped execute tool method with result tracking"""
-        if original_execute_tool:
-            result = original_execute_tool(tool_name, **kwargs)
-            tracker.track_tool_result(tool_name, result)
-            return result
-        else:
-            raise AttributeError("execute_tool method not found on agent")
-    
-    return wrapped_chat_method, wrapped_execute_tool
-
-
-def execute_query_with_tracking(agent, query: str, conversation_history: Optional[List[Dict[str, str]]] = None) -> Tuple[str, Dict[str, Any]]:
+def execute_query_with_tracking(agent, query: str, conversation_history: Optional[List[Dict[str, str]]] = None,
+                                timings: Optional[TimingCollector] = None) -> Tuple[str, Dict[str, Any]]:
     """
     Execute a query with comprehensive tracking
     
+    The tracker and timing collector observe this call only (through the agent's shared stage hooks),
+    so concurrent queries on the same agent are tracked independently.
+    
     Args:
         agent: The agent instance
         query: The query string
         conversation_history: Optional conversation history
+        timings: Optional timing collector; pass one to keep recording spans (e.g. serialization) after the query
         
     Returns:
         Tuple[str, Dict[str, Any]]: (response, technical_details)
     """
     # Create tracker
     tracker = TokenAndDetailsTracker(agent)
+    timings = timings or TimingCollector()
     
-    # Create wrapped methods
-    wrapped_chat_method, wrapped_execute_tool = create_tracking_wrapper(agent, tracker)
-    
-    # Store original methods
-    original_chat_method = getattr(agent, 'chat_with_aoai_gpt', None)
-    original_execute_tool = getattr(agent, 'execute_tool', None)
-    
-    # Temporarily replace methods
-    agent.chat_with_aoai_gpt = wrapped_chat_method
-    agent.execute_tool = wrapped_execute_tool
-    
-    try:
+    with install_agent_hooks(agent).observe(tracker, timings):
         # Execute query
         response = agent.generate_agent_response(query, conversation_history)
-        
-        # Get technical details
-        technical_details = tracker.get_technical_details()
-        
-        return response, technical_details
-        
-    finally:
-        # Restore original methods
-        if original_chat_method:
-            agent.chat_with_aoai_gpt = original_chat_method
-        if original_execute_tool:
-            agent.execute_tool = original_execute_tool
\ No newline at end of file
+    
+    # Get technical details
+    technical_details = tracker.get_technical_details()
+    technical_details["timings"] = timings.get_timings()
+    
+    return response, technical_details
@@ -0,0 +1,15 @@
+"""
+Shared utilities used across the labs
+Contains the on-disk Tavily search cache and the shared AOAI chat function with record/replay cache
+"""
+
+from .search_cache import SearchCache, CachedTavilyClient
+from .aoai_client import ResponseCache, chat_with_aoai_gpt, get_aoai_client
+
+__all__ = [
+    'SearchCache',
+    'CachedTavilyClient',
+    'ResponseCache',
+    'chat_with_aoai_gpt',
+    'get_aoai_client'
+]
@@ -0,0 +1,181 @@
+"""
+共用的 AOAI 對話函數與回應快取 (AOAI Client)
+
+每個 lab 原本都各自實作一份 chat_with_aoai_gpt，每次呼叫都重新建立客戶端，也沒有任何快取，
+重複執行同一個腳本時每個請求都要再等一次模型回應。這個模組把它整合成一份：
+
+1. 客戶端只建立一次，所有呼叫共用同一個連線池
+2. 以 (模型, 訊息, 溫度, 回應格式) 計算快取鍵
+3. 回應可以錄製到本地的 JSONL 檔，之後以重播模式離線、零延遲地取得完全相同的結果
+
+快取模式由環境變數 AOAI_CACHE_MODE 控制：
+- off（預設）：直接呼叫 API，不讀也不寫快取，正式環境使用
+- record：一律呼叫 API，並把回應寫入快取檔（覆蓋相同快取鍵的舊回應）
+- replay：只從快取檔讀取，不呼叫 API；沒有錄製過的請求視為錯誤
+- auto：有快取就重播，沒有才呼叫 API 並寫入快取
+
+快取檔預設為專案根目錄下的 .cache/aoai_responses.jsonl，可用環境變數 AOAI_CACHE_PATH 指定。
+"""
+
+import os
+import json
+import hashlib
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parent.parent / ".cache" / "aoai_responses.jsonl"
+CACHE_MODES = ("off", "record", "replay", "auto")
+DEFAULT_TEMPERATURE = 0.7
+
+
+@lru_cache(maxsize=None)
+def _create_client(api_key: str | None, endpoint: str | None):
+    from openai import AzureOpenAI
+
+    return AzureOpenAI(api_key=api_key, azure_endpoint=endpoint)
+
+
+def get_aoai_client():
+    """取得共用的 AzureOpenAI 客戶端（相同的金鑰與端點只會建立一次）"""
+    return _create_client(os.getenv("AOAI_KEY"), os.getenv("AOAI_URL"))
+
+
+def get_cache_mode() -> str:
+    """讀取環境變數 AOAI_CACHE_MODE，無法辨識的值視為 off"""
+    mode = os.getenv("AOAI_CACHE_MODE", "off").strip().lower()
+    if mode not in CACHE_MODES:
+        print(f"未知的 AOAI_CACHE_MODE：{mode}，改用 off")
+        return "off"
+    return mode
+
+
+def make_cache_key(model: str | None, messages: list[dict], temperature: float,
+                   response_format: dict | None) -> str:
+    """以模型、訊息、溫度與回應格式計算快取鍵"""
+    payload = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, "response_format": response_format},
+        ensure_ascii=False, sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """以 JSONL 檔保存的回應快取，每行一筆錄製結果，相同快取鍵以最後一筆為準"""
+
+    def __init__(self, cache_path: str | Path | None = None):
+        """初始化快取
+
+        Args:
+            cache_path (str | Path | None): 快取檔路徑，未指定時使用 AOAI_CACHE_PATH 或專案根目錄的 .cache/
+        """
+        self.cache_path = Path(cache_path or os.getenv("AOAI_CACHE_PATH") or DEFAULT_CACHE_PATH)
+        self._records: dict[str, dict] | None = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict[str, dict]:
+        """第一次使用時才讀取快取檔（呼叫端需持有鎖）"""
+        if self._records is None:
+            self._records = {}
+            if self.cache_path.exists():
+                with open(self.cache_path, "r", encoding="utf-8") as file:
+                    for line in file:
+                        try:
+                            record = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue  # 寫入中斷時可能留下不完整的最後一行
+                        self._records[record["key"]] = record
+        return self._records
+
+    def get(self, key: str) -> dict | None:
+        """讀取錄製過的回應"""
+        with self._lock:
+            return self._load().get(key)
+
+    def put(self, key: str, record: dict) -> None:
+        """寫入一筆回應（附加到快取檔末端）"""
+        record = {"key": key, **record}
+        with self._lock:
+            self._load()[key] = record
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.cache_path, "a", encoding="utf-8") as file:
+                file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._load())
+
+
+_default_cache: ResponseCache | None = None
+_default_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """取得預設的共用回應快取"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResponseCache()
+        return _default_cache
+
+
+def chat_with_aoai_gpt(
+    messages: list[dict],
+    user_json_format: bool = False,
+    temperature: float = DEFAULT_TEMPERATURE,
+    response_format: dict | None = None,
+) -> tuple[str, int, int]:
+    """呼叫AOAI服務取得回應（依 AOAI_CACHE_MODE 錄製或重播）
+
+    Args:
+        messages (list[dict]): 包含對話歷史的訊息列表
+        user_json_format (bool): 是否要求 JSON 格式回應
+        temperature (float): 模型溫度
+        response_format (dict | None): 自訂回應格式，指定時優先於 user_json_format
+
+    Returns:
+        tuple[str, int, int]: (AI回應, 提示詞token數, 回應token數)，發生錯誤時為 ("", 0, 0)
+    """
+    model = os.getenv("AOAI_MODEL_VERSION")
+    if response_format is None and user_json_format:
+        response_format = {"type": "json_object"}
+
+    mode = get_cache_mode()
+    cache = get_response_cache() if mode != "off" else None
+    key = make_cache_key(model, messages, temperature, response_format) if cache is not None else None
+
+    if mode in ("replay", "auto"):
+        record = cache.get(key)
+        if record is not None:
+            return record["content"], record["prompt_tokens"], record["completion_tokens"]
+        if mode == "replay":
+            print(f"錯誤：replay 模式下找不到錄製的回應（快取鍵 {key[:12]}），請先以 record 模式執行")
+            return "", 0, 0
+
+    try:
+        response = get_aoai_client().chat.completions.create(
+            model=model,
+            messages=messages,          # 設置聊天訊息，包含系統角色和使用者輸入
+            temperature=temperature,    # 設置溫度
+            response_format=response_format,  # 設置回應格式
+        )
+        result = (
+            response.choices[0].message.content,
+            response.usage.prompt_tokens,
+            response.usage.total_tokens - response.usage.prompt_tokens,
+        )
+    except Exception as e:  # 如果發生錯誤，則回傳空字串、0、0（錯誤不寫入快取）
+        print(f"錯誤：{str(e)}")
+        return "", 0, 0
+
+    if cache is not None:
+        cache.put(key, {
+            "model": model,
+            "temperature": temperature,
+            "response_format": response_format,
+            "messages": messages,
+            "content": result[0],
+            "prompt_tokens": result[1],
+            "completion_tokens": result[2],
+        })
+    return result
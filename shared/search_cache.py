@@ -0,0 +1,218 @@
+"""
+共用的 Tavily 搜尋快取 (Search Cache)
+
+lab02 的 web_search.py 與 lab05 的 LaborLawAgent 每次搜尋都會直接呼叫 Tavily，
+幾分鐘內重複的相同查詢也要再付出一次完整的外部請求時間。這個模組提供一層共用快取：
+
+1. 以「正規化後的查詢 + max_results（及其他搜尋參數）」作為快取鍵
+2. 結果保存在 SQLite 檔案中，多個 lab、多個行程都能共用同一份快取
+3. 以 TTL 判斷資料是否仍然新鮮，過期的資料會重新搜尋
+4. 以筆數與總大小設定上限，超過時依最近存取時間（LRU）淘汰
+5. 同一時間多個相同的查詢只會發出一次請求，其餘呼叫等待並共用同一份結果
+
+快取目錄預設為專案根目錄下的 .cache/，可用環境變數 TAVILY_CACHE_DIR 指定。
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Any, Callable
+
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parent.parent / ".cache"
+DEFAULT_TTL = 60 * 60            # 搜尋結果的有效秒數
+DEFAULT_MAX_ENTRIES = 2000       # 最多保存的搜尋結果筆數
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024  # 快取內容的總大小上限
+
+
+def normalize_query(query: str) -> str:
+    """正規化查詢字串（忽略大小寫與多餘空白），讓寫法略有不同的相同查詢共用快取"""
+    return " ".join(query.lower().split())
+
+
+class SearchCache:
+    """以 SQLite 保存的搜尋結果快取，支援 TTL、LRU 淘汰與請求合併"""
+
+    def __init__(
+        self,
+        cache_path: str | Path | None = None,
+        ttl: float = DEFAULT_TTL,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        """初始化快取
+
+        Args:
+            cache_path (str | Path | None): SQLite 檔案路徑，未指定時使用 TAVILY_CACHE_DIR 或專案根目錄的 .cache/
+            ttl (float): 搜尋結果的有效秒數
+            max_entries (int): 最多保存的筆數
+            max_bytes (int): 快取內容的總大小上限（位元組）
+        """
+        if cache_path is None:
+            cache_dir = Path(os.getenv("TAVILY_CACHE_DIR") or DEFAULT_CACHE_DIR)
+            cache_path = cache_dir / "tavily_search.sqlite"
+        self.cache_path = Path(cache_path)
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        # 同一個連線會被多個執行緒共用，以鎖保護；WAL 模式讓多個行程可以同時讀寫
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(self.cache_path, check_same_thread=False, timeout=10)
+        with self._db_lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS search_cache (
+                    key TEXT PRIMARY KEY,
+                    query TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_search_cache_accessed ON search_cache (accessed_at)")
+
+        # 進行中的請求：快取鍵 → Future，用來合併同時發出的相同查詢
+        self._inflight: dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(query: str, max_results: int, **params: Any) -> str:
+        """以正規化查詢與搜尋參數計算快取鍵"""
+        payload = json.dumps([normalize_query(query), max_results, sorted(params.items())],
+                             ensure_ascii=False, default=str)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        """讀取仍在有效期限內的快取結果，並更新存取時間"""
+        now = time.time()
+        with self._db_lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value FROM search_cache WHERE key = ? AND created_at > ?", (key, now - self.ttl)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE search_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key: str, query: str, value: dict) -> None:
+        """寫入快取，並在超過上限時淘汰最久未使用的資料"""
+        data = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._db_lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_cache (key, query, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, query, data, len(data.encode("utf-8")), now, now),
+            )
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        """刪除過期資料，再依最近存取時間淘汰到筆數與大小都在上限內（呼叫端需持有鎖）"""
+        self._conn.execute("DELETE FROM search_cache WHERE created_at <= ?", (now - self.ttl,))
+        count, total_bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM search_cache"
+        ).fetchone()
+        if count <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+
+        evicted = []
+        for key, size in self._conn.execute("SELECT key, size FROM search_cache ORDER BY accessed_at"):
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            evicted.append((key,))
+            count -= 1
+            total_bytes -= size
+        self._conn.executemany("DELETE FROM search_cache WHERE key = ?", evicted)
+
+    def get_or_fetch(self, query: str, max_results: int, fetch_fn: Callable[[], dict],
+                     **params: Any) -> tuple[dict, str]:
+        """讀取快取，沒有命中時呼叫 fetch_fn 取得結果並寫入快取
+
+        同一時間有相同查詢正在進行時，不會重複發出請求，而是等待並共用那一次的結果。
+
+        Args:
+            query (str): 搜尋查詢
+            max_results (int): 搜尋結果數量
+            fetch_fn (Callable[[], dict]): 實際執行搜尋的函數
+            **params: 其他會影響搜尋結果的參數（納入快取鍵）
+
+        Returns:
+            tuple[dict, str]: (搜尋結果, 快取狀態 "hit" / "coalesced" / "miss")
+        """
+        key = self.make_key(query, max_results, **params)
+
+        with self._inflight_lock:
+            cached = self.get(key)
+            if cached is not None:
+                return cached, "hit"
+            future = self._inflight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if not is_leader:
+            return future.result(), "coalesced"
+
+        try:
+            value = fetch_fn()
+            self.set(key, query, value)
+            future.set_result(value)
+            return value, "miss"
+        except Exception as e:
+            # 等待中的呼叫也會收到同一個例外；失敗的結果不寫入快取
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        """清除所有快取資料"""
+        with self._db_lock, self._conn:
+            self._conn.execute("DELETE FROM search_cache")
+
+
+class CachedTavilyClient:
+    """加上共用快取的 Tavily 客戶端，介面與 TavilyClient.search 相同"""
+
+    def __init__(self, api_key: str | None = None, cache: SearchCache | None = None):
+        """初始化客戶端
+
+        Args:
+            api_key (str | None): Tavily API 金鑰，未指定時使用環境變數 TAVILY_API_KEY
+            cache (SearchCache | None): 使用的快取，未指定時使用預設的共用快取
+        """
+        from tavily import TavilyClient
+
+        self.client = TavilyClient(api_key=api_key or os.getenv("TAVILY_API_KEY"))
+        self.cache = cache or SearchCache()
+
+    def search(self, query: str, max_results: int = 5, **params: Any) -> dict:
+        """執行（或從快取讀取）Tavily 搜尋
+
+        Args:
+            query (str): 搜尋查詢
+            max_results (int): 搜尋結果數量
+            **params: 傳給 TavilyClient.search 的其他參數
+
+        Returns:
+            dict: Tavily 搜尋結果
+        """
+        return self.search_with_status(query, max_results=max_results, **params)[0]
+
+    def search_with_status(self, query: str, max_results: int = 5, **params: Any) -> tuple[dict, str]:
+        """與 search 相同，另外回傳快取狀態 "hit" / "coalesced" / "miss" """
+        return self.cache.get_or_fetch(
+            query,
+            max_results,
+            lambda: self.client.search(query, max_results=max_results, **params),
+            **params,
+        )